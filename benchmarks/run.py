@@ -0,0 +1,411 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+"""pRESTo benchmarks
+
+Times the configuration and signing code paths on synthetic
+configurations with 10 to 100000 tokens and measures the memory they
+allocate. Results are compared with a stored baseline and the run fails if
+a case got slower or bigger than the baseline times the threshold.
+
+Times are compared relative to a fixed calibration loop timed in the same
+run, so a baseline made on one machine can be checked on another. Memory
+is peak RSS, which can't see allocations smaller than a few hundred KB;
+such results are not stored and not checked. Save a new baseline after a
+deliberate change (see --save).
+
+Usage: run.py [options]
+       run.py --memory-of=<case> <tokens> <directory>
+
+Options:
+
+  --sizes=<list>  Comma-separated numbers of tokens in the synthetic
+            configurations [default: 10,100,1000,10000,100000].
+  --cases=<list>  Comma-separated cases to run (default: all).
+  --baseline=<file>  Baseline file, relative to the benchmarks directory
+            [default: baseline.json].
+  --threshold=<ratio>  Max ratio of a result to its baseline
+            [default: 1.5].
+  --min-time=<seconds>  Min time of one timing round [default: 0.2].
+  --save  Save the results as the new baseline instead of comparing.
+  --no-memory  Do not measure memory.
+  --memory-of=<case>  Print the memory allocated by one run of a case with
+            the configuration files in <directory> (used internally).
+
+"""
+import gc
+import os
+import sys
+import time
+import shutil
+import resource
+import tempfile
+import subprocess
+import simplejson as json
+from docopt import docopt
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from presto.models import Configuration, Token
+from presto.url_utils import PrestoUrl
+
+
+TOKENS_PER_APP = 10
+APPS_PER_PROVIDER = 10
+ROUNDS = 3
+# Peak RSS in KB grows by whole pages and allocator arenas, smaller
+# differences are noise.
+MEMORY_SLACK = 256
+CALIBRATION_ITEMS = 1000
+
+
+def make_config_data(tokens):
+    '''
+    Returns configuration data with `tokens` tokens, `TOKENS_PER_APP` per
+    app and `APPS_PER_PROVIDER` apps per provider.
+    '''
+    providers = []
+    for i in range(0, tokens, TOKENS_PER_APP * APPS_PER_PROVIDER):
+        n = len(providers)
+        apps = []
+        for j in range(i, min(i + TOKENS_PER_APP * APPS_PER_PROVIDER, tokens),
+                       TOKENS_PER_APP):
+            apps.append({
+                'name': u'app%d' % j,
+                'public_key': u'%032x' % j,
+                'secret_key': u'%016x' % j,
+                'tokens': [{'name': u'token%d' % k,
+                            'token_key': u'%032x' % k,
+                            'token_secret': u'%016x' % k}
+                           for k in range(j, min(j + TOKENS_PER_APP, tokens))],
+            })
+        base = u'https://api%d.example.com' % n
+        providers.append({
+            'name': u'provider%d' % n,
+            'domain_name': u'api%d.example.com' % n,
+            'auth_type': u'OAuth1.0',
+            'request_token_method': u'POST',
+            'request_token_url': base + u'/oauth/request_token',
+            'access_token_method': u'POST',
+            'access_token_url': base + u'/oauth/access_token',
+            'auth_url': base + u'/oauth/authorize',
+            'apps': apps,
+        })
+    return {'providers': providers}
+
+
+class Case(object):
+    '''
+    Benchmark of one operation on a configuration with `tokens` tokens.
+    Subclasses prepare the state in `setup` and define `run`, the
+    operation that is measured.
+    '''
+    name = None
+
+    def __init__(self, tokens, directory):
+        self.tokens = tokens
+        self.directory = directory
+        self.data = make_config_data(tokens)
+        self.file_name = os.path.join(directory, 'presto-%d.cfg' % tokens)
+        if not os.path.exists(self.file_name):
+            with open(self.file_name, 'w') as f:
+                json.dump(self.data, f)
+        # The last provider, app and token are the slowest to find.
+        provider = self.data['providers'][-1]
+        self.provider_name = provider['name']
+        self.app_name = provider['apps'][-1]['name']
+        self.token_name = provider['apps'][-1]['tokens'][-1]['name']
+        self.url = u'https://%s/api/v1/items?page=2' % \
+                provider['domain_name']
+
+    def setup(self):
+        self.conf = Configuration()
+        self.conf.load_from_file(self.file_name)
+
+
+class LoadCase(Case):
+    name = 'load'
+
+    def setup(self):
+        pass
+
+    def run(self):
+        Configuration().load_from_file(self.file_name)
+
+
+class SaveCase(Case):
+    name = 'save'
+
+    def run(self):
+        self.conf.mark_dirty()
+        self.conf.save_to_file(self.file_name)
+
+
+class PutTokenCase(Case):
+    name = 'put_token'
+
+    def setup(self):
+        # Journal entries must not leak into the files of other cases.
+        file_name = self.file_name + '.put'
+        shutil.copy(self.file_name, file_name)
+        self.conf = Configuration()
+        self.conf.load_from_file(file_name)
+        provider = self.conf.filter('providers', name=self.provider_name)
+        self.provider = provider
+        self.app = provider.filter('apps', name=self.app_name)
+        self.count = 0
+
+    def run(self):
+        self.count += 1
+        token = Token.from_data({'name': u'bench%d' % (self.count % 4),
+                                 'token_key': u'key', 'token_secret': u's'},
+                                parent=self.app)
+        self.conf.put_token(self.provider, self.app, token)
+        self.conf.save_to_file()
+
+
+class FromDictCase(Case):
+    name = 'from_dict'
+
+    def setup(self):
+        pass
+
+    def run(self):
+        Configuration().from_dict(self.data)
+
+
+class ToDictCase(Case):
+    name = 'to_dict'
+
+    def run(self):
+        self.conf.to_dict()
+
+
+class FilterCase(Case):
+    name = 'filter'
+
+    def run(self):
+        self.conf.filter('providers', name=self.provider_name) \
+                .filter('apps', name=self.app_name) \
+                .filter('tokens', name=self.token_name)
+
+
+class ResolveCase(Case):
+    name = 'resolve'
+
+    def setup(self):
+        super(ResolveCase, self).setup()
+        self.prestourl = PrestoUrl(conf=self.conf)
+
+    def run(self):
+        self.prestourl.get_auth(self.url, app=self.app_name,
+                                token=self.token_name)
+
+
+class SignCase(Case):
+    name = 'sign'
+
+    def setup(self):
+        super(SignCase, self).setup()
+        self.prestourl = PrestoUrl(conf=self.conf)
+        self.credentials = self.prestourl.get_credentials(
+                            self.url, app=self.app_name, token=self.token_name)
+
+    def run(self):
+        self.prestourl.sign(self.url, u'GET', {}, None, self.credentials)
+
+
+CASES = (LoadCase, SaveCase, PutTokenCase, FromDictCase, ToDictCase,
+         FilterCase, ResolveCase, SignCase)
+
+
+class Calibration(object):
+    '''
+    Fixed work of the kind the cases do, building, sorting and looking up
+    small objects, used as the unit of the stored times.
+    '''
+    def run(self):
+        items = [{'name': u'item%d' % i, 'key': u'%032x' % i}
+                 for i in xrange(CALIBRATION_ITEMS)]
+        index = dict((item['name'], item) for item in items)
+        for item in sorted(items, key=lambda item: item['key']):
+            index[item['name']]['key'].upper()
+
+
+def measure_time(case, min_time):
+    '''
+    Returns the best time of one `case.run()` call out of `ROUNDS` rounds.
+    Every round repeats the call for at least `min_time` seconds.
+    '''
+    best = None
+    loops = 1
+    for i in range(ROUNDS):
+        while True:
+            started = time.time()
+            for j in xrange(loops):
+                case.run()
+            elapsed = time.time() - started
+            if elapsed >= min_time:
+                break
+            loops = min(loops * 10,
+                        int(loops * min_time / max(elapsed, 1e-6)) + 1)
+        per_call = elapsed / loops
+        best = per_call if best is None else min(best, per_call)
+    return best
+
+
+def read_memory():
+    '''
+    Returns ``(current, peak)`` RSS of the process in KB.
+    '''
+    with open('/proc/self/status') as f:
+        status = dict(line.split(':', 1) for line in f)
+    return tuple(int(status[name].split()[0]) for name in ('VmRSS', 'VmHWM'))
+
+
+def reset_peak_memory():
+    '''
+    Resets the peak RSS of the process to its current RSS. Returns False if
+    the system can't do it (it needs Linux 4.0).
+    '''
+    try:
+        with open('/proc/self/clear_refs', 'w') as f:
+            f.write('5')
+        current, peak = read_memory()
+    except (IOError, ValueError, KeyError):
+        return False
+    return peak <= current
+
+
+def measure_memory(case):
+    '''
+    Returns the peak memory in KB allocated by one `case.run()` call, over
+    the memory used after `setup`. Where the peak can't be reset, only
+    growth over the peak of `setup` is seen.
+    '''
+    gc.collect()
+    if reset_peak_memory():
+        before = read_memory()[0]
+        case.run()
+        return max(read_memory()[1] - before, 0)
+    get_peak = lambda: resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    before = get_peak()
+    case.run()
+    return max(get_peak() - before, 0)
+
+
+def measure_memory_apart(name, tokens, directory):
+    '''
+    Runs `measure_memory` in a new process, so memory freed by earlier
+    cases can't hide what the case allocates.
+    '''
+    process = subprocess.Popen([sys.executable, os.path.abspath(__file__),
+                                '--memory-of=%s' % name, str(tokens),
+                                directory], stdout=subprocess.PIPE)
+    output = process.communicate()[0]
+    if process.returncode:
+        return None
+    return int(output)
+
+
+def run_cases(sizes, names, min_time, memory=True, out=sys.stdout):
+    '''
+    Runs the benchmarks and returns ``{case: {tokens: result}}``. A result
+    has the `time` of one call in seconds, the same time `relative` to the
+    calibration loop and the peak `memory` in KB, if it is over the
+    resolution of RSS.
+    '''
+    results = {}
+    unit = measure_time(Calibration(), min_time)
+    directory = tempfile.mkdtemp(prefix='presto-bench-')
+    try:
+        for tokens in sizes:
+            for cls in CASES:
+                if names and cls.name not in names:
+                    continue
+                case = cls(tokens, directory)
+                case.setup()
+                elapsed = measure_time(case, min_time)
+                result = {'time': elapsed, 'relative': elapsed / unit}
+                if memory:
+                    kb = measure_memory_apart(cls.name, tokens, directory)
+                    if kb is not None and kb >= MEMORY_SLACK:
+                        result['memory'] = kb
+                results.setdefault(cls.name, {})[str(tokens)] = result
+                out.write("%-10s %7d tokens  %12.1f us  %8s KB\n" % (
+                          cls.name, tokens, result['time'] * 1e6,
+                          result.get('memory', '-')))
+                out.flush()
+    finally:
+        shutil.rmtree(directory)
+    return results
+
+
+def compare(results, baseline, threshold):
+    '''
+    Returns a list of regressions of `results` against `baseline`.
+    '''
+    regressions = []
+    for name, sizes in sorted(results.items()):
+        for tokens, result in sorted(sizes.items(), key=lambda i: int(i[0])):
+            base = baseline.get(name, {}).get(tokens)
+            if base is None:
+                continue
+            relative, base_relative = result['relative'], \
+                    base.get('relative')
+            if base_relative is not None and \
+                    relative > base_relative * threshold:
+                regressions.append("%s with %s tokens: %.3f calibration "
+                                   "loops, baseline %.3f" % (name, tokens,
+                                   relative, base_relative))
+            memory, base_memory = result.get('memory'), base.get('memory')
+            if memory is not None and base_memory is not None and \
+                    memory > base_memory * threshold + MEMORY_SLACK:
+                regressions.append("%s with %s tokens: %d KB, baseline "
+                                   "%d KB" % (name, tokens, memory,
+                                              base_memory))
+    return regressions
+
+
+def get_case(name):
+    for cls in CASES:
+        if cls.name == name:
+            return cls
+    raise ValueError("Unknown case '%s'" % name)
+
+
+def main(args):
+    if args['--memory-of']:
+        case = get_case(args['--memory-of'])(int(args['<tokens>']),
+                                             args['<directory>'])
+        case.setup()
+        print measure_memory(case)
+        return 0
+
+    baseline_file = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                 args['--baseline'])
+    sizes = [int(size) for size in args['--sizes'].split(',')]
+    names = args['--cases'] and args['--cases'].split(',')
+    results = run_cases(sizes, names, float(args['--min-time']),
+                        memory=not args['--no-memory'])
+
+    if args['--save']:
+        with open(baseline_file, 'w') as f:
+            json.dump(results, f, indent=4, sort_keys=True)
+            f.write('\n')
+        print "Baseline saved to %s" % baseline_file
+        return 0
+
+    if not os.path.exists(baseline_file):
+        print "No baseline in %s, run with --save" % baseline_file
+        return 0
+    with open(baseline_file) as f:
+        baseline = json.load(f)
+    regressions = compare(results, baseline, float(args['--threshold']))
+    for regression in regressions:
+        print "Regression: %s" % regression
+    return 1 if regressions else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(docopt(__doc__, argv=sys.argv[1:])))
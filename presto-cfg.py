@@ -81,6 +81,10 @@ Here's how you add new authorization (access token), that can be then used by
         ...
     >>> The token is saved as '...'
 
+For 'OAuth2.0' providers the access token is requested with the client
+credentials of the app, or with a refresh token given by --refresh_token.
+Access tokens are refreshed by presto-url before they expire.
+
 
 Many parameters can be supplied non-interactively by using options, e.g.:
 
@@ -90,8 +94,8 @@ Usage: presto-cfg.py provider list
        presto-cfg.py provider add [<name>]
        presto-cfg.py app list
        presto-cfg.py app add [<name> ] [--provider=<provider>|--public_key=<public_key>|--secret_key=<secret_key>]
-       presto-cfg.py token add [<name>] [--provider=<provider>|--app=<app>]
-       presto-cfg.py token update [<name>] [--provider=<provider>|--app=<app>]
+       presto-cfg.py token add [<name>] [--provider=<provider>|--app=<app>|--refresh_token=<refresh_token>]
+       presto-cfg.py token update [<name>] [--provider=<provider>|--app=<app>|--refresh_token=<refresh_token>]
        presto-cfg.py -h | --help
        presto-cfg.py --version
 
@@ -101,6 +105,7 @@ Options:
     --app=<app> Name of the app
     --public_key=<public_key>
     --secret_key=<secret_key>
+    --refresh_token=<refresh_token> OAuth 2.0 refresh token
 
 """
 
@@ -130,10 +135,12 @@ if __name__ == '__main__':
             prestocfg.app_add(args['--provider'], args['--public_key'], args['--secret_key'], args['<name>'])
 
         elif args['token'] and args['add']:
-            prestocfg.token_add(args['--provider'], args['--app'], args['<name>'])
+            prestocfg.token_add(args['--provider'], args['--app'], args['<name>'],
+                                args['--refresh_token'])
 
         elif args['token'] and args['update']:
-            prestocfg.token_update(args['--provider'], args['--app'], args['<name>'])
+            prestocfg.token_update(args['--provider'], args['--app'], args['<name>'],
+                                   args['--refresh_token'])
 
     except PrestoCfgException, e:
          print "Error: %s " % e
@@ -7,7 +7,9 @@
 The program uses `curl` conventions when appropriate, but compatibility with
 `curl` is not a priority.
 
-Usage: presto-url.py [options] <url>
+Usage: presto-url.py [options] [-F <field>]... <url>
+       presto-url.py [options] --batch=<file>
+       presto-url.py --daemon [--socket=<path>]
        presto-url.py -h | --help
        presto-url.py --version
 
@@ -22,12 +24,88 @@ Options:
   --auth-provider=<auth-provider>  Name of the auth provider
   -c  Colorize output.
   -p  Pretty-print the output.
-  -d <data>  Data to send.
+  -d <data>  Data to send. With @<file> the data is read from the file,
+            with @- from the standard input; it is streamed, not read into
+            memory, and sent as application/octet-stream.
+  -F <field>  Send a multipart/form-data body with the field
+            <name>=<value>, or <name>=@<file>[;type=<type>] to upload a
+            file. Can be repeated.
   -i  Include HTTP headers in the output.
   -I  Display headers only. Please note that this does *not* use HTTP HEAD
       method. Use -X instead if you need it.
+  --select=<path>  Print only the values of the JSON response that match
+            <path>, e.g. '$.items[*].id', one value per line.
+  -w | --write-out <format>  Print information about the request after
+            the response, curl style: %{time_namelookup}, %{time_connect},
+            %{time_appconnect}, %{time_starttransfer}, %{time_total},
+            %{time_config}, %{time_resolve}, %{time_sign}, %{http_code},
+            %{size_download}, %{url_effective} or %{json} for all of them.
+  --trace-json=<file>  Write the time spent in each phase of the request as
+            JSON to <file> ('-' for stdout).
+  --compressed  Ask for a gzip or deflate compressed response and decode it
+            (default).
+  --no-compressed  Do not ask for a compressed response.
+  --gzip-body  Send the -d data gzipped, with `Content-Encoding: gzip`, for
+            providers that accept it.
+  -o <file>  Write the response body of a GET request to <file> as it
+            arrives.
+  -C <offset>  With -o, continue a download at <offset>, or with '-C -'
+            where an interrupted download stopped.
+  --parts=<n>  With -o, download up to <n> byte ranges of a large response
+            concurrently if the server accepts ranges [default: 1].
   -H | --header <header> Extra HTTP header to use.
   -X | --request <method> Specify a custom HTTP request method.
+  --batch=<file>  Send requests listed in a file ('-' for stdin). Each line
+            is a URL or a JSON object with `url`, `method`, `headers` and
+            `body`. Results are written as NDJSON.
+  --workers=<n>  Number of concurrent requests in batch mode [default: 8].
+  --per-host=<n>  Max concurrent requests to one host [default: 4].
+  --ordered  Write batch results in input order.
+  --paginate  Follow next-page links (`Link: <url>; rel="next"` headers or
+            --cursor) and write JSON values of all pages. Values are
+            selected from each page with --select, the whole page by
+            default, and written as NDJSON.
+  --cursor=<path>  With --paginate, path of the next page cursor in the
+            response, e.g. '$.paging.next'.
+  --cursor-param=<name>  Query param that carries the cursor
+            [default: cursor].
+  --array  With --paginate, write all values as one JSON array.
+  --max-pages=<n>  Max number of pages to fetch with --paginate.
+  --retry=<n>  Retry failed requests up to <n> times [default: 0]. Connection
+            errors and 408, 429, 500, 502, 503 and 504 responses are
+            retried, for idempotent methods only.
+  --retry-delay=<seconds>  Base wait between retries, doubled on every retry
+            and randomized [default: 0.5].
+  --retry-max-time=<seconds>  Max time spent on all attempts of a request.
+  --retry-all-methods  Retry POST and PATCH requests too.
+  --hedge  Send a duplicate of a GET or HEAD request on another connection
+            if it takes longer than most recent requests to the host; the
+            first response wins.
+  --hedge-percentile=<p>  Percentile of recent response times after which a
+            request is hedged [default: 95].
+  --hedge-max=<n>  Max number of duplicates of a request [default: 1].
+  --bench  Send the request repeatedly and print throughput, latency
+            percentiles, status codes and errors.
+  --count=<n>  Number of requests sent with --bench (default: 100).
+  --duration=<seconds>  Send requests with --bench for this long instead of
+            a number of requests.
+  --concurrency=<n>  Number of requests in flight with --bench
+            [default: 1].
+  --rate=<n>  Start this many requests per second with --bench. Latency is
+            measured from the time a request was due to start.
+  --sign-only  Print signed URLs instead of sending the requests. URLs are
+            read from <url> or from the --batch file.
+  --sign-header  With --sign-only, print JSON objects with the URL and the
+            OAuth Authorization header instead of presigned URLs.
+  --daemon  Run the presto daemon. It keeps the configuration and open
+            connections in memory and serves presto-url calls over a Unix
+            socket. presto-url forwards calls to a running daemon.
+  --socket=<path>  Unix socket of the daemon (default: ~/.presto.sock).
+  --cache  Cache GET responses with an ETag or Last-Modified header on disk
+            and revalidate them on later requests.
+  --cache-dir=<dir>  Cache directory (default: ~/.presto-cache).
+  --cache-size=<mb>  Max size of the cache in megabytes [default: 100].
+  --no-daemon  Do not forward the call to a running daemon.
 
 Example:
 
@@ -37,89 +115,30 @@ Example:
 
 import sys
 from docopt import docopt
-from oauthlib.oauth1.rfc5849 import *
-from urlparse import urlparse
-import httplib2
-import simplejson as json
-from  json_tools.printer import print_json
 
-
-from presto.config_utils import PrestoCfg, PrestoCfgException
+from presto import daemon
 from presto import version
-from presto.models import config
+from presto.utils.exceptions import (PrestoCfgException, JSONStreamError,
+    RequestError)
 
 ver = version.get_version()
 
 if __name__ == '__main__':
     args = docopt(__doc__, argv=sys.argv[1:], help=True, version=ver)
 
-    uri = unicode(args['<url>'])
-    sch, net, path, par, query, fra = urlparse(uri)
-
-    method = unicode((args['--request'] or u'GET').upper())
-    body = args['-d']
-    headers = {}
-
-    if body:
-        headers['Content-Type'] = u'application/x-www-form-urlencoded'
-
-
-    if args['-a']:
-        try:
-            if args['--auth-provider']:
-                provider = config.filter("providers", name=args['--auth-provider'])
-            else:
-                provider = config.filter("providers", domain_name=net)
-
-            app_name = args['--auth-app'] or u'default'
-            app = provider.filter('apps', name=app_name)
-
-            token_name = args['--auth-token'] or u'default'
-            token =  app.filter('tokens', name=token_name)
+    try:
+        if not args['--daemon'] and not args['--no-daemon']:
+            status = daemon.forward(args, args['--socket'])
+            if status is not None:
+                sys.exit(status)
 
-            access_token_key = token.token_key
-            access_token_secret = token.token_secret
-        except PrestoCfgException, e:
-            print "Error: %s " % e
-            raise
+        from presto.url_utils import PrestoUrl
 
-        client = Client(app.public_key,
-                        app.secret_key,
-                        resource_owner_key=access_token_key,
-                        resource_owner_secret=access_token_secret,
-                        signature_type=SIGNATURE_TYPE_QUERY)
-
-        uri, headers, body =  client.sign(uri=uri, http_method=method, headers=headers, body=body)
-
-
-    http = httplib2.Http()
-    response, content =    httplib2.Http.request(http, uri, method=method, body=body,
-            headers=headers)
-
-    if args['-i'] and headers:
-        if args['-c']:
-            print_json(dict(headers), True)
-        elif args['-p']:
-            print_json(dict(headers), False)
-        else:
-            for i  in headers:
-                print "%s: %s" % (i.title(), headers[i])
-
-    if args['-I']:
-        if args['-c']:
-            print_json(dict(response), True)
-        elif args['-p']:
-            print_json(dict(response), False)
-        else:
-            for i  in response:
-                print "%s: %s" % (i.title(), response[i])
-    else:
-        if response["content-type"] == "application/json":
-            if args['-c']:
-                print_json(json.loads(content), True)
-            elif args['-p']:
-                print_json(json.loads(content), False)
-            else:
-                print content
+        if args['--daemon']:
+            daemon.serve(args['--socket'])
         else:
-            print content
+            prestourl = PrestoUrl()
+            prestourl.run(args)
+    except (PrestoCfgException, JSONStreamError, RequestError), e:
+        print "Error: %s " % e
+        sys.exit(1)
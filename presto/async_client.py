@@ -0,0 +1,253 @@
+"""
+Concurrent request API for code that embeds presto.
+
+Every call returns a `Future` right away while the request runs on a
+shared pool of worker threads, so many signed requests can be in flight
+from one process. The number of requests in flight is limited by a
+semaphore, pending requests can be cancelled and every call accepts a
+timeout.
+"""
+import sys
+import time
+import threading
+import Queue
+
+from presto.utils.exceptions import RequestTimeout, RequestCancelled
+
+
+class Future(object):
+    '''
+    Result of an asynchronous call.
+    '''
+    PENDING, RUNNING, CANCELLED, FINISHED = range(4)
+
+    def __init__(self):
+        self.state = self.PENDING
+        self.condition = threading.Condition()
+        self.callbacks = []
+        self._result = None
+        self._exc_info = None
+
+    def cancel(self):
+        '''
+        Cancels the call if it has not started yet. Returns True if the
+        call is cancelled.
+        '''
+        with self.condition:
+            if self.state == self.RUNNING or self.state == self.FINISHED:
+                return False
+            if self.state == self.PENDING:
+                self.state = self.CANCELLED
+                self.condition.notify_all()
+        self.run_callbacks()
+        return True
+
+    def cancelled(self):
+        return self.state == self.CANCELLED
+
+    def done(self):
+        return self.state in (self.CANCELLED, self.FINISHED)
+
+    def set_running(self):
+        with self.condition:
+            if self.state != self.PENDING:
+                return False
+            self.state = self.RUNNING
+            return True
+
+    def set_result(self, result=None, exc_info=None):
+        with self.condition:
+            self._result = result
+            self._exc_info = exc_info
+            self.state = self.FINISHED
+            self.condition.notify_all()
+        self.run_callbacks()
+
+    def add_done_callback(self, callback):
+        '''
+        Calls `callback` with the future when it is done.
+        '''
+        with self.condition:
+            if not self.done():
+                self.callbacks.append(callback)
+                return
+        callback(self)
+
+    def run_callbacks(self):
+        callbacks, self.callbacks = self.callbacks, []
+        for callback in callbacks:
+            callback(self)
+
+    def wait(self, timeout=None):
+        with self.condition:
+            if timeout is None:
+                while not self.done():
+                    self.condition.wait(1)
+            else:
+                deadline = time.time() + timeout
+                while not self.done():
+                    remaining = deadline - time.time()
+                    if remaining <= 0:
+                        raise RequestTimeout("Request timed out.")
+                    self.condition.wait(remaining)
+
+    def result(self, timeout=None):
+        '''
+        Returns the result of the call, waiting for at most `timeout`
+        seconds. Raises the exception of the call if it failed.
+        '''
+        self.wait(timeout)
+        if self.state == self.CANCELLED:
+            raise RequestCancelled("Request was cancelled.")
+        if self._exc_info is not None:
+            raise self._exc_info[0], self._exc_info[1], self._exc_info[2]
+        return self._result
+
+    def exception(self, timeout=None):
+        self.wait(timeout)
+        if self.state == self.CANCELLED:
+            raise RequestCancelled("Request was cancelled.")
+        return self._exc_info and self._exc_info[1]
+
+
+class RequestExecutor(object):
+    '''
+    Pool of worker threads that run submitted calls.
+
+    :param max_workers: number of worker threads.
+    :param max_concurrency: max number of calls running at once, defaults
+                            to `max_workers`.
+    '''
+    def __init__(self, max_workers=32, max_concurrency=None):
+        self.max_workers = max_workers
+        self.semaphore = threading.BoundedSemaphore(
+                                        max_concurrency or max_workers)
+        self.tasks = Queue.Queue()
+        self.threads = []
+        self.lock = threading.Lock()
+        self.is_shutdown = False
+
+    def start_worker(self):
+        with self.lock:
+            if len(self.threads) >= self.max_workers:
+                return
+            thread = threading.Thread(target=self.worker)
+            thread.daemon = True
+            thread.start()
+            self.threads.append(thread)
+
+    def worker(self):
+        while True:
+            task = self.tasks.get()
+            if task is None:
+                break
+            future, func, args, kwargs = task
+            if future.cancelled():
+                continue
+
+            with self.semaphore:
+                if not future.set_running():
+                    continue
+                try:
+                    result = func(*args, **kwargs)
+                except:
+                    future.set_result(exc_info=sys.exc_info())
+                else:
+                    future.set_result(result)
+
+    def submit(self, func, *args, **kwargs):
+        '''
+        Schedules ``func(*args, **kwargs)`` and returns its `Future`.
+        '''
+        if self.is_shutdown:
+            raise RuntimeError("Executor is shut down.")
+        future = Future()
+        self.tasks.put((future, func, args, kwargs))
+        self.start_worker()
+        return future
+
+    def shutdown(self, wait=True):
+        '''
+        Stops the workers after the already submitted calls.
+        '''
+        self.is_shutdown = True
+        for thread in self.threads:
+            self.tasks.put(None)
+        if wait:
+            for thread in self.threads:
+                thread.join()
+
+
+def wait_all(futures, timeout=None):
+    '''
+    Returns results of all `futures`. If `timeout` expires, the calls that
+    did not start yet are cancelled and `RequestTimeout` is raised.
+    '''
+    deadline = timeout is not None and time.time() + timeout
+    results = []
+    try:
+        for future in futures:
+            remaining = None
+            if deadline:
+                remaining = max(deadline - time.time(), 0)
+            results.append(future.result(remaining))
+    except RequestTimeout:
+        for future in futures:
+            future.cancel()
+        raise
+    return results
+
+
+class AsyncClient(object):
+    '''
+    Client that runs OAuth calls and signed requests concurrently.
+
+    :param prestourl: `PrestoUrl` used to sign and send requests.
+    :param max_concurrency: max number of requests in flight.
+    :param timeout: default socket timeout of a request in seconds.
+    '''
+    def __init__(self, prestourl=None, max_concurrency=32, timeout=None,
+                 executor=None):
+        if prestourl is None:
+            from presto.url_utils import PrestoUrl
+            prestourl = PrestoUrl()
+        self.prestourl = prestourl
+        self.timeout = timeout
+        self.executor = executor or RequestExecutor(max_concurrency)
+
+    def get_request_token(self, public_key, secret_key, url, method=u'POST',
+                          timeout=None):
+        '''
+        Asynchronous `presto.oauth.get_request_token`.
+        '''
+        from presto.oauth import get_request_token
+        return self.executor.submit(get_request_token, public_key,
+                                    secret_key, url, method,
+                                    timeout=timeout or self.timeout)
+
+    def get_access_token(self, request_token, request_token_secret,
+                         access_token_url, access_token_method,
+                         public_key, secret_key, verifier, timeout=None):
+        '''
+        Asynchronous `presto.oauth.get_access_token`.
+        '''
+        from presto.oauth import get_access_token
+        return self.executor.submit(get_access_token, request_token,
+                                    request_token_secret, access_token_url,
+                                    access_token_method, public_key,
+                                    secret_key, verifier,
+                                    timeout=timeout or self.timeout)
+
+    def request(self, uri, method=u'GET', body=None, headers=None,
+                auth=None, timeout=None):
+        '''
+        Sends a request, signed if `auth` is given, see
+        `PrestoUrl.request`. The future result is
+        ``(response, content, headers)``.
+        '''
+        return self.executor.submit(self.prestourl.request, uri, method,
+                                    body, headers, auth=auth,
+                                    timeout=timeout or self.timeout)
+
+    def close(self, wait=True):
+        self.executor.shutdown(wait)
@@ -0,0 +1,203 @@
+"""
+Batch mode of presto-url.
+
+Request specs are read one per line, either a bare URL or a JSON object
+with `url` and optional `method`, `headers` and `body`. Requests are sent
+by a bounded pool of worker threads with a limit of concurrent requests
+per host, and every result is written as soon as it is ready as one line
+of NDJSON. A request to a host that has no free slot waits in a queue of
+the host, so it does not hold a worker that could send requests to other
+hosts meanwhile.
+"""
+import threading
+import Queue
+from collections import deque
+from urlparse import urlparse
+import simplejson as json
+
+
+def read_specs(lines, method=None, body=None):
+    '''
+    Yields request spec dictionaries for `lines`. Empty lines and lines
+    starting with '#' are skipped. A malformed line yields a spec with
+    only an `error` message.
+
+    :param lines: iterable of lines, e.g. a file object.
+    :param method: default HTTP method.
+    :param body: default request body.
+    '''
+    for number, line in enumerate(lines, 1):
+        line = line.strip()
+        if not line or line.startswith('#'):
+            continue
+
+        if line.startswith('{'):
+            try:
+                spec = json.loads(line)
+            except ValueError, e:
+                yield {'error': "Invalid request spec on line %d: %s" % (
+                                                            number, e)}
+                continue
+            if not isinstance(spec, dict) or \
+                    not isinstance(spec.get('url'), basestring):
+                yield {'error': "Invalid request spec on line %d: "
+                                "no url" % number}
+                continue
+        else:
+            spec = {'url': line}
+        spec.setdefault('method', method or u'GET')
+        spec.setdefault('body', body)
+        spec.setdefault('headers', {})
+        yield spec
+
+
+def to_text(content):
+    if isinstance(content, unicode):
+        return content
+    return content.decode('utf-8', 'replace')
+
+
+class BatchRunner(object):
+    '''
+    Sends batch requests with a `PrestoUrl` instance.
+
+    :param prestourl: `PrestoUrl` used to sign and send the requests.
+    :param workers: number of worker threads.
+    :param per_host: max number of concurrent requests to one host.
+    :param ordered: write results in input order instead of completion
+                    order.
+    :param auth: auth names passed to `PrestoUrl.request`, None to send
+                 requests unsigned.
+    '''
+    def __init__(self, prestourl, workers=8, per_host=4, ordered=False,
+                 auth=None):
+        self.prestourl = prestourl
+        self.workers = max(int(workers), 1)
+        self.per_host = max(int(per_host), 1)
+        self.ordered = ordered
+        self.auth = auth
+
+        # Requests in progress and tasks waiting for a slot, per host.
+        self.host_requests = {}
+        self.host_tasks = {}
+        self.host_lock = threading.Lock()
+        # Specs read but not finished yet.
+        self.slots = threading.Semaphore(self.workers * 4)
+        self.write_lock = threading.Lock()
+        self.pending = {}
+        self.next_index = 0
+
+    def get_host_key(self, spec):
+        parsed = urlparse(spec.get('url') or '')
+        return parsed.scheme, parsed.netloc
+
+    def start_task(self, key, task):
+        '''
+        Returns True if the request of `task` can be sent now. Otherwise
+        the task is queued until a request to the same host finishes.
+        '''
+        with self.host_lock:
+            if self.host_requests.get(key, 0) >= self.per_host:
+                self.host_tasks.setdefault(key, deque()).append(task)
+                return False
+            self.host_requests[key] = self.host_requests.get(key, 0) + 1
+            return True
+
+    def finish_task(self, key):
+        '''
+        Frees the slot of a finished request to the host `key`. Returns the
+        next task waiting for the host, which takes over the slot, or None.
+        '''
+        with self.host_lock:
+            waiting = self.host_tasks.get(key)
+            if waiting:
+                task = waiting.popleft()
+                if not waiting:
+                    del self.host_tasks[key]
+                return task
+            self.host_requests[key] -= 1
+            if not self.host_requests[key]:
+                del self.host_requests[key]
+            return None
+
+    def send(self, index, spec):
+        '''
+        Sends a single request and returns its result record.
+        '''
+        result = {'index': index, 'url': spec.get('url'),
+                  'method': spec.get('method')}
+        if 'error' in spec:
+            result['error'] = spec['error']
+            return result
+        try:
+            response, content, headers = self.prestourl.request(
+                                    spec['url'], spec['method'],
+                                    spec['body'], spec['headers'],
+                                    auth=self.auth)
+        except Exception, e:
+            result['error'] = "%s: %s" % (e.__class__.__name__, e)
+            return result
+
+        result['status'] = int(response.status)
+        result['headers'] = dict(response)
+        result['body'] = to_text(content)
+        if hasattr(response, 'hedges_fired'):
+            result['hedges_fired'] = response.hedges_fired
+            result['hedge_won'] = response.hedge_won
+        return result
+
+    def write(self, index, result):
+        with self.write_lock:
+            if not self.ordered:
+                self.write_line(result)
+                return
+
+            self.pending[index] = result
+            while self.next_index in self.pending:
+                self.write_line(self.pending.pop(self.next_index))
+                self.next_index += 1
+
+    def write_line(self, result):
+        out = self.prestourl.out
+        out.write(json.dumps(result) + '\n')
+        out.flush()
+
+    def worker(self, tasks):
+        while True:
+            task = tasks.get()
+            if task is None:
+                break
+            key = self.get_host_key(task[1])
+            if not self.start_task(key, task):
+                continue
+            while task is not None:
+                index, spec = task
+                try:
+                    self.write(index, self.send(index, spec))
+                finally:
+                    self.slots.release()
+                    task = self.finish_task(key)
+
+    def run(self, specs):
+        '''
+        Sends all requests from `specs` and waits for them to finish.
+        Input is read lazily, so at most a few specs per worker are held in
+        memory at a time, including those waiting for their host.
+        '''
+        tasks = Queue.Queue(self.workers * 2)
+        threads = [threading.Thread(target=self.worker, args=(tasks, ))
+                   for i in range(self.workers)]
+        for thread in threads:
+            thread.daemon = True
+            thread.start()
+
+        try:
+            for index, spec in enumerate(specs):
+                self.slots.acquire()
+                tasks.put((index, spec))
+        finally:
+            for thread in threads:
+                tasks.put(None)
+            for thread in threads:
+                while thread.is_alive():
+                    thread.join(1)
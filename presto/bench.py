@@ -0,0 +1,254 @@
+"""
+Benchmark mode of presto-url.
+
+The same request is sent over and over by a number of worker threads, for
+a number of requests or for a time, optionally at a fixed rate. Requests
+go through `PrestoUrl.request`, so they are signed, rate limited and sent
+over pooled connections like any other request. Latencies are recorded in
+a `Histogram` with a bounded relative error, so percentiles stay accurate
+and memory stays small however many requests are sent. Failed requests
+are kept in a histogram of their own, so fast failures do not make the
+latency look better.
+
+With a target rate every request has an intended start time and its
+latency is counted from that time, so a server that stalls is not hidden
+by the client waiting for it ("coordinated omission").
+"""
+import math
+import time
+import threading
+from collections import defaultdict
+
+from presto import transport
+
+
+PERCENTILES = (50, 75, 90, 99, 99.9)
+
+
+def bit_length(value):
+    return len(bin(value)) - 2
+
+
+class Histogram(object):
+    '''
+    HDR-style histogram of integer values (e.g. microseconds).
+
+    Values are counted in buckets whose width grows with the value, so
+    every recorded value is kept with at most ``10 ** -significant_figures``
+    relative error.
+    '''
+    def __init__(self, significant_figures=3):
+        largest = 2 * 10 ** significant_figures
+        self.sub_bucket_count = 1 << bit_length(largest - 1)
+        self.sub_bucket_magnitude = bit_length(self.sub_bucket_count) - 1
+        self.sub_bucket_mask = self.sub_bucket_count - 1
+        self.counts = defaultdict(int)
+        self.count = 0
+        self.total = 0
+        self.min = None
+        self.max = None
+        self.lock = threading.Lock()
+
+    def get_bucket(self, value):
+        '''
+        Returns ``(lowest, width)`` of the bucket `value` is counted in.
+        '''
+        shift = bit_length(value | self.sub_bucket_mask) - \
+                self.sub_bucket_magnitude
+        return (value >> shift) << shift, 1 << shift
+
+    def record(self, value):
+        value = max(int(value), 0)
+        lowest, width = self.get_bucket(value)
+        with self.lock:
+            self.counts[lowest] += 1
+            self.count += 1
+            self.total += value
+            if self.min is None or value < self.min:
+                self.min = value
+            if self.max is None or value > self.max:
+                self.max = value
+
+    @property
+    def mean(self):
+        return float(self.total) / self.count if self.count else 0.0
+
+    def get_percentile(self, percentile):
+        '''
+        Returns the value below which `percentile` percent of the recorded
+        values are, 0 if nothing was recorded.
+        '''
+        if not self.count:
+            return 0
+        rank = max(int(math.ceil(self.count * percentile / 100.0)), 1)
+        seen = 0
+        with self.lock:
+            for lowest in sorted(self.counts):
+                seen += self.counts[lowest]
+                if seen >= rank:
+                    width = self.get_bucket(lowest)[1]
+                    return min(lowest + width - 1, self.max)
+        return self.max
+
+
+class Benchmark(object):
+    '''
+    Sends one request repeatedly and collects statistics.
+
+    :param prestourl: `PrestoUrl` used to sign and send the requests.
+    :param count: number of requests to send.
+    :param duration: seconds to send requests for, if `count` is not set.
+    :param concurrency: number of requests in flight.
+    :param rate: requests per second to start, as fast as possible if None.
+    :param auth: auth names passed to `PrestoUrl.request`, None to send
+                 requests unsigned.
+    '''
+    def __init__(self, prestourl, count=None, duration=None, concurrency=1,
+                 rate=None, auth=None, clock=time.time, sleep=time.sleep):
+        if count is None and duration is None:
+            count = 100
+        self.prestourl = prestourl
+        self.count = count
+        self.duration = duration
+        self.concurrency = max(int(concurrency), 1)
+        self.rate = rate
+        self.auth = auth
+        self.clock = clock
+        self.sleep = sleep
+
+        self.histogram = Histogram()
+        self.error_histogram = Histogram()
+        self.statuses = defaultdict(int)
+        self.errors = defaultdict(int)
+        self.bytes = 0
+        self.sent = 0
+        self.lock = threading.Lock()
+        self.started = self.finished = None
+
+    def next_start(self):
+        '''
+        Returns the time the next request is meant to start, None when the
+        benchmark is over.
+        '''
+        with self.lock:
+            index = self.sent
+            if self.count is not None and index >= self.count:
+                return None
+            now = self.clock()
+            if self.duration is not None and \
+                    now - self.started >= self.duration:
+                return None
+            self.sent += 1
+        if self.rate:
+            return self.started + index / float(self.rate)
+        return now
+
+    def send(self, uri, method, body, headers):
+        '''
+        Sends one request and records the outcome. Returns False if the
+        request failed.
+        '''
+        try:
+            response, content, _ = self.prestourl.request(uri, method, body,
+                                                          headers,
+                                                          auth=self.auth)
+        except Exception, e:
+            with self.lock:
+                self.errors[e.__class__.__name__] += 1
+            return False
+        with self.lock:
+            self.statuses[int(response.status)] += 1
+            self.bytes += len(content)
+        return True
+
+    def worker(self, uri, method, body, headers):
+        while True:
+            start = self.next_start()
+            if start is None:
+                break
+            delay = start - self.clock()
+            if delay > 0:
+                self.sleep(delay)
+            histogram = self.histogram
+            if not self.send(uri, method, body, headers):
+                histogram = self.error_histogram
+            histogram.record((self.clock() - start) * 1000000)
+
+    def run(self, uri, method=u'GET', body=None, headers=None):
+        '''
+        Sends the requests and waits for them to finish.
+        '''
+        pool = transport.get_pool()
+        max_per_host = pool.max_per_host
+        pool.max_per_host = max(max_per_host, self.concurrency)
+        try:
+            self.started = self.clock()
+            threads = [threading.Thread(target=self.worker,
+                                        args=(uri, method, body, headers))
+                       for i in range(self.concurrency)]
+            for thread in threads:
+                thread.daemon = True
+                thread.start()
+            for thread in threads:
+                while thread.is_alive():
+                    thread.join(1)
+            self.finished = self.clock()
+        finally:
+            pool.max_per_host = max_per_host
+
+    @property
+    def elapsed(self):
+        return (self.finished or self.clock()) - self.started
+
+    def get_report(self):
+        '''
+        Returns the results as a dict; latencies are in milliseconds.
+        `latency` covers the requests that got a response, `error_latency`
+        the failed ones.
+        '''
+        histogram = self.histogram
+        errors = self.error_histogram
+        ms = lambda value: (value or 0) / 1000.0
+        latency = dict(('p%s' % p, ms(histogram.get_percentile(p)))
+                       for p in PERCENTILES)
+        latency.update(min=ms(histogram.min), max=ms(histogram.max),
+                       mean=ms(histogram.mean))
+        count = histogram.count + errors.count
+        elapsed = self.elapsed
+        return {
+            'requests': count,
+            'errors': dict(self.errors),
+            'statuses': dict((str(k), v) for k, v in self.statuses.items()),
+            'elapsed': elapsed,
+            'throughput': count / elapsed if elapsed else 0.0,
+            'bytes': self.bytes,
+            'latency': latency,
+            'error_latency': dict(min=ms(errors.min), max=ms(errors.max),
+                                  mean=ms(errors.mean)),
+        }
+
+    def write_report(self, out):
+        report = self.get_report()
+        latency = report['latency']
+        write = out.write
+        write("Requests:     %d in %.2f s, %d errors\n" % (
+              report['requests'], report['elapsed'],
+              sum(report['errors'].values())))
+        write("Throughput:   %.1f req/s, %.1f KB/s\n" % (
+              report['throughput'],
+              report['bytes'] / 1024.0 / (report['elapsed'] or 1)))
+        write("Latency (ms): min %.2f, mean %.2f, max %.2f\n" % (
+              latency['min'], latency['mean'], latency['max']))
+        write("Percentiles:  %s\n" % ", ".join(
+              "p%s %.2f" % (p, latency['p%s' % p]) for p in PERCENTILES))
+        if report['statuses']:
+            write("Status codes: %s\n" % ", ".join(
+                  "%s: %d" % item for item in sorted(
+                                            report['statuses'].items())))
+        if report['errors']:
+            write("Errors:       %s\n" % ", ".join(
+                  "%s: %d" % item for item in sorted(
+                                            report['errors'].items())))
+            latency = report['error_latency']
+            write("Errors (ms):  min %.2f, mean %.2f, max %.2f\n" % (
+                  latency['min'], latency['mean'], latency['max']))
@@ -0,0 +1,339 @@
+"""
+On-disk cache of GET responses.
+
+Every cached response is one file named by the hash of the request: a
+JSON line with the status and headers, followed by the body. Responses
+with an ETag or Last-Modified header are stored while their body is read,
+and later requests for the same URI are revalidated with If-None-Match and
+If-Modified-Since. A 304 answer is served from the file.
+
+The OAuth nonce, timestamp and signature that query signing adds to the
+URI change on every request and are left out of the cache key. The
+consumer key and the token stay in it, so different credentials never
+share cached responses. OAuth 2.0 access tokens are sent in a header and
+replaced when they expire, so the names of the credentials are added to
+the key instead.
+
+The cache is bounded by size. File modification times record the last
+use and the least recently used files are removed first. Temporary files
+left by a body that was never read to its end, e.g. by a process that
+died, are removed once they are older than `STALE_TEMP_AGE`.
+"""
+import os
+import time
+import hashlib
+import tempfile
+import threading
+from urllib import urlencode
+from urlparse import urlsplit, urlunsplit, parse_qsl
+import simplejson as json
+
+
+VOLATILE_PARAMS = frozenset(['oauth_nonce', 'oauth_timestamp',
+                             'oauth_signature'])
+# Headers that describe the transfer of the original body, not the
+# stored one.
+HOP_HEADERS = frozenset(['connection', 'keep-alive', 'transfer-encoding',
+                         'content-length', 'status'])
+# Bodies are stored as `presto.transport.Response.read` returns them,
+# decoded.
+DECODED_HEADERS = HOP_HEADERS | frozenset(['content-encoding'])
+TEMP_SUFFIX = '.tmp'
+# Seconds after which a temporary file is taken as left behind.
+STALE_TEMP_AGE = 3600
+CHUNK_SIZE = 1 << 16
+
+
+def get_cache_dir(path=None):
+    return os.path.expanduser(path or os.getenv('PRESTO_CACHE_DIR') or \
+                              '~/.presto-cache')
+
+
+def get_cache_key(method, uri, vary=None):
+    '''
+    Returns the cache key of a request, ignoring volatile OAuth params.
+
+    :param vary: string that tells apart requests with different
+                 credentials that are not in `uri`.
+    '''
+    if isinstance(uri, unicode):
+        uri = uri.encode('utf-8')
+    scheme, netloc, path, query, fragment = urlsplit(uri)
+    params = [(k, v) for k, v in parse_qsl(query, keep_blank_values=True)
+              if k not in VOLATILE_PARAMS]
+    uri = urlunsplit((scheme.lower(), netloc.lower(), path or '/',
+                      urlencode(params), ''))
+    key = '%s %s' % (method.upper(), uri)
+    if vary:
+        key += ' ' + (vary.encode('utf-8') if isinstance(vary, unicode)
+                      else vary)
+    return hashlib.sha1(key).hexdigest()
+
+
+class CachedResponse(dict):
+    '''
+    Response read from the cache, with the interface of
+    `presto.transport.Response`.
+    '''
+    from_cache = True
+
+    def __init__(self, meta, body, headers=None):
+        super(CachedResponse, self).__init__(meta['headers'])
+        if headers:
+            self.update((k, v) for k, v in headers.iteritems()
+                        if k not in DECODED_HEADERS)
+        self.status = meta['status']
+        self.reason = meta['reason']
+        self['status'] = str(self.status)
+        self.raw = body
+        self._content = None
+        self.callbacks = []
+
+    def read(self, amt=None):
+        if self.raw is None:
+            return ''
+        data = self.raw.read() if amt is None else self.raw.read(amt)
+        if not data or amt is None:
+            self.release()
+        return data
+
+    def iter_content(self, chunk_size=CHUNK_SIZE):
+        while True:
+            chunk = self.read(chunk_size)
+            if not chunk:
+                break
+            yield chunk
+
+    @property
+    def content(self):
+        if self._content is None:
+            self._content = ''.join(self.iter_content())
+        return self._content
+
+    def on_release(self, callback):
+        '''
+        Calls `callback` once the body is read or the response is closed.
+        '''
+        if self.raw is None:
+            callback()
+        else:
+            self.callbacks.append(callback)
+
+    def release(self):
+        if self.raw is not None:
+            self.raw.close()
+            self.raw = None
+        callbacks, self.callbacks = self.callbacks, []
+        for callback in callbacks:
+            callback()
+
+    close = release
+
+
+class CacheWriter(object):
+    '''
+    Wraps the raw response of a connection and copies the body to a
+    temporary file as it is read. The file becomes the cache entry when
+    the whole body has been read.
+    '''
+    def __init__(self, cache, key, raw, meta):
+        self.cache = cache
+        self.key = key
+        self.raw = raw
+        fd, self.temp_name = tempfile.mkstemp(suffix=TEMP_SUFFIX,
+                                              dir=cache.directory)
+        self.file = os.fdopen(fd, 'wb')
+        self.file.write(json.dumps(meta) + '\n')
+
+    def __getattr__(self, name):
+        return getattr(self.raw, name)
+
+    def read(self, amt=None):
+        try:
+            data = self.raw.read(amt)
+        except:
+            # A body cut off, e.g. by IncompleteRead, is not stored.
+            self.discard()
+            raise
+        if self.file is not None:
+            if data:
+                self.file.write(data)
+            if not data or amt is None or self.raw.isclosed():
+                # httplib ends a body shorter than its Content-Length
+                # without an error; the bytes still missing are in
+                # `length`.
+                if getattr(self.raw, 'length', None):
+                    self.discard()
+                else:
+                    self.commit()
+        return data
+
+    def commit(self):
+        self.file.close()
+        self.file = None
+        self.cache.commit(self.key, self.temp_name)
+
+    def discard(self):
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+            try:
+                os.unlink(self.temp_name)
+            except OSError:
+                pass
+
+    def close(self):
+        self.discard()
+        self.raw.close()
+
+
+class ResponseCache(object):
+    '''
+    Size-bounded cache of GET responses in `directory`.
+
+    :param directory: cache directory, created if missing.
+    :param max_size: max total size of cached files in bytes.
+    '''
+    def __init__(self, directory=None, max_size=100 << 20):
+        self.directory = get_cache_dir(directory)
+        self.max_size = max_size
+        self.size = None
+        # Batch and async requests commit entries from many threads.
+        self.lock = threading.Lock()
+        if not os.path.isdir(self.directory):
+            os.makedirs(self.directory, 0700)
+
+    def get_path(self, key):
+        return os.path.join(self.directory, key)
+
+    def load(self, key):
+        '''
+        Returns ``(meta, body)`` for `key` or None. `body` is the open
+        cache file positioned at the start of the body.
+        '''
+        try:
+            body = open(self.get_path(key), 'rb')
+        except IOError:
+            return None
+        try:
+            meta = json.loads(body.readline())
+        except ValueError:
+            body.close()
+            return None
+        return meta, body
+
+    def get_validators(self, meta):
+        '''
+        Returns conditional request headers for a cached response.
+        '''
+        headers = {}
+        if meta['headers'].get('etag'):
+            headers['If-None-Match'] = meta['headers']['etag']
+        if meta['headers'].get('last-modified'):
+            headers['If-Modified-Since'] = meta['headers']['last-modified']
+        return headers
+
+    def is_cacheable(self, response):
+        if response.status != 200:
+            return False
+        if 'no-store' in response.get('cache-control', ''):
+            return False
+        return bool(response.get('etag') or response.get('last-modified'))
+
+    def store(self, key, response):
+        '''
+        Starts storing `response`, a streamed `presto.transport.Response`.
+        The entry is written when the body has been read.
+        '''
+        # A decoded response has no Content-Encoding left, see
+        # `presto.transport.Response`.
+        meta = {'status': response.status, 'reason': response.reason,
+                'headers': dict((k, v) for k, v in response.iteritems()
+                                if k not in HOP_HEADERS)}
+        response.raw = CacheWriter(self, key, response.raw, meta)
+
+    def hit(self, key, meta, body, response):
+        '''
+        Returns the cached response for a 304 `response`.
+        '''
+        response.content
+        try:
+            os.utime(self.get_path(key), None)
+        except OSError:
+            pass
+        return CachedResponse(meta, body, response)
+
+    def commit(self, key, temp_name):
+        path = self.get_path(key)
+        with self.lock:
+            # The entry may replace an older one of the same request.
+            try:
+                replaced = os.path.getsize(path)
+            except OSError:
+                replaced = 0
+            os.rename(temp_name, path)
+            if self.size is not None:
+                self.size += os.path.getsize(path) - replaced
+            self.evict()
+
+    def evict(self):
+        '''
+        Removes the least recently used files while the cache is larger
+        than `max_size`, and stale temporary files. Must be called with
+        `lock` held.
+        '''
+        if self.size is not None and self.size <= self.max_size:
+            return
+        entries = []
+        stale = time.time() - STALE_TEMP_AGE
+        for name in os.listdir(self.directory):
+            path = os.path.join(self.directory, name)
+            try:
+                stat = os.stat(path)
+                if name.endswith(TEMP_SUFFIX):
+                    if stat.st_mtime < stale:
+                        os.unlink(path)
+                    continue
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, name))
+        entries.sort()
+
+        self.size = sum(entry[1] for entry in entries)
+        for mtime, size, name in entries:
+            if self.size <= self.max_size:
+                break
+            try:
+                os.unlink(os.path.join(self.directory, name))
+            except OSError:
+                continue
+            self.size -= size
+
+    def request(self, send, method, uri, headers, vary=None):
+        '''
+        Sends a request through the cache and returns a streamed response.
+
+        :param send: ``send(headers)`` sends the request with extra
+                     headers and returns a streamed response.
+        :param vary: see `get_cache_key`.
+        '''
+        if method.upper() != 'GET' or 'Range' in headers:
+            return send(headers)
+
+        key = get_cache_key(method, uri, vary)
+        cached = self.load(key)
+        if cached is not None:
+            headers = dict(headers, **self.get_validators(cached[0]))
+        try:
+            response = send(headers)
+            if cached is not None and response.status == 304:
+                meta, body = cached
+                cached = None
+                return self.hit(key, meta, body, response)
+        finally:
+            if cached is not None:
+                cached[1].close()
+
+        if self.is_cacheable(response):
+            self.store(key, response)
+        return response
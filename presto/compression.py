@@ -0,0 +1,127 @@
+"""
+Compressed request and response bodies.
+
+Responses with a gzip or deflate Content-Encoding are decoded while they
+are read, so a compressed body is never held in memory as a whole.
+Request bodies can be gzipped before they are sent, streamed bodies
+while they are sent; OAuth signatures are computed over the uncompressed
+body, which is what the provider sees after decoding it.
+"""
+import zlib
+
+
+ACCEPT_ENCODING = 'gzip, deflate'
+GZIP_WBITS = 16 + zlib.MAX_WBITS
+ENCODINGS = ('gzip', 'x-gzip', 'deflate')
+
+
+def get_encoding(headers):
+    '''
+    Returns the Content-Encoding of a response that can be decoded, or
+    None.
+    '''
+    encoding = (headers.get('content-encoding') or '').strip().lower()
+    return encoding if encoding in ENCODINGS else None
+
+
+def gzip_body(body, level=6):
+    '''
+    Returns `body` compressed in the gzip format.
+    '''
+    if isinstance(body, unicode):
+        body = body.encode('utf-8')
+    compressor = zlib.compressobj(level, zlib.DEFLATED, GZIP_WBITS)
+    return compressor.compress(body) + compressor.flush()
+
+
+class GzipStream(object):
+    '''
+    Gzips a streamed body of `presto.upload` while it is sent. The
+    compressed length is not known up front, so the body is sent with
+    chunked transfer encoding.
+    '''
+    length = None
+
+    def __init__(self, body, level=6, chunk_size=1 << 16):
+        self.body = body
+        self.level = level
+        self.chunk_size = chunk_size
+        self.content_type = body.content_type
+        self.replayable = body.replayable
+
+    def iter_chunks(self, chunk_size=None):
+        compressor = zlib.compressobj(self.level, zlib.DEFLATED, GZIP_WBITS)
+        for chunk in self.body.iter_chunks(self.chunk_size):
+            data = compressor.compress(chunk)
+            if data:
+                yield data
+        yield compressor.flush()
+
+    def close(self):
+        self.body.close()
+
+
+class DecodingReader(object):
+    '''
+    Wraps the raw response of a connection and decodes the body as it is
+    read. Every `read` returns at most `amt` decoded bytes.
+
+    :param encoding: 'gzip' or 'deflate'. Deflate bodies with and without
+                     the zlib header are accepted.
+    '''
+    def __init__(self, raw, encoding):
+        self.raw = raw
+        self.encoding = encoding
+        self.decoder = None
+        self.tail = ''
+        self.done = False
+
+    def __getattr__(self, name):
+        return getattr(self.raw, name)
+
+    def get_decoder(self, data):
+        if self.encoding != 'deflate':
+            return zlib.decompressobj(GZIP_WBITS)
+        # RFC 7230 says zlib format, but some servers send raw deflate.
+        if len(data) >= 2 and ord(data[0]) & 0x0f == 8 and \
+                (ord(data[0]) << 8 | ord(data[1])) % 31 == 0:
+            return zlib.decompressobj()
+        return zlib.decompressobj(-zlib.MAX_WBITS)
+
+    def decode(self, data, amt):
+        if self.decoder is None:
+            self.decoder = self.get_decoder(data)
+        try:
+            if amt is None:
+                return self.decoder.decompress(data)
+            decoded = self.decoder.decompress(data, amt)
+            self.tail = self.decoder.unconsumed_tail
+            return decoded
+        except zlib.error, e:
+            raise IOError("Can't decode %s response body: %s" % \
+                          (self.encoding, e))
+
+    def read(self, amt=None):
+        if self.done:
+            return ''
+        while True:
+            if self.tail:
+                data, self.tail = self.tail, ''
+            else:
+                data = self.raw.read(amt)
+            if not data:
+                self.done = True
+                return self.decoder.flush() if self.decoder else ''
+            decoded = self.decode(data, amt)
+            if amt is None or not self.tail and self.raw.isclosed():
+                self.done = True
+                decoded += self.decoder.flush()
+            if decoded or self.done:
+                return decoded
+
+    def isclosed(self):
+        return self.done or self.decoder is None and self.raw.isclosed()
+
+    def close(self):
+        self.done = True
+        self.raw.close()
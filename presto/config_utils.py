@@ -54,7 +54,7 @@ class PrestoCfg(object):
         '''
         provider = Provider(data=locals(), parent=self.config)
         if provider.is_valid():
-            self.config.providers.append(provider)
+            self.config.add_provider(provider)
 
         self.config.save_to_file()
         print "Added new provider '%s'" % (provider.name)
@@ -72,42 +72,48 @@ class PrestoCfg(object):
         app = Application(data=locals(), parent=self.config)
         if app.is_valid():
             provider = app.cleaned_data['provider']
-            provider.apps.append(app)
+            self.config.add_app(provider, app)
 
         self.config.save_to_file()
         print "Added new app '%s'" % app.name
 
     @need_providers
-    def token_add(self, provider, app, name):
+    def token_add(self, provider, app, name, refresh_token=None):
         '''
         
         :param provider:
         :param app:
         :param name:
+        :param refresh_token: OAuth 2.0 refresh token; without it OAuth 2.0
+                              tokens are requested with the client
+                              credentials of the app.
         '''
         token = Token(data=locals(), parent=self.config)
         if token.is_valid():
+            provider = token.cleaned_data['provider']
             app = token.cleaned_data['app']
-            app.tokens.append(token)
+            self.config.put_token(provider, app, token)
 
         self.config.save_to_file()
         print "The token is saved as '%s'." % (token.name)
 
     @need_providers
-    def token_update(self, provider, app, name):
+    def token_update(self, provider, app, name, refresh_token=None):
         '''
         
         :param provider:
         :param app:
         :param name:
+        :param refresh_token: see `token_add`.
         '''
         token = Token(data=locals(), parent=self.config)
         token.rewrite_name = True
         if token.is_valid():
+            provider = token.cleaned_data['provider']
             app = token.cleaned_data['app']
-            for i, t in enumerate(app.tokens):
+            for t in app.tokens:
                 if t.name == token.name:
-                    app.tokens[i] = token
+                    self.config.put_token(provider, app, token)
                     self.config.save_to_file()
                     print "The token '%s' is updated." % (token.name)
                     break
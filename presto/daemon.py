@@ -0,0 +1,258 @@
+"""
+presto daemon and the client used by presto-url to talk to it.
+
+The daemon keeps the configuration, the signing state and the connection
+pool in memory and serves presto-url calls over a Unix socket. The client
+sends the parsed command line as one JSON line and receives framed
+output: a frame type byte, a 4-byte length and the payload. Type 'o' is
+output data, type 'x' carries the exit status and ends the call. Type 'r'
+ends a call the daemon refuses, because it serves another configuration
+file than the client uses; the client runs such a call itself. So does
+it with a call the daemon drops before sending any output.
+
+This module is imported by presto-url before anything else, so the client
+part must stay cheap to import.
+"""
+import os
+import sys
+import errno
+import socket
+import struct
+import simplejson as json
+
+from presto.utils.exceptions import RequestError
+
+
+FRAME_HEADER = struct.Struct('!cI')
+OUTPUT_FRAME = 'o'
+EXIT_FRAME = 'x'
+REFUSED_FRAME = 'r'
+
+
+def get_socket_path(path=None):
+    return os.path.expanduser(path or os.getenv('PRESTO_SOCKET') or \
+                              '~/.presto.sock')
+
+
+def get_config_path():
+    '''
+    Returns the absolute path of the configuration file presto-url uses,
+    like `presto.models.PRESTO_CONFIG_FILE_NAME`.
+    '''
+    return os.path.abspath(os.getenv('PRESTO_CONFIG') or
+                           os.path.join(os.getenv('HOME'), '.presto'))
+
+
+def is_same_file(path, other):
+    return os.path.realpath(path) == os.path.realpath(other)
+
+
+def needs_local_run(args):
+    '''
+    Returns True if the call can not be forwarded to the daemon.
+    '''
+    # Standard input is not forwarded.
+    return args.get('--batch') == '-' or args.get('-d') == '@-'
+
+
+def read_exactly(sock, size):
+    data = []
+    while size:
+        chunk = sock.recv(size)
+        if not chunk:
+            raise EOFError("Connection closed by the presto daemon.")
+        data.append(chunk)
+        size -= len(chunk)
+    return ''.join(data)
+
+
+def forward(args, path=None, out=None, config=None):
+    '''
+    Runs the call in the daemon if it is running. Returns the exit status
+    of the call, or None if it has to be run in-process. Raises
+    `RequestError` if the daemon drops the call after some output.
+
+    :param args: arguments parsed by docopt.
+    :param path: path to the daemon socket.
+    :param config: path to the configuration file of the call, the one
+                   given by ``PRESTO_CONFIG`` if not set.
+    '''
+    if needs_local_run(args):
+        return None
+
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        sock.connect(get_socket_path(path))
+    except socket.error, e:
+        sock.close()
+        if e.errno in (errno.ENOENT, errno.ECONNREFUSED):
+            return None
+        raise
+
+    out = out or sys.stdout
+    written = False
+    try:
+        config = os.path.abspath(config or get_config_path())
+        sock.sendall(json.dumps({'args': args, 'cwd': os.getcwd(),
+                                 'config': config}) + '\n')
+        while True:
+            kind, size = FRAME_HEADER.unpack(
+                            read_exactly(sock, FRAME_HEADER.size))
+            payload = read_exactly(sock, size)
+            if kind == EXIT_FRAME:
+                return int(payload)
+            if kind == REFUSED_FRAME:
+                return None
+            written = True
+            out.write(payload)
+            out.flush()
+    except (EOFError, socket.error), e:
+        if not written:
+            return None
+        raise RequestError("The presto daemon stopped during the call: "
+                           "%s" % e)
+    finally:
+        sock.close()
+
+
+class ClientDisconnected(Exception):
+    pass
+
+
+class FrameWriter(object):
+    '''
+    File-like object that sends written data to the client as output
+    frames.
+    '''
+    def __init__(self, sock):
+        self.sock = sock
+
+    def send(self, kind, data):
+        try:
+            self.sock.sendall(FRAME_HEADER.pack(kind, len(data)) + data)
+        except socket.error:
+            raise ClientDisconnected()
+
+    def write(self, data):
+        if isinstance(data, unicode):
+            data = data.encode('utf-8')
+        if data:
+            self.send(OUTPUT_FRAME, data)
+
+    def flush(self):
+        pass
+
+    def exit(self, status):
+        self.send(EXIT_FRAME, str(status))
+
+    def refuse(self):
+        self.send(REFUSED_FRAME, '')
+
+
+def is_running(path):
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        sock.connect(path)
+        return True
+    except socket.error:
+        return False
+    finally:
+        sock.close()
+
+
+def serve(path=None, conf=None):
+    '''
+    Runs the daemon until it is interrupted.
+
+    :param path: path to the socket.
+    :param conf: `Configuration` to serve, loaded from the default file
+                 if not given. It is reloaded when its file changes.
+    '''
+    server = make_server(path, conf)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        if os.path.exists(server.server_address):
+            os.unlink(server.server_address)
+
+
+def make_server(path=None, conf=None):
+    '''
+    Returns the daemon server bound to the socket at `path`.
+    '''
+    import threading
+    import SocketServer
+    from presto.models import config
+    from presto.url_utils import PrestoUrl
+    from presto.utils.exceptions import PrestoCfgException
+
+    if conf is None:
+        conf = config.get_config()
+    path = get_socket_path(path)
+    if os.path.exists(path):
+        if is_running(path):
+            raise PrestoCfgException(
+                            "presto daemon is already running on %s" % path)
+        os.unlink(path)
+
+    class Handler(SocketServer.StreamRequestHandler):
+        def handle(self):
+            request = json.loads(self.rfile.readline())
+            writer = FrameWriter(self.connection)
+            conf = self.server.get_config()
+            config = request.get('config')
+            if not config or not conf.file_name or \
+                    not is_same_file(config, conf.file_name):
+                # The client has to run the call with its own file.
+                try:
+                    writer.refuse()
+                except ClientDisconnected:
+                    pass
+                return
+            prestourl = PrestoUrl(conf=conf, out=writer,
+                                  cwd=request.get('cwd'))
+            status = 0
+            try:
+                try:
+                    prestourl.run(request['args'])
+                except PrestoCfgException, e:
+                    writer.write("Error: %s \n" % e)
+                    status = 1
+                except ClientDisconnected:
+                    raise
+                except Exception, e:
+                    writer.write("Error: %s: %s\n" % \
+                                 (e.__class__.__name__, e))
+                    status = 1
+                writer.exit(status)
+            except ClientDisconnected:
+                pass
+
+    class Server(SocketServer.ThreadingUnixStreamServer):
+        daemon_threads = True
+
+        def __init__(self, *args, **kwargs):
+            SocketServer.ThreadingUnixStreamServer.__init__(self, *args,
+                                                            **kwargs)
+            self.conf = conf
+            self.lock = threading.Lock()
+
+        def get_config(self):
+            '''
+            Returns the configuration, reloading it if the file changed.
+            '''
+            with self.lock:
+                if self.conf.is_changed():
+                    new_conf = self.conf.__class__()
+                    new_conf.load_from_file(self.conf.file_name)
+                    self.conf = new_conf
+                return self.conf
+
+    umask = os.umask(0077)
+    try:
+        return Server(path, Handler)
+    finally:
+        os.umask(umask)
@@ -0,0 +1,274 @@
+"""
+Downloads of response bodies to files.
+
+The body is written to the file as it arrives. An interrupted download
+is continued with a `Range` request from the end of the file. If the
+server accepts byte ranges, a large body can be split into parts that are
+downloaded concurrently; every part is a request of its own, signed,
+rate limited and retried like any other. The progress of a split
+download is kept next to the file in ``<file>.presto-parts``, so it can
+be resumed too. A part that loses its connection is requested again from
+where it stopped.
+"""
+import os
+import re
+import socket
+import httplib
+import threading
+import simplejson as json
+
+from presto.ratelimit import parse_number
+from presto.utils.exceptions import RequestError, PrestoCfgException
+
+
+CHUNK_SIZE = 1 << 16
+MIN_PART_SIZE = 1 << 20
+# Bytes written by a part between two saves of the progress.
+SAVE_INTERVAL = 4 << 20
+STATE_SUFFIX = '.presto-parts'
+CONTENT_RANGE_RE = re.compile(r'bytes\s+(?:(\d+)-(\d+)|\*)/(\d+|\*)')
+RECOVERABLE_EXCEPTIONS = (socket.error, httplib.HTTPException)
+
+
+def parse_content_range(value):
+    '''
+    Returns ``(start, end, total)`` of a Content-Range header; missing
+    values are None.
+    '''
+    m = CONTENT_RANGE_RE.match((value or '').strip())
+    if m is None:
+        return None, None, None
+    return tuple(parse_number(group, int) for group in m.groups())
+
+
+def get_validator(response):
+    '''
+    Returns a value for If-Range: a strong ETag or Last-Modified.
+    '''
+    etag = response.get('etag')
+    if etag and not etag.startswith('W/'):
+        return etag
+    return response.get('last-modified')
+
+
+class Downloader(object):
+    '''
+    Downloads the body of a GET request to `path`.
+
+    :param prestourl: `PrestoUrl` used to sign and send the requests.
+    :param auth: auth names passed to `PrestoUrl.request`, None to send
+                 requests unsigned.
+    :param resume: continue an interrupted download of `path`.
+    :param offset: download from this byte of the body on, appending to
+                   `path` (``curl -C <offset>``).
+    :param parts: max number of byte ranges downloaded concurrently.
+    :param attempts: max number of requests for a byte range that loses
+                     its connection.
+    '''
+    def __init__(self, prestourl, path, auth=None, resume=False, offset=None,
+                 parts=1, min_part_size=MIN_PART_SIZE, attempts=3,
+                 chunk_size=CHUNK_SIZE):
+        self.prestourl = prestourl
+        self.path = path
+        self.state_path = path + STATE_SUFFIX
+        self.auth = auth
+        self.resume = resume
+        self.offset = offset
+        self.parts = max(int(parts), 1)
+        self.min_part_size = min_part_size
+        self.attempts = attempts
+        self.chunk_size = chunk_size
+        self.state = None
+        self.lock = threading.Lock()
+
+    def request(self, uri, method=u'GET', start=None, end=None,
+                validator=None):
+        headers = {}
+        if start is not None:
+            # Ranges count bytes of the representation as it is stored.
+            headers['Accept-Encoding'] = 'identity'
+            headers['Range'] = 'bytes=%d-%s' % (start,
+                                                '' if end is None else end)
+            if validator:
+                headers['If-Range'] = validator
+        response, _, _ = self.prestourl.request(uri, method, headers=headers,
+                                                auth=self.auth, stream=True)
+        return response
+
+    def run(self, uri):
+        if self.resume and os.path.exists(self.state_path):
+            return self.run_parts(uri, self.load_state())
+        if self.parts > 1 and self.offset is None:
+            state = self.plan(uri)
+            if state is not None:
+                return self.run_parts(uri, state)
+
+        offset = self.offset or 0
+        if self.resume and os.path.exists(self.path):
+            offset = os.path.getsize(self.path)
+        fd = os.open(self.path, os.O_WRONLY | os.O_CREAT, 0666)
+        try:
+            self.fetch(uri, fd, {'start': offset, 'end': None, 'done': 0})
+        finally:
+            os.close(fd)
+
+    def plan(self, uri):
+        '''
+        Asks for the size of the body and returns the state of a split
+        download, or None if the body can't or need not be split.
+        '''
+        response = self.request(uri, u'HEAD', start=0)
+        response.content
+        start, end, size = parse_content_range(response.get('content-range'))
+        if response.status == 200 and \
+                response.get('accept-ranges', '').lower() == 'bytes':
+            size = parse_number(response.get('content-length'), int)
+        elif response.status != 206:
+            return None
+        if not size or size < 2 * self.min_part_size:
+            return None
+
+        count = min(self.parts, size // self.min_part_size)
+        part_size = -(-size // count)
+        return {'url': uri, 'size': size,
+                'validator': get_validator(response),
+                'parts': [{'start': offset,
+                           'end': min(offset + part_size, size) - 1,
+                           'done': 0}
+                          for offset in xrange(0, size, part_size)]}
+
+    def fetch(self, uri, fd, part, validator=None):
+        '''
+        Writes a byte range of the body to `fd`, requesting it again from
+        where it stopped if the connection is lost.
+
+        :param part: dict with `start` and `end` (inclusive, None for the
+                     end of the body) of the range and `done`, the number
+                     of bytes already written.
+        '''
+        whole = part['end'] is None
+        failures = 0
+        while True:
+            offset = part['start'] + part['done']
+            if not whole and offset > part['end']:
+                return
+            ranged = offset > 0 or not whole
+            response = self.request(uri, start=offset if ranged else None,
+                                    end=part['end'], validator=validator)
+
+            if response.status == 416 and whole and offset:
+                response.close()
+                total = parse_content_range(response.get('content-range'))[2]
+                if total == offset:
+                    return
+            if response.status >= 400:
+                response.close()
+                raise RequestError("%s returned %s %s" % \
+                                   (uri, response.status, response.reason))
+            if ranged and response.status != 206:
+                if not whole:
+                    response.close()
+                    raise RequestError("%s changed on the server or does "
+                                       "not accept ranges" % uri)
+                # The server sends the whole body instead.
+                part['start'] = part['done'] = offset = 0
+            elif ranged and parse_content_range(
+                        response.get('content-range'))[0] != offset:
+                response.close()
+                raise RequestError("Unexpected Content-Range %s from %s" % \
+                                   (response.get('content-range'), uri))
+            if whole:
+                os.ftruncate(fd, offset)
+            os.lseek(fd, offset, os.SEEK_SET)
+
+            # httplib ends a body cut off by a closed connection quietly.
+            # Decoded responses have no Content-Length.
+            expected = parse_number(response.get('content-length'), int)
+            try:
+                written = self.copy(response, fd, part)
+                if expected is not None and written < expected:
+                    raise httplib.IncompleteRead('', expected - written)
+            except RECOVERABLE_EXCEPTIONS:
+                response.close()
+                failures += 1
+                resumable = response.status == 206 or \
+                        response.get('accept-ranges', '').lower() == 'bytes'
+                if failures >= self.attempts or not resumable:
+                    raise
+                continue
+            if whole:
+                return
+
+    def copy(self, response, fd, part):
+        '''
+        Writes the body of `response` to `fd`. Returns the number of bytes
+        written.
+        '''
+        started = saved = part['done']
+        for chunk in response.iter_content(self.chunk_size):
+            view = memoryview(chunk)
+            while view:
+                view = view[os.write(fd, view):]
+            part['done'] += len(chunk)
+            if self.state is not None and \
+                    part['done'] - saved >= SAVE_INTERVAL:
+                self.save_state()
+                saved = part['done']
+        return part['done'] - started
+
+    def run_parts(self, uri, state):
+        '''
+        Downloads the parts of a split download concurrently.
+        '''
+        if state['url'] != uri:
+            raise PrestoCfgException("%s is a download of %s, not %s" % \
+                                     (self.path, state['url'], uri))
+        self.state = state
+        fd = os.open(self.path, os.O_WRONLY | os.O_CREAT, 0666)
+        try:
+            if os.fstat(fd).st_size != state['size']:
+                os.ftruncate(fd, state['size'])
+        finally:
+            os.close(fd)
+        self.save_state()
+
+        errors = []
+
+        def worker(part):
+            fd = os.open(self.path, os.O_WRONLY)
+            try:
+                self.fetch(uri, fd, part, state['validator'])
+            except Exception, e:
+                errors.append(e)
+            finally:
+                os.close(fd)
+
+        threads = [threading.Thread(target=worker, args=(part, ))
+                   for part in state['parts']
+                   if part['start'] + part['done'] <= part['end']]
+        for thread in threads:
+            thread.daemon = True
+            thread.start()
+        for thread in threads:
+            while thread.is_alive():
+                thread.join(1)
+
+        if errors:
+            self.save_state()
+            raise errors[0]
+        os.unlink(self.state_path)
+
+    def load_state(self):
+        try:
+            with open(self.state_path) as f:
+                return json.load(f)
+        except (IOError, ValueError), e:
+            raise PrestoCfgException("Can't resume from %s: %s" % \
+                                     (self.state_path, e))
+
+    def save_state(self):
+        with self.lock:
+            temp_path = self.state_path + '.tmp'
+            with open(temp_path, 'w') as f:
+                json.dump(self.state, f)
+            os.rename(temp_path, self.state_path)
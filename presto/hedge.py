@@ -0,0 +1,137 @@
+"""
+Hedged requests.
+
+A hedged request is sent once and, if no response arrives within a delay,
+sent again on another pooled connection. The first response wins and the
+others are closed as soon as they arrive. The delay is a percentile of the
+recent response times of the host, so only the slowest requests are
+duplicated. Hedging is meant for idempotent requests (GET and HEAD).
+"""
+import sys
+import time
+import threading
+import Queue
+from collections import deque
+
+
+HEDGED_METHODS = frozenset(['GET', 'HEAD'])
+
+
+class Hedger(object):
+    '''
+    Sends requests with hedging and keeps response times per host.
+
+    :param percentile: percentile of recent response times used as the
+                       hedging delay.
+    :param max_hedges: max number of extra requests per request.
+    :param initial_delay: delay in seconds used until `min_samples`
+                          response times of a host are known.
+    :param min_delay: lower bound of the delay in seconds.
+    :param window: number of recent response times kept per host.
+    '''
+    def __init__(self, percentile=95, max_hedges=1, initial_delay=0.5,
+                 min_delay=0.005, window=500, min_samples=20):
+        self.percentile = percentile
+        self.max_hedges = max_hedges
+        self.initial_delay = initial_delay
+        self.min_delay = min_delay
+        self.window = window
+        self.min_samples = min_samples
+
+        self.latencies = {}
+        self.lock = threading.Lock()
+        self.requests = 0
+        self.fired = 0
+        self.won = 0
+
+    def get_delay(self, key):
+        '''
+        Returns the hedging delay for requests to `key`.
+        '''
+        with self.lock:
+            latencies = sorted(self.latencies.get(key, ()))
+        if len(latencies) < self.min_samples:
+            return self.initial_delay
+        index = int(len(latencies) * self.percentile / 100.0)
+        return max(latencies[min(index, len(latencies) - 1)],
+                   self.min_delay)
+
+    def record(self, key, latency, fired, won):
+        with self.lock:
+            if key not in self.latencies:
+                self.latencies[key] = deque(maxlen=self.window)
+            self.latencies[key].append(latency)
+            self.requests += 1
+            self.fired += fired
+            self.won += won
+
+    def get_totals(self):
+        '''
+        Returns the number of hedged requests, of extra requests fired and
+        of extra requests that answered first.
+        '''
+        with self.lock:
+            return {'requests': self.requests, 'fired': self.fired,
+                    'won': self.won}
+
+    def call(self, key, send):
+        '''
+        Returns the first response of ``send()`` calls. The response gets
+        `hedges_fired`, the number of extra requests sent, and `hedge_won`,
+        True if an extra request answered first.
+
+        :param key: host the request goes to.
+        :param send: function that signs and sends the request and returns
+                     the response.
+        '''
+        results = Queue.Queue()
+
+        def run(index):
+            started = time.time()
+            try:
+                response = send()
+            except:
+                results.put((index, None, sys.exc_info(), 0))
+            else:
+                results.put((index, response, None, time.time() - started))
+
+        delay = self.get_delay(key)
+        started = errors = 0
+        first_error = None
+        while True:
+            if started == 0 or (results.empty() and
+                                started <= self.max_hedges):
+                thread = threading.Thread(target=run, args=(started, ))
+                thread.daemon = True
+                thread.start()
+                started += 1
+            try:
+                timeout = delay if started <= self.max_hedges else None
+                index, response, exc_info, latency = results.get(
+                                                    timeout=timeout)
+            except Queue.Empty:
+                continue
+            if response is not None:
+                break
+            errors += 1
+            first_error = first_error or exc_info
+            if errors == started and started > self.max_hedges:
+                raise first_error[0], first_error[1], first_error[2]
+
+        pending = started - errors - 1
+        if pending:
+            thread = threading.Thread(target=self.close_losers,
+                                      args=(results, pending))
+            thread.daemon = True
+            thread.start()
+
+        response.hedges_fired = started - 1
+        response.hedge_won = index > 0
+        self.record(key, latency, started - 1, int(index > 0))
+        return response
+
+    def close_losers(self, results, count):
+        for i in range(count):
+            index, response, exc_info, latency = results.get()
+            if response is not None:
+                response.close()
@@ -1,17 +1,25 @@
 import os
+import time
 import simplejson as json
-from oauthlib.oauth1.rfc5849 import SIGNATURE_TYPE_QUERY
 
+from presto.routing import DomainRouter
 from presto.utils.models import Model
-from presto.utils.exceptions import ValidationError
+from presto.utils.snapshot import load_snapshot, write_snapshot
+from presto.utils.journal import (file_lock, make_change, apply_change,
+    journal_path, read_journal_from, append_journal, write_config, compact,
+    get_change_key, get_file_id, COMPACT_THRESHOLD)
+from presto.utils.exceptions import ValidationError, PrestoCfgException
 from presto.utils.fields import (MultipleObjectsField, UrlField, ChoiceField,
     DomainField, FormField, CharField)
 
 
-PRESTO_CONFIG_FILE_NAME = os.path.join(os.getenv("HOME"), ".presto")
+PRESTO_CONFIG_FILE_NAME = os.getenv("PRESTO_CONFIG") or \
+        os.path.join(os.getenv("HOME"), ".presto")
 
 
 class Token(Model):
+    __slots__ = ('rewrite_name', 'secret')
+
     rewrite_name = False
 
     provider = FormField(text='Choose the provider')
@@ -23,6 +31,9 @@ class Token(Model):
     request_tokens = FormField(required=False)
     token_key = CharField()
     token_secret = CharField(required=False)
+    # OAuth 2.0, see `presto.oauth2`
+    refresh_token = CharField(required=False)
+    expires_at = CharField(required=False)
 
     def validate_provider(self, provider):
         return self.parent.get_provider_by_positional_num(provider)
@@ -51,8 +62,16 @@ class Token(Model):
 
     def validate_request_tokens(self, tokens):
         from presto.oauth import get_request_token
+        from presto.oauth2 import OAUTH2, request_token, update_token
         app = self.cleaned_data['app']
         provider = self.cleaned_data['provider']
+        if provider.auth_type == OAUTH2:
+            # The access token needs no verifier, `validate_token_key`
+            # keeps it as it is.
+            tokens = request_token(provider, app, self.refresh_token)
+            update_token(self, tokens, time.time())
+            self.secret = u''
+            return tokens
         return get_request_token(
           app.public_key,
           app.secret_key,
@@ -69,7 +88,10 @@ class Token(Model):
 
     def validate_token_key(self, verifier):
         from presto.oauth import get_access_token
+        from presto.oauth2 import OAUTH2
         provider = self.cleaned_data['provider']
+        if provider.auth_type == OAUTH2:
+            return verifier
         app = self.cleaned_data['app']
         request_tokens = self.cleaned_data['request_tokens']
         token, self.secret = get_access_token(
@@ -144,6 +166,14 @@ class Provider(Model):
     auth_url = UrlField(text="Auth URL")
     apps = MultipleObjectsField(Application)
 
+    # Scope of OAuth 2.0 access tokens, see `presto.oauth2`
+    scope = CharField(required=False)
+
+    # Rate limits, see `presto.ratelimit`
+    rate_limit = CharField(required=False)
+    rate_burst = CharField(required=False)
+    max_concurrency = CharField(required=False)
+
     def validate_name(self, name):
         conf = self.parent
         for provider in conf.providers:
@@ -174,13 +204,36 @@ class Provider(Model):
 
 
 class Configuration(Model):
+    __slots__ = ('_router', 'file_name', 'changes', 'dirty', 'loaded_state',
+                 'file_id', 'journal_offset', 'foreign')
+
     providers = MultipleObjectsField(Provider)
 
+    _router = None
+    file_name = None
+    changes = ()
+    dirty = False
+    loaded_state = None
+    # The version of the file and the part of its journal this instance
+    # has accounted for; `file_id` is None once another process replaced
+    # the file.
+    file_id = None
+    journal_offset = 0
+    # Changes other processes journaled since, not in this instance.
+    foreign = ()
+
     def load_from_file(self, file_name=PRESTO_CONFIG_FILE_NAME):
+        data = None
         if os.path.exists(file_name):
-            f = file(file_name, "r")
-            cfg = f.read()
-            f.close()
+            with file_lock(file_name, shared=True):
+                self.loaded_state = self.get_file_state(file_name)
+                data = load_snapshot(file_name)
+                if data is None:
+                    f = file(file_name, "r")
+                    cfg = f.read()
+                    f.close()
+                changes, journal_offset = read_journal_from(file_name)
+                file_id = get_file_id(file_name)
         else:
             f = file(file_name, "w+")
             f_template = open(os.path.join(os.path.dirname(__file__), 'presto.cfg'))
@@ -188,20 +241,180 @@ class Configuration(Model):
             f_template.close()
             f.write(cfg)
             f.close()
-        if cfg:
-            cfg = json.loads(cfg)
+            changes = []
+            journal_offset = 0
+            file_id = get_file_id(file_name)
+
+        if data is None:
+            if not cfg:
+                raise PrestoCfgException("Empty configuration file")
+            data = json.loads(cfg)
+            write_snapshot(file_name, data, content=cfg)
+
+        for change in changes:
+            apply_change(data, change)
+
+        self.from_dict(data)
+        self.file_name = file_name
+        self.changes = ()
+        self.dirty = False
+        self.file_id = file_id
+        self.journal_offset = journal_offset
+        self.foreign = ()
+
+    def get_file_state(self, file_name=None):
+        '''
+        Returns mtime and size of the configuration file and its journal.
+        '''
+        file_name = file_name or self.file_name
+        state = []
+        for path in (file_name, journal_path(file_name)):
+            try:
+                stat = os.stat(path)
+                state.append((stat.st_mtime, stat.st_size))
+            except OSError:
+                state.append(None)
+        return tuple(state)
+
+    def is_changed(self):
+        '''
+        Returns True if the file was changed since it was loaded.
+        '''
+        return self.file_name is not None and \
+                self.get_file_state() != self.loaded_state
+
+    def from_dict(self, dict):
+        super(Configuration, self).from_dict(dict)
+        self._router = None
+
+    @property
+    def router(self):
+        '''
+        Domain routing index of the providers, built once per load.
+        '''
+        if self._router is None:
+            self._router = DomainRouter(self.providers or ())
+        return self._router
+
+    def get_provider_for_url(self, url):
+        '''
+        Returns provider that serves `url` or None.
+
+        :param url: request URL.
+        '''
+        return self.router.lookup_url(url)
+
+    def add_provider(self, provider):
+        '''
+        Adds `provider` to the configuration.
+        '''
+        self.providers.append(provider)
+        self._router = None
+        self.changes += (make_change(['providers'], provider.to_dict()), )
+
+    def add_app(self, provider, app):
+        '''
+        Adds `app` to `provider`.
+        '''
+        provider.apps.append(app)
+        self.changes += (make_change(['providers', provider.name, 'apps'],
+                                     app.to_dict()), )
+
+    def put_token(self, provider, app, token):
+        '''
+        Adds `token` to `app` or replaces the token with the same name.
+        '''
+        for i, t in enumerate(app.tokens):
+            if t.name == token.name:
+                app.tokens[i] = token
+                break
         else:
-            raise PrestoCfgException("Empty configuration file")
+            app.tokens.append(token)
+        self.changes += (make_change(['providers', provider.name,
+                                      'apps', app.name, 'tokens'],
+                                     token.to_dict()), )
 
-        self.from_dict(cfg)
+    def mark_dirty(self):
+        '''
+        Makes the next `save_to_file` rewrite the whole file. Needed after
+        changing the configuration objects directly.
+        '''
+        self.dirty = True
 
-    def save_to_file(self, filepath=PRESTO_CONFIG_FILE_NAME):
-        conf = self.to_dict()
-        cfg_file = open(filepath, 'w')
-        cfg_json = json.dumps(conf, sort_keys=True, indent=4 * ' ')
-        cfg_json = '\n'.join([l.rstrip() for l in  cfg_json.splitlines()])
-        cfg_file.write(cfg_json)
-        cfg_file.close()
+    def save_to_file(self, filepath=None):
+        '''
+        Saves changes made with `add_provider`, `add_app` and `put_token`.
+
+        Changes are appended to the journal under the file lock and the
+        journal is compacted into the file when it grows. The whole file is
+        rewritten atomically if the configuration is marked dirty or saved
+        to another file. Nothing is written if there are no changes.
+
+        A rewrite keeps the changes other processes journaled since the
+        file was loaded, unless this instance changed the same objects
+        later. If another process replaced the file in the meantime, its
+        changes can't be told apart and `PrestoCfgException` is raised;
+        the configuration has to be loaded again.
+        '''
+        filepath = filepath or self.file_name or PRESTO_CONFIG_FILE_NAME
+        rewrite = self.dirty or filepath != self.file_name or \
+                not os.path.exists(filepath)
+        if not rewrite and not self.changes:
+            return
+
+        own = filepath == self.file_name
+        with file_lock(filepath):
+            if not rewrite:
+                self.collect_foreign()
+                count = append_journal(filepath, self.changes)
+                if self.file_id is not None:
+                    self.journal_offset = \
+                            os.path.getsize(journal_path(filepath))
+                if count >= COMPACT_THRESHOLD:
+                    compact(filepath)
+                    if self.file_id is not None:
+                        self.file_id = get_file_id(filepath)
+                        self.journal_offset = 0
+            else:
+                data = self.to_dict()
+                foreign = ()
+                if own and os.path.exists(filepath):
+                    self.collect_foreign()
+                    if self.file_id is None:
+                        raise PrestoCfgException(
+                            "'%s' was rewritten by another process, load it "
+                            "again and repeat the changes" % filepath)
+                    foreign = self.foreign
+                    for change in foreign:
+                        apply_change(data, change)
+                write_config(filepath, data)
+                if own:
+                    if foreign:
+                        self.from_dict(data)
+                    self.foreign = ()
+                    self.file_id = get_file_id(filepath)
+                    self.journal_offset = 0
+
+        self.changes = ()
+        self.dirty = False
+
+    def collect_foreign(self):
+        '''
+        Adds changes journaled by other processes since the last load or
+        save to `foreign`. Must be called with the exclusive lock held.
+        '''
+        if self.file_id is None:
+            return
+        if get_file_id(self.file_name) != self.file_id:
+            # Their changes were merged into the file.
+            self.file_id = None
+            return
+        changes, self.journal_offset = read_journal_from(self.file_name,
+                                                         self.journal_offset)
+        # Unsaved changes of this instance come later.
+        own = set(get_change_key(change) for change in self.changes)
+        self.foreign = tuple(change for change in self.foreign + tuple(changes)
+                             if get_change_key(change) not in own)
 
     def get_provider_by_positional_num(self, provider):
         if not provider.isdigit():
@@ -222,5 +435,53 @@ class Configuration(Model):
         print ""
 
 
-config = Configuration()
-config.load_from_file()
+class LazyConfiguration(object):
+    '''
+    Configuration handle that reads the file on first access.
+
+    Attribute access is proxied to the underlying `Configuration`, so the
+    handle can be used wherever a loaded configuration is expected. Use
+    `use_file` to choose another file before the first access.
+    '''
+    def __init__(self, file_name=None):
+        object.__setattr__(self, '_file_name', file_name)
+        object.__setattr__(self, '_wrapped', None)
+
+    def use_file(self, file_name):
+        '''
+        Makes the handle read `file_name`. Drops already loaded data.
+
+        :param file_name: path to the configuration file.
+        '''
+        object.__setattr__(self, '_file_name', file_name)
+        object.__setattr__(self, '_wrapped', None)
+
+    def use_config(self, conf):
+        '''
+        Makes the handle proxy already loaded configuration `conf`.
+        '''
+        object.__setattr__(self, '_file_name', conf.file_name)
+        object.__setattr__(self, '_wrapped', conf)
+
+    @property
+    def is_loaded(self):
+        return self._wrapped is not None
+
+    def get_config(self):
+        '''
+        Returns underlying `Configuration`, loading it if necessary.
+        '''
+        if self._wrapped is None:
+            conf = Configuration()
+            conf.load_from_file(self._file_name or PRESTO_CONFIG_FILE_NAME)
+            object.__setattr__(self, '_wrapped', conf)
+        return self._wrapped
+
+    def __getattr__(self, name):
+        return getattr(self.get_config(), name)
+
+    def __setattr__(self, name, value):
+        setattr(self.get_config(), name, value)
+
+
+config = LazyConfiguration()
@@ -1,35 +1,55 @@
+import base64
 import urllib
+import simplejson as json
 from oauthlib.oauth1.rfc5849 import SIGNATURE_TYPE_QUERY, Client
-import httplib2
 import urlparse
+from presto import transport
+from presto.retry import RetryPolicy
+from presto.utils.exceptions import TokenRequestError
+from presto.utils.utils import to_str
 
 
-def get_request_token(public_key, secret_key, url, method=u'POST'):
+def send_signed(client, uri, method, timeout=None, retry=None):
+    '''
+    Signs and sends a token request, signing it again for every retry.
+    '''
+    def send():
+        signed_uri, headers, body = client.sign(uri=uri, http_method=method)
+        return transport.request(signed_uri, method=method, body=body,
+                                 headers=headers, timeout=timeout)
+
+    if retry is None:
+        return send()
+    return retry.call(method, send)
+
+
+def get_request_token(public_key, secret_key, url, method=u'POST',
+                      timeout=None, retry=None):
     '''
     
     :param public_key:
     :param secret_key:
     :param url:
     :param method:
+    :param timeout: socket timeout in seconds.
+    :param retry: `RetryPolicy`; by default only idempotent methods are
+                  retried. A POST may have reached the provider, so pass
+                  ``RetryPolicy(methods=None)`` to retry it anyway.
     '''
     c = Client(
             unicode(public_key),
             unicode(secret_key), 
             signature_type=SIGNATURE_TYPE_QUERY
     )
-    uri, headers, body = c.sign(
-            uri=url, 
-            http_method=method)
-    http = httplib2.Http()
-
-    response, content = httplib2.Http.request(http, uri, 
-            method=method, 
-            body=body,
-            headers=headers
-    )
+    if retry is None:
+        retry = RetryPolicy()
+    response = send_signed(c, url, method, timeout, retry)
+    content = response.content
 
-    if response.get('status') != '200':
-        raise Exception("Invalid request token response: %s." % content)
+    if response.status != 200:
+        raise TokenRequestError(
+                "Invalid request token response: %s." % content,
+                response.status, content)
 
     tokens = dict(urlparse.parse_qsl(content))
     token = tokens.get('oauth_token')
@@ -53,9 +73,12 @@ def build_authorize_url(auth_url, oauth_token, callback_url=None):
 def get_access_token(request_token, request_token_secret, 
                      access_token_url, access_token_method,
                      public_key, secret_key,
-                     verifier):
+                     verifier, timeout=None, retry=None):
     """
     Returns access token and access token secret
+
+    :param retry: `RetryPolicy`; by default only idempotent methods are
+                  retried, since the verifier can be used once.
     """
     c = Client(public_key,
         secret_key,
@@ -65,16 +88,103 @@ def get_access_token(request_token, request_token_secret,
         verifier=verifier
     )
 
-    uri, headers, body =  c.sign(uri=access_token_url, http_method=access_token_method)
-    http = httplib2.Http()
+    if retry is None:
+        retry = RetryPolicy()
+    response = send_signed(c, access_token_url, access_token_method, timeout,
+                           retry)
+    content = response.content
 
-    response, content = httplib2.Http.request(http, uri, method=access_token_method, body=body,
-        headers=headers)
-
-    if response.get('status') != '200':
-        raise Exception("Invalid access token response: %s." % content)
+    if response.status != 200:
+        raise TokenRequestError(
+                "Invalid access token response: %s." % content,
+                response.status, content)
 
     tokens = dict(urlparse.parse_qsl(content))
     access_token = tokens.get('oauth_token')
     access_token_secret = tokens.get('oauth_token_secret')
     return access_token, access_token_secret
+
+
+def request_bearer_token(url, public_key, secret_key, params, timeout=None,
+                         retry=None):
+    '''
+    Sends an OAuth 2.0 token request (RFC 6749) and returns the token
+    response as a dict with `access_token` and, if the provider sent them,
+    `refresh_token`, `expires_in` and `scope`.
+
+    The app authenticates with HTTP Basic auth, see RFC 6749, section
+    2.3.1.
+
+    :param params: grant parameters sent in the form body; empty values
+                   are left out.
+    '''
+    credentials = '%s:%s' % (urllib.quote_plus(to_str(public_key)),
+                             urllib.quote_plus(to_str(secret_key)))
+    headers = {
+        'Authorization': 'Basic %s' % base64.b64encode(credentials),
+        'Content-Type': 'application/x-www-form-urlencoded',
+        'Accept': 'application/json',
+    }
+    body = urllib.urlencode([(k, to_str(v)) for k, v in params if v])
+
+    def send():
+        return transport.request(url, method='POST', body=body,
+                                 headers=headers, timeout=timeout)
+
+    if retry is None:
+        response = send()
+    else:
+        response = retry.call('POST', send)
+    content = response.content
+
+    # Some providers still answer with a form encoded body.
+    media_type = (response.get('content-type') or '').split(';')[0].strip()
+    try:
+        if media_type == 'application/x-www-form-urlencoded':
+            tokens = dict(urlparse.parse_qsl(content))
+        else:
+            tokens = json.loads(content)
+    except ValueError:
+        tokens = None
+
+    if response.status != 200 or not isinstance(tokens, dict) or \
+            not tokens.get('access_token'):
+        raise TokenRequestError(
+                "Invalid access token response: %s." % content,
+                response.status, content)
+    return tokens
+
+
+def get_client_credentials_token(url, public_key, secret_key, scope=None,
+                                 timeout=None, retry=None):
+    '''
+    Returns the token response of the client credentials grant, see
+    `request_bearer_token`.
+
+    :param retry: `RetryPolicy`; by default failed requests are not
+                  retried, since the token request is a POST. Pass
+                  ``RetryPolicy(methods=None)`` to retry it anyway.
+    '''
+    if retry is None:
+        retry = RetryPolicy()
+    return request_bearer_token(url, public_key, secret_key,
+                                [('grant_type', 'client_credentials'),
+                                 ('scope', scope)], timeout, retry)
+
+
+def refresh_access_token(url, public_key, secret_key, refresh_token,
+                         scope=None, timeout=None, retry=None):
+    '''
+    Returns the token response of the refresh token grant, see
+    `request_bearer_token`.
+
+    :param retry: `RetryPolicy`; by default failed requests are not
+                  retried, since the provider may replace the refresh token
+                  and refuse the old one.
+    '''
+    if retry is None:
+        retry = RetryPolicy()
+    return request_bearer_token(url, public_key, secret_key,
+                                [('grant_type', 'refresh_token'),
+                                 ('refresh_token', refresh_token),
+                                 ('scope', scope)], timeout, retry)
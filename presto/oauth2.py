@@ -0,0 +1,320 @@
+"""
+OAuth 2.0 bearer tokens.
+
+Requests to an OAuth2.0 provider carry the access token in an
+``Authorization: Bearer`` header. The access token is kept in `token_key`
+of the token and its expiry time in `expires_at` (a Unix timestamp), so
+later runs reuse it. New access tokens are got with the refresh token
+grant if the token has a `refresh_token`, otherwise with the client
+credentials grant of the app.
+
+A request that finds the access token about to expire starts a refresh in
+a background thread and goes on with the current token. A request waits
+for a token only if there is none yet or it has expired. Refreshes are
+single-flight: one token request is sent however many threads need a new
+token, and the others wait for its result. A process waits for the
+refreshes in progress before it exits, so a new refresh token is not
+lost.
+
+Another process using the same configuration file may have refreshed the
+token already and made the old refresh token invalid. The token saved in
+the file is taken before every refresh and again when the provider
+rejects the refresh token.
+"""
+import os
+import time
+import atexit
+import urllib
+import threading
+from urlparse import urlsplit, urlunsplit
+
+from presto import oauth
+from presto.ratelimit import parse_number
+from presto.utils.exceptions import TokenRequestError
+from presto.utils.utils import to_str
+
+
+OAUTH2 = u'OAuth2.0'
+# Seconds before the expiry when the access token is refreshed, at most
+# half of its lifetime.
+REFRESH_MARGIN = 60
+# Seconds between background refreshes after one failed.
+RETRY_INTERVAL = 10
+TOKEN_FIELDS = ('token_key', 'refresh_token', 'expires_at')
+
+
+def is_bearer(provider, token):
+    '''
+    Returns True if requests with `token` carry a bearer token. Tokens
+    with a secret are OAuth 1.0 tokens, whatever the provider says.
+    '''
+    return provider.auth_type == OAUTH2 and not token.token_secret
+
+
+def request_token(provider, app, refresh_token=None, timeout=None):
+    '''
+    Requests a new access token from the token endpoint of `provider`
+    (its `access_token_url`) and returns the token response.
+    '''
+    if refresh_token:
+        return oauth.refresh_access_token(
+                provider.access_token_url, app.public_key, app.secret_key,
+                refresh_token, provider.scope, timeout)
+    return oauth.get_client_credentials_token(
+            provider.access_token_url, app.public_key, app.secret_key,
+            provider.scope, timeout)
+
+
+def update_token(token, tokens, now):
+    '''
+    Stores the token response `tokens` in `token`. Returns the expiry time
+    of the access token, None if the provider did not tell it.
+    '''
+    expires_in = parse_number(tokens.get('expires_in'))
+    expires_at = None if expires_in is None else int(now + expires_in)
+    token.token_key = unicode(tokens['access_token'])
+    # The provider may keep the refresh token and not send it again.
+    token.refresh_token = unicode(tokens.get('refresh_token') or
+                                  token.refresh_token or '')
+    token.expires_at = u'' if expires_at is None else unicode(expires_at)
+    return expires_at
+
+
+def is_invalid_grant(error):
+    '''
+    Returns True if the token endpoint rejected the grant, e.g. a refresh
+    token that was used already (RFC 6749, section 5.2).
+    '''
+    return error.status == 400 and 'invalid_grant' in (error.content or '')
+
+
+def find_token(conf, key):
+    '''
+    Returns the token of `conf` with the ``(provider, app, token)`` names
+    `key`, None if there is no such token.
+    '''
+    provider_name, app_name, token_name = key
+    for provider in conf.providers or ():
+        if provider.name != provider_name:
+            continue
+        for app in provider.apps or ():
+            if app.name != app_name:
+                continue
+            for token in app.tokens or ():
+                if token.name == token_name:
+                    return token
+    return None
+
+
+class Flight(object):
+    '''
+    A token request in progress.
+    '''
+    def __init__(self):
+        self.done = threading.Event()
+        self.error = None
+
+    def wait(self):
+        # Waits with a timeout, so the main thread can be interrupted.
+        while not self.done.wait(1):
+            pass
+        if self.error is not None:
+            raise self.error
+
+
+class BearerToken(object):
+    '''
+    Keeps the access token of `token` valid.
+
+    :param conf: `Configuration` new access tokens are saved to, None to
+                 keep them in memory only.
+    :param margin: seconds before the expiry when the access token is
+                   refreshed.
+    :param timeout: socket timeout of token requests in seconds.
+    '''
+    def __init__(self, provider, app, token, conf=None, margin=REFRESH_MARGIN,
+                 timeout=None, clock=time.time):
+        self.provider = provider
+        self.app = app
+        self.token = token
+        self.conf = conf
+        self.margin = margin
+        self.timeout = timeout
+        self.clock = clock
+        self.key = (provider.name, app.name, token.name)
+
+        self.lock = threading.Lock()
+        self.flight = None
+        self.failed_at = None
+
+        expires_at = parse_number(token.expires_at)
+        refresh_at = None if expires_at is None else expires_at - margin
+        # Readers take the access token and its times in one go.
+        self.current = (token.token_key or None, expires_at, refresh_at)
+
+    def get_access_token(self):
+        '''
+        Returns a valid access token. Waits for a new one only if there is
+        no access token or it has expired.
+        '''
+        access_token, expires_at, refresh_at = self.current
+        now = self.clock()
+        if access_token and (expires_at is None or now < expires_at):
+            failed_at = self.failed_at
+            if refresh_at is not None and now >= refresh_at and \
+                    (failed_at is None or now - failed_at >= RETRY_INTERVAL):
+                self.refresh(background=True)
+            return access_token
+
+        self.refresh().wait()
+        return self.current[0]
+
+    def refresh(self, background=False):
+        '''
+        Starts a token request unless one is in progress and returns the
+        `Flight` of the request in progress.
+
+        :param background: send the request in a new thread.
+        '''
+        with self.lock:
+            if self.flight is not None:
+                return self.flight
+            flight = self.flight = Flight()
+
+        if background:
+            thread = threading.Thread(target=self.fetch, args=(flight, ))
+            thread.daemon = True
+            thread.start()
+        else:
+            self.fetch(flight)
+        return flight
+
+    def fetch(self, flight):
+        try:
+            now = self.clock()
+            if self.reload() and self.is_fresh(now):
+                expires_at = parse_number(self.token.expires_at)
+            else:
+                tokens = self.request()
+                now = self.clock()
+                expires_at = update_token(self.token, tokens, now)
+                self.save()
+        except Exception, e:
+            flight.error = e
+            self.failed_at = self.clock()
+        else:
+            refresh_at = None
+            if expires_at is not None:
+                refresh_at = expires_at - min(self.margin,
+                                              (expires_at - now) / 2.0)
+            self.current = (self.token.token_key, expires_at, refresh_at)
+            self.failed_at = None
+        finally:
+            with self.lock:
+                self.flight = None
+            flight.done.set()
+
+    def request(self):
+        refresh_token = self.token.refresh_token
+        try:
+            return request_token(self.provider, self.app, refresh_token,
+                                 self.timeout)
+        except TokenRequestError, e:
+            # Another process may have used the refresh token since the
+            # token was reloaded.
+            if not refresh_token or not is_invalid_grant(e) or \
+                    not self.reload() or \
+                    self.token.refresh_token == refresh_token:
+                raise
+        return request_token(self.provider, self.app,
+                             self.token.refresh_token, self.timeout)
+
+    def reload(self):
+        '''
+        Takes the token saved in the configuration file, which another
+        process may have refreshed. Returns True if the token changed.
+        '''
+        if self.conf is None or not self.conf.file_name or \
+                not os.path.exists(self.conf.file_name):
+            return False
+        conf = self.conf.__class__()
+        conf.load_from_file(self.conf.file_name)
+        saved = find_token(conf, self.key)
+        if saved is None or not saved.token_key or \
+                all(getattr(saved, name) == \
+                    getattr(self.token, name) for name in TOKEN_FIELDS):
+            return False
+        for name in TOKEN_FIELDS:
+            setattr(self.token, name, getattr(saved, name))
+        return True
+
+    def is_fresh(self, now):
+        '''
+        Returns True if the access token is valid for more than `margin`
+        seconds.
+        '''
+        expires_at = parse_number(self.token.expires_at)
+        return bool(self.token.token_key) and \
+                (expires_at is None or now < expires_at - self.margin)
+
+    def save(self):
+        if self.conf is None:
+            return
+        with _save_lock:
+            self.conf.put_token(self.provider, self.app, self.token)
+            self.conf.save_to_file()
+
+    def sign(self, uri, headers, body, header=True):
+        '''
+        Adds the access token to the request. Returns ``(uri, headers,
+        body)`` like `presto.signing.SigningContext.sign`.
+
+        :param header: send the access token in the Authorization header,
+                       otherwise in the `access_token` query parameter
+                       (RFC 6750, section 2.3).
+        '''
+        access_token = to_str(self.get_access_token())
+        if header:
+            headers = dict(headers or {})
+            headers['Authorization'] = 'Bearer %s' % access_token
+            return uri, headers, body
+
+        scheme, netloc, path, query, fragment = urlsplit(uri)
+        query = '&'.join(filter(None, [query, urllib.urlencode(
+                                        [('access_token', access_token)])]))
+        return urlunsplit((scheme, netloc, path, query, fragment)), \
+                headers, body
+
+
+_bearer_tokens = {}
+_bearer_tokens_lock = threading.Lock()
+_save_lock = threading.Lock()
+
+
+def get_bearer_token(provider, app, token, conf=None):
+    '''
+    Returns the process-wide `BearerToken` of `token`.
+    '''
+    # The entry keeps `token` alive, so its id is not reused.
+    key = id(token)
+    bearer = _bearer_tokens.get(key)
+    if bearer is None:
+        with _bearer_tokens_lock:
+            bearer = _bearer_tokens.get(key)
+            if bearer is None:
+                bearer = _bearer_tokens[key] = BearerToken(provider, app,
+                                                           token, conf)
+    return bearer
+
+
+def wait_refreshes(timeout=10):
+    '''
+    Waits up to `timeout` seconds for every token request in progress.
+    '''
+    for bearer in _bearer_tokens.values():
+        flight = bearer.flight
+        if flight is not None:
+            flight.done.wait(timeout)
+
+
+atexit.register(wait_refreshes)
@@ -0,0 +1,197 @@
+"""
+Pagination mode of presto-url.
+
+Pages are followed through the ``Link: <...>; rel="next"`` header or
+through a cursor field of the JSON body. Every page request goes through
+`PrestoUrl.request`, so it is signed again. The next page is fetched in
+the background while the current one is written: as soon as the headers
+(for links) or the cursor value of a page are read.
+"""
+import re
+from urllib import urlencode
+from urlparse import urlsplit, urlunsplit, urljoin, parse_qsl
+import simplejson as json
+
+from presto.utils.jsonstream import (Tokenizer, JsonSelector, JsonLines,
+    JsonFormatter, JsonArray, STRING, NUMBER)
+from presto.utils.exceptions import RequestError
+
+
+LINK_RE = re.compile(r'<([^>]*)>\s*((?:;\s*[^,;]*)*)')
+REL_RE = re.compile(r';\s*rel\s*=\s*"?([^";]*)"?')
+CHUNK_SIZE = 1 << 16
+
+
+def parse_link_header(value):
+    '''
+    Returns a dictionary of URLs in a Link header by relation type.
+    '''
+    links = {}
+    for m in LINK_RE.finditer(value or ''):
+        rel = REL_RE.search(m.group(2))
+        if rel:
+            for name in rel.group(1).split():
+                links.setdefault(name.lower(), m.group(1))
+    return links
+
+
+def strip_oauth_params(url):
+    '''
+    Removes OAuth protocol params that the server copied from a signed
+    request into a page URL; the request is signed again.
+    '''
+    scheme, netloc, path, query, fragment = urlsplit(url)
+    params = [(k, v) for k, v in parse_qsl(query, keep_blank_values=True)
+              if not k.startswith('oauth_')]
+    return urlunsplit((scheme, netloc, path, urlencode(params), fragment))
+
+
+def set_query_param(url, name, value):
+    scheme, netloc, path, query, fragment = urlsplit(url)
+    params = [(k, v) for k, v in parse_qsl(query, keep_blank_values=True)
+              if k != name]
+    params.append((name, value))
+    return urlunsplit((scheme, netloc, path, urlencode(params), fragment))
+
+
+def get_page_chunks(response, content):
+    if content is None:
+        return response.iter_content(CHUNK_SIZE)
+    return (content[i:i + CHUNK_SIZE]
+            for i in xrange(0, len(content), CHUNK_SIZE))
+
+
+class Paginator(object):
+    '''
+    Writes values from all pages of a listing to the output of a
+    `PrestoUrl`.
+
+    :param prestourl: `PrestoUrl` used to sign and send the requests.
+    :param select: path expression of the values written from each page,
+                   the whole page by default.
+    :param cursor: path expression of the next page cursor. The next page
+                   URL is the current one with the `cursor_param` query
+                   param set to the cursor, or the cursor itself if it is
+                   a URL. If not set, `Link` headers are followed.
+    :param cursor_param: query param that carries the cursor.
+    :param array: write all values as one JSON array instead of NDJSON.
+    :param max_pages: max number of pages to fetch, unlimited if None.
+    '''
+    def __init__(self, prestourl, method=u'GET', body=None, auth=None,
+                 select=None, cursor=None, cursor_param=u'cursor',
+                 array=False, max_pages=None, colorize=False, pretty=False):
+        self.prestourl = prestourl
+        self.method = method or u'GET'
+        self.body = body
+        self.auth = auth
+        self.select = select or '$'
+        self.cursor = cursor
+        self.cursor_param = cursor_param or u'cursor'
+        self.max_pages = max_pages and int(max_pages)
+
+        out = prestourl.out
+        if colorize or pretty:
+            self.writer = JsonFormatter(out, colorize)
+        else:
+            self.writer = JsonLines(out)
+        if array:
+            self.writer = JsonArray(self.writer)
+
+        self.executor = None
+        self.prefetched = None
+        self.seen = set()
+
+    def fetch(self, url, stream=False):
+        response, content, headers = self.prestourl.request(
+                        url, self.method, self.body, auth=self.auth,
+                        stream=stream)
+        if response.status >= 400:
+            response.close()
+            raise RequestError("Page %s returned %s %s" % \
+                               (url, response.status, response.reason))
+        return response, content
+
+    def prefetch(self, url):
+        '''
+        Starts fetching the page at `url` in the background.
+        '''
+        if self.prefetched is not None:
+            return
+        if self.auth is not None:
+            url = strip_oauth_params(url)
+        if url in self.seen or \
+                (self.max_pages and len(self.seen) >= self.max_pages):
+            return
+        self.seen.add(url)
+        if self.executor is None:
+            from presto.async_client import RequestExecutor
+            self.executor = RequestExecutor(max_workers=1)
+        self.prefetched = url, self.executor.submit(self.fetch, url)
+
+    def get_cursor_url(self, url, tokens):
+        if not tokens:
+            return None
+        kind, text = tokens[0]
+        if kind == STRING:
+            value = json.loads(text).encode('utf-8')
+        elif kind == NUMBER:
+            value = text
+        else:
+            return None
+        if not value:
+            return None
+        if value.startswith(('http://', 'https://', '/')):
+            return urljoin(url, value)
+        return set_query_param(url, self.cursor_param, value)
+
+    def write_page(self, url, response, content):
+        '''
+        Writes the selected values of a page and starts fetching the next
+        one as soon as its URL is known.
+        '''
+        if self.cursor is None:
+            next_url = parse_link_header(response.get('link')).get('next')
+            if next_url:
+                self.prefetch(urljoin(url, next_url))
+
+        tokenizer = Tokenizer()
+        items = JsonSelector(self.select)
+        cursor = self.cursor and JsonSelector(self.cursor)
+        try:
+            for chunk in get_page_chunks(response, content):
+                tokens = tokenizer.feed(chunk)
+                self.writer.write(items.select(tokens))
+                if cursor:
+                    self.prefetch_cursor(url, cursor.select(tokens))
+            tokens = tokenizer.close()
+            self.writer.write(items.select(tokens))
+            if cursor:
+                self.prefetch_cursor(url, cursor.select(tokens))
+        finally:
+            response.close()
+
+    def prefetch_cursor(self, url, tokens):
+        next_url = self.get_cursor_url(url, tokens)
+        if next_url:
+            self.prefetch(next_url)
+
+    def run(self, url):
+        '''
+        Writes values from the page at `url` and all following pages.
+        '''
+        url = url.encode('utf-8') if isinstance(url, unicode) else url
+        self.seen.add(url)
+        response, content = self.fetch(url, stream=True)
+        try:
+            while True:
+                self.write_page(url, response, content)
+                if self.prefetched is None:
+                    break
+                (url, future), self.prefetched = self.prefetched, None
+                response, content = future.result()
+        finally:
+            if self.prefetched is not None:
+                self.prefetched[1].cancel()
+            if self.executor is not None:
+                self.executor.shutdown(wait=False)
+        self.writer.close()
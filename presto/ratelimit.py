@@ -0,0 +1,183 @@
+"""
+Per-provider rate limiting of signed requests.
+
+Every provider gets one `RateLimiter` per process. It is a token bucket
+with an optional limit of concurrent requests, configured by the
+`rate_limit`, `rate_burst` and `max_concurrency` fields of the provider.
+The limiter also follows what the provider reports: `Retry-After` pauses
+all requests, and `X-RateLimit-Remaining` with `X-RateLimit-Reset`
+spreads the remaining quota evenly over the rest of the window; the
+configured rate applies again when the window is over. A concurrency slot
+is held until the body of the response is read or the response is closed.
+"""
+import time
+import threading
+from email.utils import parsedate_tz, mktime_tz
+
+from presto.utils.exceptions import PrestoCfgException
+
+
+# Reset values above this are Unix timestamps, below it seconds from now.
+EPOCH_THRESHOLD = 10 ** 9
+
+
+def parse_number(value, convert=float):
+    try:
+        return convert(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def parse_retry_after(value, now):
+    '''
+    Returns the number of seconds to wait for a Retry-After header, given
+    in seconds or as an HTTP date.
+    '''
+    seconds = parse_number(value)
+    if seconds is None and value:
+        date = parsedate_tz(value)
+        if date is not None:
+            seconds = mktime_tz(date) - now
+    return seconds
+
+
+class RateLimiter(object):
+    '''
+    Token bucket shared by the requests to one provider.
+
+    :param rate: requests per second, unlimited if None.
+    :param burst: max number of requests sent at once after an idle
+                  period, defaults to one second worth of requests.
+    :param concurrency: max number of requests in flight, unlimited if
+                        None.
+    '''
+    def __init__(self, rate=None, burst=None, concurrency=None,
+                 clock=time.time, sleep=time.sleep):
+        self.rate = rate
+        self.burst = burst or max(int(rate or 1), 1)
+        self.current_rate = rate
+        # End of the quota window `current_rate` was set for.
+        self.rate_until = None
+        self.tokens = float(self.burst)
+        self.clock = clock
+        self.sleep = sleep
+        self.updated = clock()
+        self.blocked_until = 0
+        self.lock = threading.Lock()
+        self.semaphore = concurrency and \
+                threading.BoundedSemaphore(concurrency)
+
+    def reserve(self, now):
+        '''
+        Takes a token if there is one. Returns the number of seconds to
+        wait before trying again, 0 if the token was taken.
+        '''
+        if now < self.blocked_until:
+            return self.blocked_until - now
+        if self.rate_until is not None and now >= self.rate_until:
+            self.current_rate = self.rate
+            self.rate_until = None
+        rate = self.current_rate
+        if rate is None:
+            return 0
+        self.tokens = min(self.burst,
+                          self.tokens + (now - self.updated) * rate)
+        self.updated = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0
+        return (1 - self.tokens) / rate
+
+    def acquire(self):
+        '''
+        Waits for a concurrency slot and a token. The slot must be given
+        back with `release`.
+        '''
+        if self.semaphore:
+            self.semaphore.acquire()
+        while True:
+            with self.lock:
+                delay = self.reserve(self.clock())
+            if delay <= 0:
+                return
+            self.sleep(delay)
+
+    def release(self):
+        if self.semaphore:
+            self.semaphore.release()
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.release()
+
+    def observe(self, response):
+        '''
+        Adjusts the limiter to the rate-limit headers of `response`.
+        '''
+        now = self.clock()
+        with self.lock:
+            if response.status in (429, 503):
+                delay = parse_retry_after(response.get('retry-after'), now)
+                if delay is not None:
+                    self.blocked_until = max(self.blocked_until, now + delay)
+                    self.tokens = 0
+
+            remaining = parse_number(response.get('x-ratelimit-remaining'),
+                                     int)
+            reset = parse_number(response.get('x-ratelimit-reset'))
+            if remaining is None or reset is None:
+                return
+            if reset > EPOCH_THRESHOLD:
+                reset -= now
+            window = max(reset, 0.001)
+            if remaining <= 0:
+                self.blocked_until = max(self.blocked_until, now + window)
+                self.tokens = 0
+                return
+
+            rate = remaining / window
+            if self.rate is not None:
+                rate = min(rate, self.rate)
+            self.current_rate = rate
+            self.rate_until = now + window
+            self.tokens = min(self.tokens, remaining)
+
+
+def get_policy(provider):
+    '''
+    Returns ``(rate, burst, concurrency)`` configured for `provider`.
+    '''
+    policy = []
+    for name, convert in (('rate_limit', float), ('rate_burst', int),
+                          ('max_concurrency', int)):
+        value = getattr(provider, name, None)
+        if not value:
+            policy.append(None)
+            continue
+        number = parse_number(value, convert)
+        if number is None or number <= 0:
+            raise PrestoCfgException("Invalid %s '%s' for provider '%s'" % \
+                                     (name, value, provider.name))
+        policy.append(number)
+    return tuple(policy)
+
+
+_limiters = {}
+_limiters_lock = threading.Lock()
+
+
+def get_limiter(provider):
+    '''
+    Returns the process-wide `RateLimiter` of `provider`.
+    '''
+    key = (provider.name, ) + get_policy(provider)
+    limiter = _limiters.get(key)
+    if limiter is None:
+        with _limiters_lock:
+            limiter = _limiters.get(key)
+            if limiter is None:
+                limiter = _limiters[key] = RateLimiter(*key[1:])
+    return limiter
@@ -0,0 +1,105 @@
+"""
+Retries of failed requests.
+
+A `RetryPolicy` calls a function that signs and sends a request until it
+gets a response that is not worth retrying, the attempts run out or the
+time budget is spent. Requests are signed again on every attempt, so each
+one carries a fresh OAuth nonce and timestamp. Waits between attempts grow
+exponentially and are randomized ("full jitter"), so many clients that
+failed at once do not retry in lockstep.
+"""
+import sys
+import time
+import random
+import socket
+import httplib
+
+from presto.ratelimit import parse_retry_after
+
+
+IDEMPOTENT_METHODS = frozenset(['GET', 'HEAD', 'OPTIONS', 'PUT', 'DELETE',
+                                'TRACE'])
+RETRY_STATUSES = frozenset([408, 429, 500, 502, 503, 504])
+RETRY_EXCEPTIONS = (socket.error, httplib.HTTPException)
+
+
+class RetryPolicy(object):
+    '''
+    When and how often to retry a request.
+
+    :param max_attempts: max number of attempts, including the first one.
+    :param statuses: response statuses that are retried.
+    :param exceptions: exception classes that are retried.
+    :param backoff: base wait in seconds; the wait before attempt n is
+                    random between 0 and ``backoff * 2 ** (n - 2)``.
+    :param max_backoff: max wait between two attempts.
+    :param budget: max number of seconds spent on all attempts,
+                   unlimited if None.
+    :param methods: HTTP methods that are retried, all methods if None.
+    '''
+    def __init__(self, max_attempts=3, statuses=RETRY_STATUSES,
+                 exceptions=RETRY_EXCEPTIONS, backoff=0.5, max_backoff=30,
+                 budget=None, methods=IDEMPOTENT_METHODS,
+                 clock=time.time, sleep=time.sleep, random=random.random):
+        self.max_attempts = max_attempts
+        self.statuses = statuses
+        self.exceptions = exceptions
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.budget = budget
+        self.methods = methods
+        self.clock = clock
+        self.sleep = sleep
+        self.random = random
+
+    def get_delay(self, attempt, response=None):
+        '''
+        Returns the wait before the attempt that follows `attempt`. A
+        Retry-After header of `response` is respected.
+        '''
+        delay = self.random() * min(self.max_backoff,
+                                    self.backoff * 2 ** (attempt - 1))
+        if response is not None:
+            retry_after = parse_retry_after(response.get('retry-after'),
+                                            self.clock())
+            if retry_after is not None:
+                delay = max(delay, retry_after)
+        return delay
+
+    def call(self, method, send):
+        '''
+        Returns the response of ``send()``, retrying it as the policy says.
+        The last response is returned even if its status is retryable, and
+        the last exception is raised.
+
+        :param method: HTTP method of the request.
+        :param send: function that signs and sends the request and returns
+                     the response.
+        '''
+        retry_method = self.methods is None or \
+                str(method).upper() in self.methods
+        started = self.clock()
+        attempt = 1
+        while True:
+            last = attempt >= self.max_attempts or not retry_method
+            try:
+                response = send()
+            except self.exceptions:
+                if last:
+                    raise
+                response = None
+                exc_info = sys.exc_info()
+            else:
+                if last or response.status not in self.statuses:
+                    return response
+
+            delay = self.get_delay(attempt, response)
+            if self.budget is not None and \
+                    self.clock() + delay - started > self.budget:
+                if response is None:
+                    raise exc_info[0], exc_info[1], exc_info[2]
+                return response
+            if response is not None:
+                response.close()
+            self.sleep(delay)
+            attempt += 1
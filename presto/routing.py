@@ -0,0 +1,103 @@
+"""
+Domain routing index used by auto-auth to find a provider for a URL.
+"""
+from urlparse import urlparse
+
+
+def split_domains(domain_name):
+    '''
+    Splits comma-separated `domain_name` value of a provider into rules.
+
+    :param domain_name: value of the `Provider.domain_name` field.
+    '''
+    return [rule.strip() for rule in (domain_name or u'').split(',')
+            if rule.strip()]
+
+
+def parse_rule(rule):
+    '''
+    Returns ``(host, path_prefix)`` for a single domain rule.
+
+    Scheme and port are ignored, host is lowercased and path prefix is
+    stored without trailing slash.
+
+    :param rule: domain rule, e.g. ``*.example.com/api``.
+    '''
+    if '://' in rule:
+        rule = rule.split('://', 1)[1]
+    host, _, prefix = rule.partition('/')
+    host = host.split(':', 1)[0].lower().rstrip('.')
+    prefix = prefix.strip('/')
+    return host, prefix and u'/' + prefix or u''
+
+
+def match_prefix(prefix, path):
+    return not prefix or path == prefix or path.startswith(prefix + u'/')
+
+
+class DomainRouter(object):
+    '''
+    Maps host names and optional path prefixes to providers.
+
+    Every rule is a host name (``api.example.com``), a wildcard suffix
+    (``*.example.com``) or either of them followed by a path prefix
+    (``example.com/api/v2``). Exact hosts win over wildcards, longer
+    wildcard suffixes win over shorter ones and, for the same host, the
+    longest matching path prefix wins. On a tie the provider declared first
+    in the configuration is used.
+    '''
+    def __init__(self, providers=()):
+        self.exact = {}
+        self.wildcard = {}
+        for provider in providers:
+            self.add(provider)
+
+    def add(self, provider):
+        '''
+        Adds all domain rules of `provider` to the index.
+        '''
+        for rule in split_domains(provider.domain_name):
+            host, prefix = parse_rule(rule)
+            if host.startswith('*.'):
+                index, host = self.wildcard, host[2:]
+            else:
+                index = self.exact
+            rules = index.setdefault(host, [])
+            rules.append((prefix, provider))
+            # Stable sort keeps configuration order for equal prefixes.
+            rules.sort(key=lambda r: len(r[0]), reverse=True)
+
+    def _match(self, rules, path):
+        for prefix, provider in rules or ():
+            if match_prefix(prefix, path):
+                return provider
+        return None
+
+    def lookup(self, host, path=u''):
+        '''
+        Returns provider for `host` and `path` or None.
+
+        :param host: host name, port is ignored.
+        :param path: request path.
+        '''
+        host = (host or u'').split(':', 1)[0].lower().rstrip('.')
+        path = u'/' + (path or u'').strip('/')
+
+        provider = self._match(self.exact.get(host), path)
+        if provider is not None:
+            return provider
+
+        labels = host.split('.')
+        for i in range(1, len(labels)):
+            provider = self._match(self.wildcard.get('.'.join(labels[i:])),
+                                   path)
+            if provider is not None:
+                return provider
+        return None
+
+    def lookup_url(self, url):
+        '''
+        Returns provider for `url` or None.
+        '''
+        parsed = urlparse(url)
+        return self.lookup(parsed.netloc.rsplit('@', 1)[-1], parsed.path)
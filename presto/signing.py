@@ -0,0 +1,165 @@
+"""
+Reusable OAuth 1.0 HMAC-SHA1 signing contexts.
+
+A context is built once per (app, token) pair. It keeps the HMAC state
+initialised with the signing key, the static protocol parameters and the
+normalized base string URIs it has seen, so signing a request only has to
+collect the request parameters and hash the base string.
+"""
+import hmac
+import time
+import urllib
+import hashlib
+import binascii
+import threading
+from random import SystemRandom
+from urlparse import urlsplit, parse_qsl
+
+from presto.utils.utils import to_str
+
+
+SIGNATURE_TYPE_QUERY = u'QUERY'
+SIGNATURE_TYPE_AUTH_HEADER = u'AUTH_HEADER'
+FORM_CONTENT_TYPE = 'application/x-www-form-urlencoded'
+DEFAULT_PORTS = {'http': '80', 'https': '443'}
+MAX_CACHED_URIS = 1024
+MAX_CACHED_CONTEXTS = 1024
+
+_random = SystemRandom()
+
+
+def escape(value):
+    '''
+    Percent-encodes `value` as required by RFC 5849, section 3.6.
+    '''
+    return urllib.quote(to_str(value), safe='~')
+
+
+def generate_nonce():
+    return str(_random.getrandbits(64)) + str(int(time.time()))
+
+
+def get_header(headers, name):
+    for key, value in (headers or {}).iteritems():
+        if key.lower() == name:
+            return value
+    return None
+
+
+class SigningContext(object):
+    '''
+    Signs requests with one consumer key and access token.
+
+    :param client_key: app public key.
+    :param client_secret: app secret key.
+    :param resource_owner_key: access token key.
+    :param resource_owner_secret: access token secret.
+    :param signature_type: `SIGNATURE_TYPE_QUERY` or
+                           `SIGNATURE_TYPE_AUTH_HEADER`.
+    '''
+    def __init__(self, client_key, client_secret, resource_owner_key=None,
+                 resource_owner_secret=None,
+                 signature_type=SIGNATURE_TYPE_QUERY):
+        self.signature_type = signature_type
+        key = '%s&%s' % (escape(client_secret or ''),
+                         escape(resource_owner_secret or ''))
+        self.hmac = hmac.new(key, digestmod=hashlib.sha1)
+
+        self.oauth_params = [('oauth_version', '1.0'),
+                             ('oauth_signature_method', 'HMAC-SHA1'),
+                             ('oauth_consumer_key', to_str(client_key))]
+        if resource_owner_key:
+            self.oauth_params.append(('oauth_token',
+                                      to_str(resource_owner_key)))
+        self.escaped_oauth_params = [(escape(k), escape(v))
+                                     for k, v in self.oauth_params]
+        self.base_uris = {}
+
+    def get_base_uri(self, scheme, netloc, path):
+        '''
+        Returns the escaped base string URI (RFC 5849, section 3.4.1.2).
+        '''
+        key = (scheme, netloc, path)
+        base_uri = self.base_uris.get(key)
+        if base_uri is None:
+            scheme = scheme.lower()
+            netloc = netloc.lower()
+            if ':' in netloc:
+                host, port = netloc.rsplit(':', 1)
+                if DEFAULT_PORTS.get(scheme) == port:
+                    netloc = host
+            base_uri = escape('%s://%s%s' % (scheme, netloc, path or '/'))
+            if len(self.base_uris) >= MAX_CACHED_URIS:
+                self.base_uris.clear()
+            self.base_uris[key] = base_uri
+        return base_uri
+
+    def get_signature(self, method, base_uri, params):
+        params.sort()
+        normalized = '&'.join('%s=%s' % param for param in params)
+        signature = self.hmac.copy()
+        signature.update('%s&%s&%s' % (to_str(method).upper(), base_uri,
+                                       escape(normalized)))
+        return binascii.b2a_base64(signature.digest())[:-1]
+
+    def sign(self, uri, http_method=u'GET', body=None, headers=None,
+             nonce=None, timestamp=None):
+        '''
+        Signs the request. Returns ``(uri, headers, body)`` like
+        `oauthlib.oauth1.Client.sign`.
+        '''
+        uri = to_str(uri)
+        scheme, netloc, path, query, fragment = urlsplit(uri)
+        headers = dict(headers or {})
+
+        request_oauth = [('oauth_nonce', nonce or generate_nonce()),
+                         ('oauth_timestamp',
+                          timestamp or str(int(time.time())))]
+        params = [(escape(k), escape(v)) for k, v in request_oauth]
+        params.extend(self.escaped_oauth_params)
+        params.extend((escape(k), escape(v))
+                      for k, v in parse_qsl(query, keep_blank_values=True))
+        if body and isinstance(body, basestring) and \
+                (get_header(headers, 'content-type') or '').startswith(
+                                                        FORM_CONTENT_TYPE):
+            params.extend((escape(k), escape(v)) for k, v in
+                          parse_qsl(to_str(body), keep_blank_values=True))
+
+        signature = self.get_signature(http_method,
+                                       self.get_base_uri(scheme, netloc, path),
+                                       params)
+        oauth_params = request_oauth + self.oauth_params + \
+                [('oauth_signature', signature)]
+
+        if self.signature_type == SIGNATURE_TYPE_AUTH_HEADER:
+            headers['Authorization'] = 'OAuth ' + ', '.join(
+                    '%s="%s"' % (escape(k), escape(v)) for k, v in oauth_params)
+        else:
+            query = '&'.join(filter(None, [query, '&'.join('%s=%s' % \
+                    (escape(k), escape(v)) for k, v in oauth_params)]))
+            uri = '%s://%s%s?%s' % (scheme, netloc, path, query)
+            if fragment:
+                uri += '#' + fragment
+        return uri, headers, body
+
+
+_contexts = {}
+_contexts_lock = threading.Lock()
+
+
+def get_signing_context(app, token, signature_type=SIGNATURE_TYPE_QUERY):
+    '''
+    Returns the cached `SigningContext` for `app` and `token`.
+    '''
+    key = (app.public_key, app.secret_key, token.token_key,
+           token.token_secret, signature_type)
+    context = _contexts.get(key)
+    if context is None:
+        context = SigningContext(app.public_key, app.secret_key,
+                                 token.token_key, token.token_secret,
+                                 signature_type)
+        with _contexts_lock:
+            if len(_contexts) >= MAX_CACHED_CONTEXTS:
+                _contexts.clear()
+            _contexts[key] = context
+    return context
@@ -142,6 +142,7 @@ class TestConfigCommands(TestCase):
     @patch("presto.oauth.get_request_token", get_request_token_mock)
     @patch("presto.oauth.build_authorize_url", build_authorize_url_mock)
     @patch("presto.oauth.get_access_token", get_access_token_mock)
+    @patch('presto.models.Configuration.save_to_file')
     @patch('presto.utils.utils.input')
     def test_token_add(self, input_mock, *mocks):
         """
@@ -163,3 +164,28 @@ class TestConfigCommands(TestCase):
 
         self.assertTrue("The token is saved as '%s'" % kwargs['name'] \
                                                     in output, output)
+
+    @patch('presto.models.Configuration.save_to_file')
+    @patch('presto.utils.utils.input')
+    def test_token_add_oauth2(self, input_mock, *mocks):
+        """
+        Tests `token_add` command for an OAuth 2.0 provider.
+        """
+        provider = self.prestocfg.config.providers[1]
+        provider.auth_type = u'OAuth2.0'
+        tokens = {'access_token': 'access', 'refresh_token': 'refresh2',
+                  'expires_in': 3600}
+
+        with patch('presto.oauth.refresh_access_token',
+                   return_value=tokens) as refresh_mock:
+            result, output = intercept_output(self.prestocfg.token_add)(
+                                        '2', '1', 'bearer', 'refresh1')
+        self.assertFalse(input_mock.called)
+        self.assertEqual(refresh_mock.call_args[0][3], 'refresh1')
+        self.assertTrue("The token is saved as 'bearer'" in output, output)
+
+        token = provider.apps[0].tokens[-1]
+        self.assertEqual((token.name, token.token_key, token.token_secret,
+                          token.refresh_token),
+                         ('bearer', 'access', '', 'refresh2'))
+        self.assertTrue(int(token.expires_at) > 0)
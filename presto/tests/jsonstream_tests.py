@@ -0,0 +1,119 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+import time
+import StringIO
+from unittest import TestCase
+import simplejson as json
+from presto.utils.jsonstream import (format_json, select_json, parse_path,
+    Tokenizer, GREEN, RESET)
+from presto.utils.exceptions import JSONStreamError
+
+
+DOCUMENT = '{"a": [1, -2.5e3, true, null, {}], "b": {"c": "x\\"y]"}, "d": []}'
+
+FORMATTED = '''{
+    "a": [
+        1,
+        -2.5e3,
+        true,
+        null,
+        {}
+    ],
+    "b": {
+        "c": "x\\"y]"
+    },
+    "d": []
+}
+'''
+
+
+def format(chunks, colorize=False):
+    out = StringIO.StringIO()
+    format_json(chunks, out, colorize)
+    return out.getvalue()
+
+
+class TestJsonStream(TestCase):
+    """
+    Tests for the incremental JSON formatter.
+    """
+    def test_format(self):
+        self.assertEqual(format([DOCUMENT]), FORMATTED)
+        self.assertEqual(json.loads(format([DOCUMENT])),
+                         json.loads(DOCUMENT))
+
+    def test_format_byte_by_byte(self):
+        self.assertEqual(format(list(DOCUMENT)), FORMATTED)
+
+    def test_numbers_split_between_chunks(self):
+        tokenizer = Tokenizer()
+        self.assertEqual(tokenizer.feed('[12'), [('[', '[')])
+        self.assertEqual(tokenizer.feed('34]'), [('n', '1234'), (']', ']')])
+
+    def test_colorize(self):
+        self.assertTrue(GREEN + '"x"' + RESET in format(['["x"]'], True))
+
+    def test_several_values(self):
+        self.assertEqual(format(['{"a": 1}\n[]\n']),
+                         '{\n    "a": 1\n}\n[]\n')
+
+    def test_invalid(self):
+        self.assertRaises(JSONStreamError, format, ['{"a": 1]'])
+        self.assertRaises(JSONStreamError, format, ['{"a": 1'])
+        self.assertRaises(JSONStreamError, format, ['{"a": x}'])
+        self.assertRaises(JSONStreamError, format, ['"abc'])
+
+    def test_grammar(self):
+        for document in ('[1 2]', '{1: 2}', '{"a"}', '{"a":}', '[,]',
+                         '[1,,2]', '{"a":1,}', '{"a" "b"}', '[1]]', ':',
+                         '{"a": 1 "b": 2}', '["a":1]', '[1,]', '{,}'):
+            self.assertRaises(JSONStreamError, format, [document])
+            self.assertRaises(JSONStreamError, format, list(document))
+
+    def test_unfinished_numbers(self):
+        for number in ('1.', '1e', '1e+', '-', '1.e5'):
+            for document in (number, '[%s]' % number, '{"a":%s}' % number):
+                self.assertRaises(JSONStreamError, format, [document])
+                self.assertRaises(JSONStreamError, format, list(document))
+        self.assertEqual(format(['[1.', '5e', '+', '2]']),
+                         '[\n    1.5e+2\n]\n')
+
+    def test_long_string_split_between_chunks(self):
+        value = 'ab\\"c\\\\' * 200000
+        document = '{"a": ["%s", 1]}' % value
+        chunks = [document[i:i + 1000]
+                  for i in range(0, len(document), 1000)]
+        started = time.time()
+        self.assertEqual(json.loads(format(chunks)), json.loads(document))
+        self.assertTrue(time.time() - started < 5)
+        self.assertEqual(select('a[0]', chunks), '"%s"\n' % value)
+
+
+def select(path, chunks=(DOCUMENT, ), **kwargs):
+    out = StringIO.StringIO()
+    select_json(chunks, out, path, **kwargs)
+    return out.getvalue()
+
+
+class TestJsonSelect(TestCase):
+    """
+    Tests for selecting values from a JSON stream.
+    """
+    def test_parse_path(self):
+        self.assertEqual(parse_path('$'), [])
+        self.assertEqual(parse_path(u"$.a[*]['b c'][2].*"),
+                         ['a', '*', 'b c', 2, '*'])
+        self.assertRaises(JSONStreamError, parse_path, 'a[x]')
+
+    def test_select(self):
+        self.assertEqual(select('$.a[*]'), '1\n-2.5e3\ntrue\nnull\n{}\n')
+        self.assertEqual(select('b.c', list(DOCUMENT)), '"x\\"y]"\n')
+        self.assertEqual(select('$.*[1]'), '-2.5e3\n')
+        self.assertEqual(select('$.missing'), '')
+
+    def test_select_whole_document(self):
+        self.assertEqual(json.loads(select('$')), json.loads(DOCUMENT))
+
+    def test_select_pretty(self):
+        self.assertEqual(select('b', pretty=True), '{\n    "c": "x\\"y]"\n}\n')
@@ -0,0 +1,262 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+import os
+import sys
+import shutil
+import subprocess
+import tempfile
+import simplejson as json
+from unittest import TestCase
+from mock import patch
+from presto.models import Configuration, LazyConfiguration, Provider, Token
+from presto.utils.snapshot import snapshot_path
+from presto.utils.journal import journal_path, read_journal, COMPACT_THRESHOLD
+from presto.utils.exceptions import PrestoCfgException
+
+
+TEST_CONFIG_NAME = os.path.join(os.path.dirname(__file__), 'test_presto.cfg')
+ROOT = os.path.join(os.path.dirname(__file__), '..', '..')
+
+# Adds a token, or rewrites the whole file with `dirty`, in another process.
+OTHER_PROCESS = '''
+import sys
+from presto.models import Configuration, Token
+conf = Configuration()
+conf.load_from_file(sys.argv[1])
+provider = conf.providers[0]
+app = provider.apps[0]
+conf.put_token(provider, app, Token.from_data({'name': sys.argv[2],
+                                               'token_key': 'key'}))
+if sys.argv[3:] == ['dirty']:
+    conf.mark_dirty()
+conf.save_to_file()
+'''
+
+
+class TestLazyConfiguration(TestCase):
+    """
+    Tests for on-demand configuration loading.
+    """
+    @patch('presto.models.Configuration.load_from_file')
+    def test_not_loaded_until_accessed(self, load_mock):
+        conf = LazyConfiguration(TEST_CONFIG_NAME)
+        self.assertFalse(conf.is_loaded)
+        self.assertFalse(load_mock.called)
+
+    def test_loads_on_first_access(self):
+        conf = LazyConfiguration()
+        conf.use_file(TEST_CONFIG_NAME)
+        self.assertEqual([p.name for p in conf.providers],
+                         ['odesk', 'Twitter'])
+        self.assertTrue(conf.is_loaded)
+        self.assertEqual(conf.file_name, TEST_CONFIG_NAME)
+
+    def test_use_config(self):
+        loaded = Configuration()
+        loaded.load_from_file(TEST_CONFIG_NAME)
+        conf = LazyConfiguration()
+        conf.use_config(loaded)
+        self.assertTrue(conf.get_config() is loaded)
+
+
+class TestConfigurationSnapshot(TestCase):
+    """
+    Tests for binary snapshots of the configuration file.
+    """
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.file_name = os.path.join(self.tmp_dir, 'presto.cfg')
+        shutil.copy(TEST_CONFIG_NAME, self.file_name)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def load(self):
+        conf = Configuration()
+        conf.load_from_file(self.file_name)
+        return conf
+
+    def test_snapshot_is_used(self):
+        self.load()
+        self.assertTrue(os.path.exists(snapshot_path(self.file_name)))
+        with patch('simplejson.loads') as loads_mock:
+            conf = self.load()
+        self.assertFalse(loads_mock.called)
+        self.assertEqual(conf.to_dict(), self.load().to_dict())
+
+    def test_snapshot_is_rebuilt_on_change(self):
+        self.load()
+        with open(self.file_name, 'w') as f:
+            json.dump({'providers': []}, f)
+        self.assertEqual(self.load().providers, [])
+
+    def test_touched_file_keeps_snapshot(self):
+        self.load()
+        stat = os.stat(self.file_name)
+        os.utime(self.file_name, (stat.st_atime, stat.st_mtime + 10))
+        with patch('simplejson.loads') as loads_mock:
+            self.load()
+        self.assertFalse(loads_mock.called)
+
+
+class TestModels(TestCase):
+    """
+    Tests for slot based model storage.
+    """
+    def setUp(self):
+        self.config = Configuration()
+        self.config.load_from_file(TEST_CONFIG_NAME)
+
+    def test_values_are_stored_in_slots(self):
+        token = self.config.providers[0].apps[0].tokens[0]
+        self.assertFalse(hasattr(token, '__dict__'))
+        self.assertEqual(token.name, 'default')
+        self.assertEqual(token.provider, '')
+        self.assertFalse(token.rewrite_name)
+
+    def test_repeated_values_are_interned(self):
+        first, second = self.config.providers
+        self.assertTrue(first.auth_type is second.auth_type)
+        self.assertTrue(first.request_token_method is \
+                                        second.access_token_method)
+
+    def test_interned_values_are_bounded(self):
+        from presto.utils import fields
+        saved = dict(fields._interned)
+        fields._interned.clear()
+        try:
+            shared = fields.intern_value(u''.join([u'PO', u'ST']))
+            for i in range(fields.MAX_INTERNED + 10):
+                fields.intern_value(u'value%d' % i)
+            self.assertEqual(len(fields._interned), fields.MAX_INTERNED)
+            self.assertTrue(fields.intern_value(u'POST') is shared)
+            value = u'value%d' % (fields.MAX_INTERNED + 20)
+            self.assertTrue(fields.intern_value(value) is value)
+        finally:
+            fields._interned.clear()
+            fields._interned.update(saved)
+
+    def test_round_trip(self):
+        conf = Configuration()
+        conf.from_dict(self.config.to_dict())
+        self.assertEqual(conf.to_dict(), self.config.to_dict())
+
+    def test_clean_plan(self):
+        plan = dict((p[0], p[2:]) for p in Provider.clean_plan)
+        self.assertFalse('apps' in plan)
+        self.assertEqual(plan['name'], ('validate_name', None, None))
+        self.assertEqual(plan['domain_name'], (None, None, None))
+
+
+class TestJournaledSave(TestCase):
+    """
+    Tests for journaled configuration writes.
+    """
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.file_name = os.path.join(self.tmp_dir, 'presto.cfg')
+        shutil.copy(TEST_CONFIG_NAME, self.file_name)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def load(self):
+        conf = Configuration()
+        conf.load_from_file(self.file_name)
+        return conf
+
+    def add_token(self, conf, name):
+        provider = conf.providers[0]
+        app = provider.apps[0]
+        token = Token.from_data({'name': name, 'token_key': 'key'})
+        conf.put_token(provider, app, token)
+        conf.save_to_file()
+
+    def token_names(self, conf):
+        return [t.name for t in conf.providers[0].apps[0].tokens]
+
+    def test_unchanged_config_is_not_written(self):
+        conf = self.load()
+        with patch('presto.models.write_config') as write_mock:
+            with patch('presto.models.append_journal') as append_mock:
+                conf.save_to_file()
+        self.assertFalse(write_mock.called)
+        self.assertFalse(append_mock.called)
+
+    def test_concurrent_changes_are_kept(self):
+        first, second = self.load(), self.load()
+        self.add_token(first, 'first')
+        self.add_token(second, 'second')
+        self.assertTrue(os.path.exists(journal_path(self.file_name)))
+        self.assertEqual(self.token_names(self.load()),
+                         ['default', 'first', 'second'])
+
+    def test_put_replaces_token(self):
+        conf = self.load()
+        self.add_token(conf, 'default')
+        self.add_token(conf, 'default')
+        self.assertEqual(self.token_names(self.load()), ['default'])
+        self.assertEqual(len(read_journal(self.file_name)), 2)
+
+    def test_journal_is_compacted(self):
+        conf = self.load()
+        for i in range(COMPACT_THRESHOLD):
+            self.add_token(conf, 'token%d' % i)
+        self.assertFalse(os.path.exists(journal_path(self.file_name)))
+        with open(self.file_name) as f:
+            data = json.load(f)
+        tokens = data['providers'][0]['apps'][0]['tokens']
+        self.assertEqual(len(tokens), COMPACT_THRESHOLD + 1)
+
+    def test_torn_record_is_ignored(self):
+        conf = self.load()
+        self.add_token(conf, 'first')
+        with open(journal_path(self.file_name), 'a') as f:
+            f.write('{"path": ["provi')
+        self.add_token(conf, 'second')
+        self.assertEqual(self.token_names(self.load()),
+                         ['default', 'first', 'second'])
+
+    def test_is_changed(self):
+        conf = self.load()
+        self.assertFalse(conf.is_changed())
+        self.add_token(self.load(), 'other')
+        self.assertTrue(conf.is_changed())
+
+    def run_other_process(self, *args):
+        subprocess.check_call([sys.executable, '-c', OTHER_PROCESS,
+                               self.file_name] + list(args),
+                              cwd=os.path.abspath(ROOT))
+
+    def test_rewrite_keeps_changes_of_other_process(self):
+        conf = self.load()
+        self.add_token(conf, 'mine')
+        self.run_other_process('other')
+        conf.providers[0].rate_limit = u'5'
+        conf.mark_dirty()
+        conf.save_to_file()
+        self.assertFalse(os.path.exists(journal_path(self.file_name)))
+
+        loaded = self.load()
+        self.assertEqual(self.token_names(loaded),
+                         ['default', 'mine', 'other'])
+        self.assertEqual(loaded.providers[0].rate_limit, '5')
+        self.assertEqual(self.token_names(conf), ['default', 'mine', 'other'])
+
+    def test_later_own_change_wins(self):
+        conf = self.load()
+        self.run_other_process('default')
+        token = Token.from_data({'name': 'default', 'token_key': 'mine'})
+        conf.put_token(conf.providers[0], conf.providers[0].apps[0], token)
+        conf.mark_dirty()
+        conf.save_to_file()
+        self.assertEqual(self.load().providers[0].apps[0].tokens[0].token_key,
+                         'mine')
+
+    def test_rewrite_after_other_rewrite_fails(self):
+        conf = self.load()
+        self.run_other_process('other', 'dirty')
+        conf.mark_dirty()
+        self.assertRaises(PrestoCfgException, conf.save_to_file)
+        self.assertEqual(self.token_names(self.load()), ['default', 'other'])
@@ -0,0 +1,92 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+from unittest import TestCase
+from presto.models import Provider
+from presto.ratelimit import RateLimiter, get_limiter
+from presto.utils.exceptions import PrestoCfgException
+
+
+class FakeClock(object):
+    def __init__(self):
+        self.now = 1000.0
+        self.sleeps = []
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+
+class FakeResponse(dict):
+    def __init__(self, status=200, **headers):
+        super(FakeResponse, self).__init__(headers)
+        self.status = status
+
+    def close(self):
+        pass
+
+
+class TestRateLimiter(TestCase):
+    """
+    Tests for the per-provider rate limiter.
+    """
+    def setUp(self):
+        self.clock = FakeClock()
+
+    def make_limiter(self, rate=None, burst=None):
+        return RateLimiter(rate, burst, clock=self.clock,
+                           sleep=self.clock.sleep)
+
+    def test_token_bucket(self):
+        limiter = self.make_limiter(rate=2, burst=2)
+        for i in range(4):
+            limiter.acquire()
+        self.assertEqual(self.clock.sleeps, [0.5, 0.5])
+
+    def test_unlimited(self):
+        limiter = self.make_limiter()
+        for i in range(100):
+            limiter.acquire()
+        self.assertEqual(self.clock.sleeps, [])
+
+    def test_retry_after(self):
+        limiter = self.make_limiter()
+        limiter.observe(FakeResponse(429, **{'retry-after': '3'}))
+        limiter.acquire()
+        self.assertEqual(self.clock.sleeps, [3])
+
+    def test_remaining_quota(self):
+        limiter = self.make_limiter(rate=100)
+        limiter.observe(FakeResponse(**{'x-ratelimit-remaining': '10',
+                                        'x-ratelimit-reset': '20'}))
+        self.assertEqual(limiter.current_rate, 0.5)
+
+        self.clock.now = 1500000000.0
+        limiter.observe(FakeResponse(**{'x-ratelimit-remaining': '0',
+                                        'x-ratelimit-reset': '1500000030'}))
+        limiter.acquire()
+        self.assertEqual(self.clock.sleeps, [30])
+
+    def test_rate_recovers_after_window(self):
+        limiter = self.make_limiter(rate=100)
+        limiter.observe(FakeResponse(**{'x-ratelimit-remaining': '10',
+                                        'x-ratelimit-reset': '20'}))
+        self.assertEqual(limiter.current_rate, 0.5)
+        self.clock.now += 20
+        limiter.acquire()
+        self.assertEqual(limiter.current_rate, 100)
+        self.assertEqual(self.clock.sleeps, [])
+
+    def test_provider_policy(self):
+        provider = Provider.from_data({'name': 'p', 'rate_limit': '5',
+                                       'max_concurrency': '2'})
+        limiter = get_limiter(provider)
+        self.assertEqual(limiter.rate, 5)
+        self.assertEqual(limiter.burst, 5)
+        self.assertTrue(get_limiter(provider) is limiter)
+
+        provider.rate_limit = u'fast'
+        self.assertRaises(PrestoCfgException, get_limiter, provider)
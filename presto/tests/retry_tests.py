@@ -0,0 +1,65 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+import socket
+from unittest import TestCase
+from presto.retry import RetryPolicy
+from presto.tests.ratelimit_tests import FakeClock, FakeResponse
+
+
+class Sender(object):
+    def __init__(self, *results):
+        self.results = list(results)
+        self.calls = 0
+
+    def __call__(self):
+        self.calls += 1
+        result = self.results.pop(0)
+        if isinstance(result, Exception):
+            raise result
+        return result
+
+
+class TestRetryPolicy(TestCase):
+    """
+    Tests for retrying failed requests.
+    """
+    def setUp(self):
+        self.clock = FakeClock()
+
+    def make_policy(self, **kwargs):
+        return RetryPolicy(clock=self.clock, sleep=self.clock.sleep,
+                           random=lambda: 1.0, **kwargs)
+
+    def test_retry_status_and_errors(self):
+        send = Sender(FakeResponse(503), socket.error(), FakeResponse(200))
+        response = self.make_policy(max_attempts=3).call('GET', send)
+        self.assertEqual(response.status, 200)
+        self.assertEqual(self.clock.sleeps, [0.5, 1.0])
+
+    def test_last_response_is_returned(self):
+        send = Sender(FakeResponse(502), FakeResponse(502))
+        response = self.make_policy(max_attempts=2).call('GET', send)
+        self.assertEqual(response.status, 502)
+        self.assertEqual(send.calls, 2)
+
+    def test_last_error_is_raised(self):
+        send = Sender(socket.error(), socket.timeout())
+        policy = self.make_policy(max_attempts=2)
+        self.assertRaises(socket.timeout, policy.call, 'GET', send)
+
+    def test_post_is_not_retried(self):
+        send = Sender(FakeResponse(503), FakeResponse(200))
+        self.assertEqual(self.make_policy().call('POST', send).status, 503)
+        send = Sender(FakeResponse(503), FakeResponse(200))
+        policy = self.make_policy(methods=None)
+        self.assertEqual(policy.call('POST', send).status, 200)
+
+    def test_retry_after_and_budget(self):
+        send = Sender(FakeResponse(429, **{'retry-after': '2'}),
+                      FakeResponse(429, **{'retry-after': '20'}),
+                      FakeResponse(200))
+        response = self.make_policy(max_attempts=5, budget=10).call('GET',
+                                                                    send)
+        self.assertEqual(response.status, 429)
+        self.assertEqual(self.clock.sleeps, [2])
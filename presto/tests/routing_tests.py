@@ -0,0 +1,50 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+from unittest import TestCase
+from presto.models import Configuration, Provider
+
+
+def make_provider(name, domain_name):
+    return {'name': name, 'domain_name': domain_name, 'auth_type': 'OAuth1.0'}
+
+
+class TestDomainRouter(TestCase):
+    """
+    Tests for resolving providers by URL.
+    """
+    def setUp(self):
+        self.config = Configuration()
+        self.config.from_dict({'providers': [
+            make_provider('odesk', 'www.odesk.com, odesk.com'),
+            make_provider('wildcard', '*.example.com'),
+            make_provider('api', 'api.example.com'),
+            make_provider('v2', '*.example.com/api/v2'),
+            make_provider('duplicate', 'odesk.com'),
+        ]})
+
+    def lookup(self, url):
+        provider = self.config.get_provider_for_url(url)
+        return provider and provider.name
+
+    def test_comma_separated_domains(self):
+        self.assertEqual(self.lookup('https://www.odesk.com/api/'), 'odesk')
+        self.assertEqual(self.lookup('https://ODESK.com:443/'), 'odesk')
+
+    def test_exact_host_wins_over_wildcard(self):
+        self.assertEqual(self.lookup('http://api.example.com/x'), 'api')
+        self.assertEqual(self.lookup('http://a.b.example.com/x'), 'wildcard')
+        self.assertEqual(self.lookup('http://example.com/x'), None)
+
+    def test_longest_path_prefix(self):
+        self.assertEqual(self.lookup('http://x.example.com/api/v2/jobs'), 'v2')
+        self.assertEqual(self.lookup('http://x.example.com/api/v2'), 'v2')
+        self.assertEqual(self.lookup('http://x.example.com/api/v20'),
+                         'wildcard')
+
+    def test_index_is_reset_on_add(self):
+        self.assertEqual(self.lookup('http://twitter.com/'), None)
+        provider = Provider()
+        provider.from_dict(make_provider('twitter', 'twitter.com'))
+        self.config.add_provider(provider)
+        self.assertEqual(self.lookup('http://twitter.com/'), 'twitter')
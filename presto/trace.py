@@ -0,0 +1,154 @@
+"""
+Timing breakdown of a request.
+
+A `Trace` passed to `PrestoUrl.request` collects how long each phase of
+the request took: the work presto does itself (loading the
+configuration, finding the provider, signing) and the network phases
+measured by `presto.transport` (DNS lookup, TCP connect, TLS handshake,
+sending the request, waiting for the first byte, reading the body). Phases
+of retried or redirected requests are added up. The attempts of a hedged
+request are traced apart and only the one that answered first is added;
+the trace also records how many duplicates were fired, whether one of
+them answered first, and the totals of the `presto.hedge.Hedger`.
+
+`format_write_out` expands curl-style ``-w`` templates from a trace.
+"""
+import re
+import time
+from contextlib import contextmanager
+
+
+PHASES = ('config_load', 'provider_resolution', 'signing', 'dns',
+          'connect', 'tls', 'send', 'ttfb', 'transfer')
+WRITE_OUT_RE = re.compile(r'%\{([a-z_]+)\}|%%|\\[nrt\\]')
+ESCAPES = {'\\n': '\n', '\\r': '\r', '\\t': '\t', '\\\\': '\\', '%%': '%'}
+
+
+class Trace(object):
+    '''
+    Durations of the phases of one request, in seconds.
+    '''
+    def __init__(self, clock=time.time):
+        self.clock = clock
+        self.started = clock()
+        self.finished = None
+        self.durations = dict.fromkeys(PHASES, 0.0)
+        self.url = None
+        self.status = None
+        self.size_download = 0
+        self.connections = 0
+        self.redirects = -1
+        self.hedges_fired = 0
+        self.hedge_won = False
+        self.hedge_totals = None
+
+    def add(self, phase, seconds):
+        self.durations[phase] += seconds
+
+    def merge(self, other):
+        '''
+        Adds the phases, connections and redirects of `other`, the trace of
+        one attempt of the request, and takes its URL and status.
+        '''
+        for phase, seconds in other.durations.iteritems():
+            self.durations[phase] += seconds
+        if other.url is not None:
+            self.url = other.url
+            self.status = other.status
+        self.size_download += other.size_download
+        self.connections += other.connections
+        self.redirects += other.redirects + 1
+
+    def finish(self):
+        if self.finished is None:
+            self.finished = self.clock()
+
+    @property
+    def total(self):
+        return (self.finished or self.clock()) - self.started
+
+    def to_dict(self):
+        result = dict(self.durations)
+        result.update(total=self.total, url=self.url, status=self.status,
+                      size_download=self.size_download,
+                      connections=self.connections,
+                      redirects=max(self.redirects, 0),
+                      hedges_fired=self.hedges_fired,
+                      hedge_won=self.hedge_won)
+        if self.hedge_totals is not None:
+            result['hedge_totals'] = dict(self.hedge_totals)
+        return result
+
+    def get_variables(self):
+        '''
+        Returns the ``-w`` variables. Times are cumulative from the start of
+        the request, like in curl.
+        '''
+        d = self.durations
+        presto = d['config_load'] + d['provider_resolution'] + d['signing']
+        namelookup = presto + d['dns']
+        connect = namelookup + d['connect']
+        pretransfer = connect + d['tls']
+        totals = self.hedge_totals or dict.fromkeys(('requests', 'fired',
+                                                     'won'), 0)
+        return {
+            'url_effective': self.url or '',
+            'http_code': self.status or 0,
+            'size_download': self.size_download,
+            'num_connects': self.connections,
+            'num_redirects': max(self.redirects, 0),
+            'num_hedges': self.hedges_fired,
+            'hedge_won': int(self.hedge_won),
+            'num_hedged_total': totals['requests'],
+            'num_hedges_total': totals['fired'],
+            'num_hedges_won_total': totals['won'],
+            'time_config': d['config_load'],
+            'time_resolve': d['provider_resolution'],
+            'time_sign': d['signing'],
+            'time_presto': presto,
+            'time_namelookup': namelookup,
+            'time_connect': connect,
+            'time_appconnect': pretransfer if d['tls'] else 0.0,
+            'time_pretransfer': pretransfer,
+            'time_starttransfer': pretransfer + d['send'] + d['ttfb'],
+            'time_total': self.total,
+        }
+
+
+@contextmanager
+def measure(trace, phase):
+    '''
+    Adds the duration of the block to `phase` of `trace`, if it is set.
+    '''
+    if trace is None:
+        yield
+        return
+    started = trace.clock()
+    try:
+        yield
+    finally:
+        trace.add(phase, trace.clock() - started)
+
+
+def format_write_out(template, trace):
+    '''
+    Expands ``%{variable}`` and ``\\n``, ``\\t``, ``\\r`` escapes of a
+    curl-style ``-w`` template. ``%{json}`` is the whole trace as JSON.
+    '''
+    variables = trace.get_variables()
+
+    def replace(m):
+        name = m.group(1)
+        if name is None:
+            return ESCAPES[m.group(0)]
+        if name == 'json':
+            import simplejson as json
+            return json.dumps(trace.to_dict(), sort_keys=True)
+        if name not in variables:
+            return m.group(0)
+        value = variables[name]
+        if isinstance(value, float):
+            return '%.6f' % value
+        return unicode(value)
+
+    return WRITE_OUT_RE.sub(replace, template)
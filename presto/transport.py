@@ -0,0 +1,506 @@
+"""
+Process-wide pool of persistent HTTP connections.
+
+All network calls of presto go through `request`. Connections are kept
+alive and reused per (scheme, host, port), idle connections are closed
+after `idle_timeout` seconds and the number of connections to one host is
+limited by `max_per_host`; a request waits at most `wait_timeout` seconds
+for a connection. HTTPS connections share one SSL context, so CA
+certificates are loaded once per process.
+
+Proxies are taken from the ``http_proxy``, ``https_proxy`` and
+``no_proxy`` environment variables. HTTPS requests are tunneled through
+the proxy with CONNECT.
+
+Redirects of GET and HEAD requests are followed, and a 303 answer to
+another method is followed with a GET without the body. A redirect to
+another scheme, host or port is sent without the Authorization and Cookie
+headers.
+
+Bodies with a gzip or deflate Content-Encoding are decoded as they are
+read, see `presto.compression`. The Content-Encoding and Content-Length
+headers of such a response are removed, since they describe the encoded
+body; the encoding is kept in `Response.decoded_from`.
+
+If a `presto.trace.Trace` is given, connections report the time spent on
+DNS lookup, TCP connect and TLS handshake, and responses the time to the
+first byte and the transfer time.
+"""
+import ssl
+import time
+import base64
+import socket
+import urllib
+import httplib
+import threading
+from urlparse import urlsplit, urljoin
+
+from presto.compression import DecodingReader, get_encoding
+from presto.utils.exceptions import RequestTimeout
+from presto.utils.utils import to_str
+
+
+REDIRECT_CODES = (301, 302, 303, 307, 308)
+DEFAULT_PORTS = {'http': 80, 'https': 443}
+# Headers of a body, dropped when a 303 redirect is followed with a GET.
+BODY_HEADERS = frozenset(['content-type', 'content-length',
+                          'content-encoding', 'transfer-encoding'])
+# Headers with credentials, dropped when a redirect leaves the origin.
+CREDENTIAL_HEADERS = frozenset(['authorization', 'cookie'])
+
+
+def get_proxy(scheme, host):
+    '''
+    Returns ``(host, port, authorization)`` of the proxy requests to `host`
+    go through, None if they are sent directly. `authorization` is the
+    Proxy-Authorization header for credentials in the proxy URL, or None.
+    '''
+    proxy = urllib.getproxies().get(scheme)
+    if not proxy or urllib.proxy_bypass(host):
+        return None
+    if '://' not in proxy:
+        proxy = 'http://' + proxy
+    url = urlsplit(proxy)
+    authorization = None
+    if url.username:
+        credentials = '%s:%s' % (urllib.unquote(url.username),
+                                 urllib.unquote(url.password or ''))
+        authorization = 'Basic %s' % base64.b64encode(credentials)
+    return url.hostname, url.port or DEFAULT_PORTS.get(url.scheme, 80), \
+            authorization
+
+
+def open_socket(conn):
+    '''
+    Connects `conn` like `httplib.HTTPConnection.connect`, adding the DNS
+    lookup and TCP connect times to the trace of the connection.
+    '''
+    trace = conn.trace
+    started = trace.clock()
+    addresses = socket.getaddrinfo(conn.host, conn.port, 0,
+                                   socket.SOCK_STREAM)
+    resolved = trace.clock()
+    error = socket.error("getaddrinfo returns an empty list")
+    for family, socktype, proto, canonname, address in addresses:
+        sock = socket.socket(family, socktype, proto)
+        try:
+            if conn.timeout is not socket._GLOBAL_DEFAULT_TIMEOUT:
+                sock.settimeout(conn.timeout)
+            sock.connect(address)
+            break
+        except socket.error, error:
+            sock.close()
+    else:
+        raise error
+    connected = trace.clock()
+    trace.add('dns', resolved - started)
+    trace.add('connect', connected - resolved)
+    trace.connections += 1
+    conn.connect_time += connected - started
+    conn.sock = sock
+
+
+class HTTPConnection(httplib.HTTPConnection):
+    trace = None
+    connect_time = 0
+    # Proxy-Authorization header if the connection goes to a proxy; the
+    # request line then carries the absolute URI.
+    proxy = False
+    proxy_authorization = None
+
+    def connect(self):
+        if self.trace is None:
+            return httplib.HTTPConnection.connect(self)
+        open_socket(self)
+
+
+class HTTPSConnection(httplib.HTTPSConnection):
+    trace = None
+    connect_time = 0
+    # Proxies of HTTPS requests are tunneled, see `set_tunnel`.
+    proxy = False
+
+    def connect(self):
+        if self.trace is None:
+            return httplib.HTTPSConnection.connect(self)
+        open_socket(self)
+        if self._tunnel_host:
+            self._tunnel()
+        started = self.trace.clock()
+        self.sock = self._context.wrap_socket(
+                        self.sock,
+                        server_hostname=self._tunnel_host or self.host)
+        handshake = self.trace.clock() - started
+        self.trace.add('tls', handshake)
+        self.connect_time += handshake
+
+
+def write_request(conn, method, path, body, headers):
+    '''
+    Sends the request line, headers and body. Bodies with `iter_chunks`
+    (see `presto.upload`) are streamed, with chunked transfer encoding if
+    their length is not known.
+    '''
+    if not hasattr(body, 'iter_chunks'):
+        conn.request(method, path, body, headers)
+        return
+
+    names = set(name.lower() for name in headers)
+    conn.putrequest(method, path, skip_host='host' in names,
+                    skip_accept_encoding='accept-encoding' in names)
+    chunked = body.length is None
+    if chunked:
+        conn.putheader('Transfer-Encoding', 'chunked')
+    else:
+        conn.putheader('Content-Length', str(body.length))
+    for name, value in headers.iteritems():
+        conn.putheader(name, value)
+    conn.endheaders()
+    for chunk in body.iter_chunks():
+        if not chunked:
+            conn.send(chunk)
+        elif chunk:
+            conn.send('%x\r\n%s\r\n' % (len(chunk), chunk))
+    if chunked:
+        conn.send('0\r\n\r\n')
+
+
+class Response(dict):
+    '''
+    Response of a pooled connection.
+
+    Works as a dictionary of lowercased response headers with an extra
+    'status' item, like `httplib2.Response`. The body is available as
+    `content` or, for streamed responses, with `read`.
+    '''
+    def __init__(self, pool, key, conn, raw, trace=None):
+        super(Response, self).__init__(raw.getheaders())
+        self.status = raw.status
+        self.reason = raw.reason
+        self.version = raw.version
+        self['status'] = str(raw.status)
+
+        self.pool = pool
+        self.key = key
+        self.conn = conn
+        self.raw = raw
+        self._content = None
+        self.callbacks = []
+        self.decoded_from = get_encoding(self)
+        if self.decoded_from is not None:
+            self.raw = DecodingReader(raw, self.decoded_from)
+            del self['content-encoding']
+            self.pop('content-length', None)
+        self.trace = trace
+        if trace is not None:
+            self.headers_time = trace.clock()
+
+    def read(self, amt=None):
+        '''
+        Reads up to `amt` bytes of the body, or the rest of it. The
+        connection is returned to the pool when the body is read.
+        '''
+        if self.raw is None:
+            return ''
+        data = self.raw.read(amt)
+        if self.trace is not None:
+            self.trace.size_download += len(data)
+        if not data or amt is None or self.raw.isclosed():
+            self.release()
+        return data
+
+    def iter_content(self, chunk_size=1 << 16):
+        '''
+        Yields the body in chunks of at most `chunk_size` bytes.
+        '''
+        while True:
+            chunk = self.read(chunk_size)
+            if not chunk:
+                break
+            yield chunk
+
+    @property
+    def content(self):
+        if self._content is None:
+            self._content = ''.join(self.iter_content())
+        return self._content
+
+    def on_release(self, callback):
+        '''
+        Calls `callback` once the body is read or the response is closed.
+        '''
+        if self.raw is None:
+            callback()
+        else:
+            self.callbacks.append(callback)
+
+    def run_callbacks(self):
+        callbacks, self.callbacks = self.callbacks, []
+        for callback in callbacks:
+            callback()
+
+    def end_transfer(self):
+        if self.trace is not None:
+            self.trace.add('transfer', self.trace.clock() - self.headers_time)
+
+    def release(self):
+        if self.raw is None:
+            return
+        reuse = self.raw.isclosed() and not self.raw.will_close
+        self.raw = None
+        self.end_transfer()
+        self.pool.release(self.key, self.conn, reuse)
+        self.run_callbacks()
+
+    def close(self):
+        '''
+        Drops the rest of the body and closes the connection.
+        '''
+        if self.raw is not None:
+            self.raw.close()
+            self.raw = None
+            self.end_transfer()
+            self.pool.release(self.key, self.conn, False)
+            self.run_callbacks()
+
+
+class ConnectionPool(object):
+    '''
+    Keep-alive connections keyed by (scheme, host, port).
+
+    :param max_per_host: max number of connections to one host.
+    :param idle_timeout: seconds after which idle connections are closed.
+    :param wait_timeout: max seconds a request waits for a connection to a
+                         host with `max_per_host` active connections, no
+                         limit if None.
+    '''
+    def __init__(self, max_per_host=8, idle_timeout=60, wait_timeout=60):
+        self.max_per_host = max_per_host
+        self.idle_timeout = idle_timeout
+        self.wait_timeout = wait_timeout
+
+        self.idle = {}
+        self.active = {}
+        self.condition = threading.Condition()
+        self._ssl_context = None
+
+    @property
+    def ssl_context(self):
+        if self._ssl_context is None:
+            self._ssl_context = ssl.create_default_context()
+        return self._ssl_context
+
+    def make_connection(self, key, timeout):
+        scheme, host, port = key
+        proxy = get_proxy(scheme, host)
+        if proxy is None:
+            if scheme == 'https':
+                return HTTPSConnection(host, port, timeout=timeout,
+                                       context=self.ssl_context)
+            return HTTPConnection(host, port, timeout=timeout)
+
+        proxy_host, proxy_port, authorization = proxy
+        if scheme == 'https':
+            conn = HTTPSConnection(proxy_host, proxy_port, timeout=timeout,
+                                   context=self.ssl_context)
+            conn.set_tunnel(host, port, authorization and
+                            {'Proxy-Authorization': authorization})
+            return conn
+        conn = HTTPConnection(proxy_host, proxy_port, timeout=timeout)
+        conn.proxy = True
+        conn.proxy_authorization = authorization
+        return conn
+
+    def evict_idle(self, now):
+        for key, conns in self.idle.items():
+            while conns and now - conns[0][1] > self.idle_timeout:
+                conns.pop(0)[0].close()
+            if not conns:
+                del self.idle[key]
+
+    def get_connection(self, key, timeout=None):
+        '''
+        Returns ``(connection, reused)`` for `key`, waiting while the host
+        has `max_per_host` active connections. Raises `RequestTimeout` if
+        no connection is free within `wait_timeout` seconds.
+        '''
+        with self.condition:
+            now = time.time()
+            self.evict_idle(now)
+            deadline = None
+            if self.wait_timeout is not None:
+                deadline = now + self.wait_timeout
+            while True:
+                conns = self.idle.get(key)
+                if conns:
+                    conn = conns.pop()[0]
+                    reused = True
+                    break
+                if self.active.get(key, 0) < self.max_per_host:
+                    conn = self.make_connection(key, timeout)
+                    reused = False
+                    break
+                wait = 1
+                if deadline is not None:
+                    wait = min(wait, deadline - time.time())
+                    if wait <= 0:
+                        raise RequestTimeout(
+                            "No free connection to %s:%s within %s s" % \
+                            (key[1], key[2], self.wait_timeout))
+                self.condition.wait(wait)
+            self.active[key] = self.active.get(key, 0) + 1
+
+        if reused and conn.sock is not None:
+            conn.sock.settimeout(timeout)
+        return conn, reused
+
+    def release(self, key, conn, reuse=True):
+        with self.condition:
+            self.active[key] -= 1
+            if reuse and conn.sock is not None:
+                self.idle.setdefault(key, []).append((conn, time.time()))
+            else:
+                conn.close()
+            self.condition.notify()
+
+    def send(self, key, method, path, body, headers, timeout, trace=None):
+        '''
+        Sends one request over a pooled connection and returns the raw
+        response. A reused connection that was closed by the server is
+        replaced with another one.
+        '''
+        while True:
+            conn, reused = self.get_connection(key, timeout)
+            conn.trace = trace
+            if conn.proxy:
+                path, headers = self.get_proxy_request(key, path, headers,
+                                                       conn)
+            try:
+                if trace is None:
+                    write_request(conn, method, path, body, headers)
+                    return conn, conn.getresponse()
+                conn.connect_time = 0
+                started = trace.clock()
+                write_request(conn, method, path, body, headers)
+                sent = trace.clock()
+                raw = conn.getresponse()
+                trace.add('send', sent - started - conn.connect_time)
+                trace.add('ttfb', trace.clock() - sent)
+                return conn, raw
+            except socket.timeout:
+                self.release(key, conn, False)
+                raise
+            except (httplib.BadStatusLine, httplib.CannotSendRequest,
+                    socket.error):
+                self.release(key, conn, False)
+                if not reused or hasattr(body, 'read') or \
+                        not getattr(body, 'replayable', True):
+                    raise
+            except:
+                self.release(key, conn, False)
+                raise
+
+    def get_proxy_request(self, key, path, headers, conn):
+        '''
+        Returns the absolute URI and the headers of a request sent through
+        an HTTP proxy.
+        '''
+        scheme, host, port = key
+        if ':' in host:
+            host = '[%s]' % host
+        if port != DEFAULT_PORTS.get(scheme):
+            host = '%s:%d' % (host, port)
+        if conn.proxy_authorization:
+            headers = dict(headers,
+                           **{'Proxy-Authorization': conn.proxy_authorization})
+        return '%s://%s%s' % (scheme, host, path), headers
+
+    def request(self, uri, method='GET', body=None, headers=None,
+                timeout=None, preload=True, redirections=5, trace=None):
+        '''
+        Sends a request and returns `Response`.
+
+        :param preload: read the body before returning. If False, the
+                        caller must read or close the response.
+        :param redirections: max number of redirects followed for GET and
+                             HEAD requests, and of 303 redirects of other
+                             requests.
+        :param trace: `presto.trace.Trace` that collects timings.
+        '''
+        uri, method = to_str(uri), to_str(method)
+        headers = dict((to_str(k), to_str(v))
+                       for k, v in (headers or {}).iteritems())
+        body = to_str(body)
+
+        while True:
+            url = urlsplit(uri)
+            key = (url.scheme, url.hostname,
+                   url.port or DEFAULT_PORTS.get(url.scheme))
+            path = (url.path or '/') + (url.query and '?' + url.query or '')
+
+            conn, raw = self.send(key, method, path, body, headers, timeout,
+                                  trace)
+            response = Response(self, key, conn, raw, trace)
+            if trace is not None:
+                trace.url = uri
+                trace.status = response.status
+                trace.redirects += 1
+
+            location = response.get('location')
+            if redirections and location and response.status == 303 and \
+                    method not in ('GET', 'HEAD'):
+                # See other: the result is fetched with a GET.
+                method, body = 'GET', None
+                headers = dict((k, v) for k, v in headers.iteritems()
+                               if k.lower() not in BODY_HEADERS)
+            if redirections and location and method in ('GET', 'HEAD') \
+                    and response.status in REDIRECT_CODES:
+                response.content
+                uri = urljoin(uri, location)
+                url = urlsplit(uri)
+                if key != (url.scheme, url.hostname,
+                           url.port or DEFAULT_PORTS.get(url.scheme)):
+                    headers = dict((k, v) for k, v in headers.iteritems()
+                                   if k.lower() not in CREDENTIAL_HEADERS)
+                redirections -= 1
+                continue
+
+            if preload:
+                response.content
+            return response
+
+    def close(self):
+        '''
+        Closes all idle connections.
+        '''
+        with self.condition:
+            for conns in self.idle.values():
+                for conn, last_used in conns:
+                    conn.close()
+            self.idle = {}
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_pool():
+    '''
+    Returns the process-wide `ConnectionPool`.
+    '''
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = ConnectionPool()
+    return _pool
+
+
+def request(uri, method='GET', body=None, headers=None, timeout=None,
+            preload=True, trace=None):
+    '''
+    Sends a request over the process-wide pool. See
+    `ConnectionPool.request`.
+    '''
+    return get_pool().request(uri, method, body, headers, timeout=timeout,
+                              preload=preload, trace=trace)
@@ -0,0 +1,217 @@
+"""
+Request bodies read from files and the standard input.
+
+Bodies are streamed by `presto.transport` instead of being read into
+memory. A regular file is mapped with mmap and handed to the socket
+as is, with a Content-Length, so its data is never copied in Python.
+A pipe has no length and is sent with chunked transfer encoding while it
+is read, one chunk at a time; such a body can be sent only once, and
+commands that send the body many times spool it to a temporary file
+first (`spool_body`).
+`MultipartBody` puts files and fields into a multipart/form-data body of
+known length.
+
+Every body has `length` (None if unknown), `content_type`, `replayable`
+and ``iter_chunks(chunk_size=None)``. It must be closed after use.
+"""
+import os
+import stat
+import mmap
+import uuid
+import tempfile
+import mimetypes
+
+from presto.utils.exceptions import PrestoCfgException
+from presto.utils.utils import to_str
+
+
+CHUNK_SIZE = 1 << 16
+OCTET_STREAM = 'application/octet-stream'
+
+
+class FileBody(object):
+    '''
+    Body with the content of a regular file, mapped into memory.
+
+    :param file: open file object, closed by `close`.
+    '''
+    replayable = True
+
+    def __init__(self, file, content_type=OCTET_STREAM):
+        self.file = file
+        self.content_type = content_type
+        self.length = os.fstat(file.fileno()).st_size
+        self.map = None
+        if self.length:
+            self.map = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def iter_chunks(self, chunk_size=None):
+        '''
+        Yields the content as buffers over the mapped file, in one piece
+        unless `chunk_size` is set.
+        '''
+        if self.map is None:
+            return
+        chunk_size = chunk_size or self.length
+        for offset in xrange(0, self.length, chunk_size):
+            yield buffer(self.map, offset, chunk_size)
+
+    def close(self):
+        if self.map is not None:
+            self.map.close()
+            self.map = None
+        self.file.close()
+
+
+class StreamBody(object):
+    '''
+    Body read from a pipe or another file of unknown length.
+    '''
+    replayable = False
+    length = None
+
+    def __init__(self, file, content_type=OCTET_STREAM):
+        self.file = file
+        self.content_type = content_type
+
+    def iter_chunks(self, chunk_size=None):
+        fd = self.file.fileno()
+        while True:
+            chunk = os.read(fd, chunk_size or CHUNK_SIZE)
+            if not chunk:
+                break
+            yield chunk
+
+    def close(self):
+        self.file.close()
+
+
+def open_body(file, content_type=OCTET_STREAM):
+    '''
+    Returns `FileBody` for a regular file, `StreamBody` otherwise.
+    '''
+    if stat.S_ISREG(os.fstat(file.fileno()).st_mode):
+        return FileBody(file, content_type)
+    return StreamBody(file, content_type)
+
+
+def spool_body(body):
+    '''
+    Returns a replayable body with the content of `body`. A body that can
+    be sent only once is copied to a temporary file and closed.
+    '''
+    if body is None or getattr(body, 'replayable', True):
+        return body
+    spool = tempfile.TemporaryFile()
+    try:
+        for chunk in body.iter_chunks():
+            spool.write(chunk)
+        spool.flush()
+        spool.seek(0)
+        return FileBody(spool, body.content_type)
+    except:
+        spool.close()
+        raise
+    finally:
+        body.close()
+
+
+class MultipartBody(object):
+    '''
+    multipart/form-data body of fields and files.
+
+    :param fields: list of ``(name, value)`` pairs; a value is a string or
+                   a ``(filename, body)`` pair where `body` is a
+                   `FileBody`.
+    '''
+    replayable = True
+
+    def __init__(self, fields, boundary=None):
+        self.boundary = boundary or uuid.uuid4().hex
+        self.content_type = 'multipart/form-data; boundary=%s' % \
+                self.boundary
+        self.parts = []
+        for name, value in fields:
+            disposition = 'Content-Disposition: form-data; name="%s"' % \
+                    to_str(name).replace('"', '%22')
+            if isinstance(value, tuple):
+                filename, body = value
+                head = '%s; filename="%s"\r\nContent-Type: %s' % (
+                        disposition, to_str(filename).replace('"', '%22'),
+                        body.content_type)
+            else:
+                head, body = disposition, to_str(value)
+            self.parts.append(('--%s\r\n%s\r\n\r\n' % (self.boundary, head),
+                               body))
+        self.tail = '--%s--\r\n' % self.boundary
+        self.length = len(self.tail)
+        for head, body in self.parts:
+            self.length += len(head) + self.get_length(body) + 2
+
+    def get_length(self, body):
+        return len(body) if isinstance(body, str) else body.length
+
+    def iter_chunks(self, chunk_size=None):
+        for head, body in self.parts:
+            if isinstance(body, str):
+                yield head + body + '\r\n'
+                continue
+            yield head
+            for chunk in body.iter_chunks(chunk_size):
+                yield chunk
+            yield '\r\n'
+        yield self.tail
+
+    def close(self):
+        for head, body in self.parts:
+            if not isinstance(body, str):
+                body.close()
+
+
+def open_file(path):
+    try:
+        return open(path, 'rb')
+    except IOError, e:
+        raise PrestoCfgException("Can't read '%s': %s" % (path, e.strerror))
+
+
+def get_data_body(data, get_path, stdin):
+    '''
+    Returns the body for a ``-d`` argument: `data` itself, or a streamed
+    body for ``@file`` and ``@-`` (the standard input).
+
+    :param get_path: function that resolves a path given on the command
+                     line.
+    '''
+    if not data or not data.startswith('@'):
+        return data
+    if data == '@-':
+        return open_body(os.fdopen(os.dup(stdin.fileno()), 'rb'))
+    return open_body(open_file(get_path(data[1:])))
+
+
+def get_form_body(fields, get_path):
+    '''
+    Returns `MultipartBody` for ``-F`` arguments: ``name=value`` or
+    ``name=@file``, optionally followed by ``;type=<content type>``.
+    '''
+    parts = []
+    try:
+        for field in fields:
+            name, sep, value = field.partition('=')
+            if not sep:
+                raise PrestoCfgException("Invalid form field '%s'" % field)
+            if not value.startswith('@'):
+                parts.append((name, value))
+                continue
+            path, sep, content_type = value[1:].partition(';type=')
+            content_type = content_type or \
+                    mimetypes.guess_type(path)[0] or OCTET_STREAM
+            body = FileBody(open_file(get_path(path)), content_type)
+            parts.append((name, (os.path.basename(path), body)))
+    except:
+        for name, value in parts:
+            if isinstance(value, tuple):
+                value[1].close()
+        raise
+    return MultipartBody(parts)
@@ -0,0 +1,557 @@
+#!/usr/bin/env python
+# coding: utf-8
+import os
+import sys
+from urlparse import urlparse
+
+from presto import transport
+from presto.ratelimit import get_limiter
+from presto.hedge import HEDGED_METHODS
+from presto.trace import Trace, measure, format_write_out
+from presto.compression import ACCEPT_ENCODING, gzip_body, GzipStream
+from presto.oauth2 import BearerToken, is_bearer, get_bearer_token
+from presto.signing import (get_signing_context, SIGNATURE_TYPE_QUERY,
+    SIGNATURE_TYPE_AUTH_HEADER, FORM_CONTENT_TYPE)
+from presto.utils.exceptions import PrestoCfgException
+
+
+CHUNK_SIZE = 1 << 16
+
+
+def is_json(response):
+    '''
+    Returns True if the response body is JSON.
+    '''
+    content_type = response.get('content-type') or ''
+    media_type = content_type.split(';', 1)[0].strip().lower()
+    return media_type == 'application/json' or media_type.endswith('+json')
+
+
+class PrestoUrl(object):
+    '''
+    Commands for sending requests with presto-url.
+    '''
+    def __init__(self, conf=None, out=None, cwd=None, cache=None,
+                 retry=None, hedge=None, compressed=True,
+                 compress_body=False):
+        if conf is None:
+            from presto.models import config
+            conf = config
+
+        self.config = conf
+        self.out = out or sys.stdout
+        self.cwd = cwd
+        self.cache = cache
+        self.retry = retry
+        self.hedge = hedge
+        self.compressed = compressed
+        self.compress_body = compress_body
+
+    def get_path(self, path):
+        '''
+        Returns `path` given on the command line, relative to `cwd`.
+        '''
+        return os.path.join(self.cwd or os.getcwd(), os.path.expanduser(path))
+
+    def get_credentials(self, uri, provider=None, app=None, token=None):
+        '''
+        Returns credentials used to sign requests to `uri`. See `get_auth`
+        and `make_credentials`.
+        '''
+        return self.make_credentials(*self.get_auth(uri, provider, app,
+                                                    token))
+
+    def make_credentials(self, provider, app, token):
+        '''
+        Returns ``(app, token)`` for OAuth 1.0 tokens and the
+        `presto.oauth2.BearerToken` of `token` for OAuth 2.0 ones.
+        '''
+        if is_bearer(provider, token):
+            return get_bearer_token(provider, app, token, self.config)
+        return app, token
+
+    def get_auth(self, uri, provider=None, app=None, token=None):
+        '''
+        Returns ``(provider, app, token)`` used to sign requests to `uri`.
+
+        :param uri: request URI.
+        :param provider: provider name, found by domain name if not set.
+        :param app: app name, 'default' if not set.
+        :param token: token name, 'default' if not set.
+        '''
+        if provider:
+            auth_provider = self.config.filter("providers", name=provider)
+        else:
+            auth_provider = self.config.get_provider_for_url(uri)
+        if auth_provider is None:
+            raise PrestoCfgException("No provider found for '%s'" % \
+                                     (provider or urlparse(uri).netloc))
+
+        app_name = app or u'default'
+        auth_app = auth_provider.filter('apps', name=app_name)
+        if auth_app is None:
+            raise PrestoCfgException("No app '%s' for provider '%s'" % \
+                                     (app_name, auth_provider.name))
+
+        token_name = token or u'default'
+        auth_token = auth_app.filter('tokens', name=token_name)
+        if auth_token is None:
+            raise PrestoCfgException("No token '%s' for app '%s'" % \
+                                     (token_name, auth_app.name))
+        return auth_provider, auth_app, auth_token
+
+    def sign(self, uri, method, headers, body, credentials,
+             signature_type=None):
+        '''
+        Signs the request with OAuth 1.0 credentials or adds the access
+        token of OAuth 2.0 credentials.
+
+        :param credentials: ``(app, token)`` pair or
+                            `presto.oauth2.BearerToken`, see
+                            `make_credentials`.
+        :param signature_type: `SIGNATURE_TYPE_QUERY` or
+                               `SIGNATURE_TYPE_AUTH_HEADER`; by default
+                               OAuth 1.0 requests are signed in the query
+                               and access tokens are sent in the header.
+        Returns ``(uri, headers, body)``.
+        '''
+        if isinstance(credentials, BearerToken):
+            return credentials.sign(uri, headers, body,
+                                    signature_type != SIGNATURE_TYPE_QUERY)
+        app, token = credentials
+        context = get_signing_context(app, token,
+                                      signature_type or SIGNATURE_TYPE_QUERY)
+        return context.sign(uri, method, body, headers)
+
+    def request(self, uri, method=u'GET', body=None, headers=None,
+                auth=None, timeout=None, stream=False, trace=None):
+        '''
+        Sends the request and returns ``(response, content, headers)``
+        where `headers` are the request headers that were sent.
+
+        :param body: request body, a string or a streamed body from
+                     `presto.upload`.
+        :param auth: None to send the request unsigned, otherwise a dict
+                     with `provider`, `app` and `token` names (any of them
+                     may be None).
+        :param timeout: socket timeout in seconds.
+        :param stream: don't read the body; `content` is None and the
+                       caller must read or close the response.
+        :param trace: `presto.trace.Trace` that collects the timings of the
+                      request.
+
+        Signed requests are rate limited per provider, see
+        `presto.ratelimit`. GET responses are revalidated and served from
+        `cache` if it is set, see `presto.cache.ResponseCache`. Failed
+        requests are signed and sent again as `retry` says, see
+        `presto.retry.RetryPolicy`. GET and HEAD requests are hedged if
+        `hedge` is set, see `presto.hedge.Hedger`. Compressed responses are
+        asked for if `compressed` is set and bodies are gzipped if
+        `compress_body` is set, see `presto.compression`.
+        '''
+        uri = unicode(uri)
+        method = unicode(method.upper())
+        headers = dict(headers or {})
+        if body and 'Content-Type' not in headers:
+            headers['Content-Type'] = getattr(body, 'content_type',
+                                              FORM_CONTENT_TYPE)
+        if self.compressed and 'Accept-Encoding' not in headers:
+            headers['Accept-Encoding'] = ACCEPT_ENCODING
+
+        # Requests are signed over the body as it is, the provider checks
+        # the signature after decoding it.
+        wire_body = body
+        if body and self.compress_body:
+            wire_body = gzip_body(body) if isinstance(body, basestring) \
+                    else GzipStream(body)
+            headers['Content-Encoding'] = 'gzip'
+
+        credentials = limiter = None
+        if auth is not None:
+            if not getattr(self.config, 'is_loaded', True):
+                with measure(trace, 'config_load'):
+                    self.config.get_config()
+            with measure(trace, 'provider_resolution'):
+                auth_provider, app, token = self.get_auth(uri, **auth)
+                credentials = self.make_credentials(auth_provider, app,
+                                                    token)
+            limiter = get_limiter(auth_provider)
+
+        # Access tokens are not in the URI, the cache tells the
+        # credentials apart by their names.
+        vary = None
+        if isinstance(credentials, BearerToken):
+            vary = u' '.join(credentials.key)
+
+        def send(trace=trace):
+            # Hedged attempts run at the same time, each with its own
+            # headers and trace.
+            attempt_headers = dict(headers)
+            if limiter is None:
+                response = self.send(uri, method, wire_body, attempt_headers,
+                                     timeout, trace)
+                response.sent_headers = attempt_headers
+                return response
+            # The concurrency slot is held until the body is read.
+            limiter.acquire()
+            try:
+                with measure(trace, 'signing'):
+                    signed_uri, signed_headers, _ = self.sign(
+                            uri, method, attempt_headers, body, credentials)
+                response = self.send(signed_uri, method, wire_body,
+                                     signed_headers, timeout, trace, vary)
+            except:
+                limiter.release()
+                raise
+            response.on_release(limiter.release)
+            response.sent_headers = signed_headers
+            limiter.observe(response)
+            return response
+
+        # A body read from a pipe can be sent only once.
+        replayable = getattr(body, 'replayable', True)
+        attempt = send
+        if self.hedge is not None and method in HEDGED_METHODS and \
+                replayable:
+            host = urlparse(uri).netloc
+            attempt = lambda: self.hedge.call(host, send)
+            if trace is not None:
+                attempt = lambda: self.hedged_send(host, send, trace)
+
+        if self.retry is not None and replayable:
+            response = self.retry.call(method, attempt)
+        else:
+            response = attempt()
+        if trace is not None and hasattr(response, 'hedges_fired'):
+            trace.hedges_fired = response.hedges_fired
+            trace.hedge_won = response.hedge_won
+            trace.hedge_totals = self.hedge.get_totals()
+        if stream:
+            return response, None, response.sent_headers
+        return response, response.content, response.sent_headers
+
+    def hedged_send(self, host, send, trace):
+        '''
+        Sends a hedged request, every attempt with a trace of its own, and
+        adds the trace of the attempt that answered first to `trace`.
+        '''
+        def traced_send():
+            attempt_trace = Trace(trace.clock)
+            response = send(attempt_trace)
+            response.attempt_trace = attempt_trace
+            return response
+
+        response = self.hedge.call(host, traced_send)
+        trace.merge(response.attempt_trace)
+        # The body is read later, its transfer time goes to `trace`.
+        if getattr(response, 'trace', None) is response.attempt_trace:
+            response.trace = trace
+        return response
+
+    def send(self, uri, method, body, headers, timeout=None, trace=None,
+             vary=None):
+        '''
+        Sends a prepared request, through `cache` if it is set, and returns
+        the streamed response.
+
+        :param vary: see `presto.cache.get_cache_key`.
+        '''
+        def send(headers):
+            return transport.request(uri, method, body, headers,
+                                     timeout=timeout, preload=False,
+                                     trace=trace)
+
+        if self.cache is not None:
+            return self.cache.request(send, method, uri, headers, vary)
+        return send(headers)
+
+    def print_headers(self, headers, colorize=False, pretty=False):
+        if colorize or pretty:
+            import simplejson as json
+            from presto.utils.jsonstream import format_json
+            format_json([json.dumps(dict(headers), sort_keys=True)],
+                        self.out, colorize)
+        else:
+            for i in headers:
+                self.out.write("%s: %s\n" % (i.title(), headers[i]))
+
+    def print_content(self, response, colorize=False, pretty=False,
+                      select=None, chunk_size=CHUNK_SIZE):
+        '''
+        Pretty-prints the JSON body of a streamed `response` as it arrives.
+
+        :param select: path expression; only the matching values are
+                       printed, see `presto.utils.jsonstream.parse_path`.
+        '''
+        from presto.utils.jsonstream import format_json, select_json
+        chunks = response.iter_content(chunk_size)
+        try:
+            if select:
+                select_json(chunks, self.out, select, colorize, pretty)
+            else:
+                format_json(chunks, self.out, colorize)
+        finally:
+            response.close()
+
+    def copy_content(self, response, chunk_size=CHUNK_SIZE):
+        '''
+        Copies the body of a streamed `response` to the output as it
+        arrives, holding at most `chunk_size` bytes at a time. If the
+        output is a file, chunks are written to its descriptor directly.
+        '''
+        out = self.out
+        out.flush()
+        try:
+            fd = out.fileno()
+        except (AttributeError, IOError, ValueError):
+            fd = None
+
+        try:
+            for chunk in response.iter_content(chunk_size):
+                if fd is None:
+                    out.write(chunk)
+                    continue
+                view = memoryview(chunk)
+                while view:
+                    view = view[os.write(fd, view):]
+        finally:
+            response.close()
+
+    def url(self, uri, method=None, body=None, auth=None,
+            include=False, head=False, colorize=False, pretty=False,
+            select=None, write_out=None, trace_json=None):
+        '''
+        Sends a single request and prints the response.
+
+        :param include: print request headers too.
+        :param head: print response headers only.
+        :param select: print only values of the JSON body matching this
+                       path expression.
+        :param write_out: curl-style template printed after the response,
+                          see `presto.trace.format_write_out`.
+        :param trace_json: file the timings of the request are written to
+                           as JSON, '-' for the output.
+        '''
+        trace = Trace() if write_out or trace_json else None
+        response, content, headers = self.request(uri, method or u'GET',
+                                                  body, auth=auth,
+                                                  stream=True, trace=trace)
+        if include and headers:
+            self.print_headers(headers, colorize, pretty)
+
+        if head:
+            response.close()
+            self.print_headers(response, colorize, pretty)
+        elif select or (colorize or pretty) and is_json(response):
+            self.print_content(response, colorize, pretty, select)
+        else:
+            self.copy_content(response)
+
+        if trace is not None:
+            self.write_trace(trace, write_out, trace_json)
+
+    def write_trace(self, trace, write_out=None, trace_json=None):
+        '''
+        Prints the timings of a finished request.
+        '''
+        trace.finish()
+        if write_out:
+            self.out.write(format_write_out(write_out, trace).encode('utf-8'))
+        if trace_json:
+            import simplejson as json
+            data = json.dumps(trace.to_dict(), sort_keys=True) + '\n'
+            if trace_json == '-':
+                self.out.write(data)
+            else:
+                with open(self.get_path(trace_json), 'w') as f:
+                    f.write(data)
+
+    def paginate(self, uri, method=None, body=None, auth=None, **kwargs):
+        '''
+        Follows next-page links or cursors from `uri` and writes values from
+        all pages as NDJSON or one JSON array. See `presto.paginate`.
+        '''
+        from presto.paginate import Paginator
+        Paginator(self, method, body, auth, **kwargs).run(uri)
+
+    def download(self, uri, path, auth=None, **kwargs):
+        '''
+        Downloads the body of a GET request to `path`. See
+        `presto.download.Downloader`.
+        '''
+        from presto.download import Downloader
+        Downloader(self, self.get_path(path), auth, **kwargs).run(uri)
+
+    def bench(self, uri, method=None, body=None, auth=None, **kwargs):
+        '''
+        Sends the request repeatedly and prints throughput, latency
+        percentiles and status codes. See `presto.bench.Benchmark`.
+        '''
+        from presto.bench import Benchmark
+        benchmark = Benchmark(self, auth=auth, **kwargs)
+        benchmark.run(uri, method or u'GET', body)
+        benchmark.write_report(self.out)
+
+    def batch(self, specs, method=None, body=None, auth=None,
+              workers=8, per_host=4, ordered=False):
+        '''
+        Sends requests described by `specs` concurrently and writes results
+        as NDJSON. See `presto.batch`.
+
+        :param specs: iterable of lines with request specs.
+        '''
+        from presto.batch import BatchRunner, read_specs
+        runner = BatchRunner(self, workers=workers, per_host=per_host,
+                             ordered=ordered, auth=auth)
+        runner.run(read_specs(specs, method=method, body=body))
+
+    def sign_only(self, specs, method=None, body=None, auth=None,
+                  header=False):
+        '''
+        Signs requests without sending them. Writes a presigned URL per
+        request or, if `header` is set, a JSON object with the URL and the
+        Authorization header.
+
+        :param specs: iterable of lines with request specs, see
+                      `presto.batch.read_specs`.
+        '''
+        import simplejson as json
+        from presto.batch import read_specs
+
+        auth = auth or {}
+        signature_type = SIGNATURE_TYPE_AUTH_HEADER if header \
+                                                else SIGNATURE_TYPE_QUERY
+        write = self.out.write
+        for spec in read_specs(specs, method=method, body=body):
+            if 'error' in spec:
+                raise PrestoCfgException(spec['error'])
+            headers = spec['headers']
+            if spec['body'] and 'Content-Type' not in headers:
+                headers['Content-Type'] = FORM_CONTENT_TYPE
+            credentials = self.get_credentials(spec['url'], **auth)
+            uri, headers, _ = self.sign(spec['url'], spec['method'],
+                                        headers, spec['body'],
+                                        credentials, signature_type)
+            if header:
+                write(json.dumps({'url': uri, 'method': spec['method'],
+                        'headers': {'Authorization': \
+                                        headers['Authorization']}}) + '\n')
+            else:
+                write(uri + '\n')
+
+    def run(self, args, stdin=None):
+        '''
+        Runs presto-url with parsed command line `args`.
+
+        :param args: arguments parsed by docopt.
+        :param stdin: standard input, if available.
+        '''
+        auth = None
+        if args['-a']:
+            auth = dict(provider=args['--auth-provider'],
+                        app=args['--auth-app'],
+                        token=args['--auth-token'])
+
+        if args['--cache']:
+            from presto.cache import ResponseCache
+            self.cache = ResponseCache(self.get_path(args['--cache-dir'])
+                                       if args['--cache-dir'] else None,
+                                       int(args['--cache-size']) << 20)
+
+        if int(args['--retry']):
+            from presto.retry import RetryPolicy, IDEMPOTENT_METHODS
+            max_time = args['--retry-max-time']
+            self.retry = RetryPolicy(
+                    max_attempts=int(args['--retry']) + 1,
+                    backoff=float(args['--retry-delay']),
+                    budget=float(max_time) if max_time else None,
+                    methods=None if args['--retry-all-methods'] \
+                                else IDEMPOTENT_METHODS)
+
+        self.compressed = not args['--no-compressed']
+        self.compress_body = args['--gzip-body']
+
+        if args['--hedge']:
+            from presto.hedge import Hedger
+            self.hedge = Hedger(percentile=float(args['--hedge-percentile']),
+                                max_hedges=int(args['--hedge-max']))
+
+        if args['--batch'] == '-' and args['-d'] == '@-':
+            raise PrestoCfgException(
+                    "--batch - and -d @- can't both read the standard input")
+        if args['-o']:
+            ignored = [name for name in ('-d', '-F', '-i', '-I',
+                                         '--write-out', '--trace-json')
+                       if args[name]]
+            if (args['--request'] or u'GET').upper() != u'GET':
+                ignored.insert(0, '-X')
+            if ignored:
+                raise PrestoCfgException(
+                        "-o downloads with a GET request and can't be used "
+                        "with %s" % ', '.join(ignored))
+        specs = None
+        if args['--batch'] == '-':
+            specs = stdin or sys.stdin
+        elif args['--batch']:
+            specs = open(self.get_path(args['--batch']))
+
+        body = self.get_body(args, stdin)
+        if args['--sign-only'] or args['--paginate'] or args['--bench'] or \
+                specs is not None:
+            # These send the body many times.
+            from presto.upload import spool_body
+            body = spool_body(body)
+        try:
+            if args['--sign-only']:
+                self.sign_only(specs or [args['<url>']], args['--request'],
+                               body, auth, header=args['--sign-header'])
+            elif args['--paginate']:
+                self.paginate(args['<url>'], args['--request'], body, auth,
+                              select=args['--select'],
+                              cursor=args['--cursor'],
+                              cursor_param=args['--cursor-param'],
+                              array=args['--array'],
+                              max_pages=args['--max-pages'],
+                              colorize=args['-c'], pretty=args['-p'])
+            elif args['--bench']:
+                duration, rate = args['--duration'], args['--rate']
+                self.bench(args['<url>'], args['--request'], body, auth,
+                           count=args['--count'] and int(args['--count']),
+                           duration=duration and float(duration),
+                           concurrency=int(args['--concurrency']),
+                           rate=rate and float(rate))
+            elif args['-o']:
+                resume = args['-C'] == '-'
+                if args['-C'] and not resume and not args['-C'].isdigit():
+                    raise PrestoCfgException("-C takes '-' or a byte offset")
+                self.download(args['<url>'], args['-o'], auth, resume=resume,
+                              offset=None if resume or not args['-C']
+                                          else int(args['-C']),
+                              parts=int(args['--parts']))
+            elif specs is not None:
+                self.batch(specs, args['--request'], body, auth,
+                           workers=args['--workers'],
+                           per_host=args['--per-host'],
+                           ordered=args['--ordered'])
+            else:
+                self.url(args['<url>'], args['--request'], body, auth,
+                         include=args['-i'], head=args['-I'],
+                         colorize=args['-c'], pretty=args['-p'],
+                         select=args['--select'],
+                         write_out=args['--write-out'],
+                         trace_json=args['--trace-json'])
+        finally:
+            if hasattr(body, 'close'):
+                body.close()
+
+    def get_body(self, args, stdin=None):
+        '''
+        Returns the request body given by ``-d`` or ``-F``, see
+        `presto.upload`.
+        '''
+        from presto.upload import get_data_body, get_form_body
+        if args['-F']:
+            if args['-d']:
+                raise PrestoCfgException("-d and -F can't be used together")
+            return get_form_body(args['-F'], self.get_path)
+        return get_data_body(args['-d'], self.get_path, stdin or sys.stdin)
@@ -9,3 +9,29 @@ class AlreadyExist(ValidationError):
 
 class PrestoCfgException(Exception):
     pass
+
+
+class RequestError(Exception):
+    pass
+
+
+class RequestTimeout(RequestError):
+    pass
+
+
+class RequestCancelled(RequestError):
+    pass
+
+
+class JSONStreamError(ValueError):
+    pass
+
+
+class TokenRequestError(RequestError):
+    '''
+    Raised when an OAuth token endpoint does not return a token.
+    '''
+    def __init__(self, message, status=None, content=None):
+        super(TokenRequestError, self).__init__(message)
+        self.status = status
+        self.content = content
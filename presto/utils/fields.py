@@ -2,14 +2,40 @@ from presto.utils.utils import output
 from presto.utils.exceptions import ValidationError, AlreadyExist
 
 
+# Values are unicode, which the intern() builtin and weak references don't
+# take, so the table is bounded instead. Once it is full, new values are
+# kept as they are.
+MAX_INTERNED = 1024
+_interned = {}
+
+
+def intern_value(value):
+    '''
+    Returns the shared copy of `value`. Used for values that repeat in
+    every model instance, e.g. HTTP methods or auth types.
+    '''
+    shared = _interned.get(value)
+    if shared is not None:
+        return shared
+    if len(_interned) >= MAX_INTERNED:
+        return value
+    return _interned.setdefault(value, value)
+
+
 class Field(object):
+    '''
+    Field declaration of a Model.
+
+    Fields are shared by all instances of a model class and keep no
+    per-instance state; values are stored in the model instance slots.
+    '''
     creation_counter = 0
     auto_creation_counter = -1
     DEFAULT_VALUE = None
+    interned = False
 
     def __init__(self, value=None, required=True,
                  text=None, default=''):
-        self.value = value
         self.required = required
 
         self.text = text
@@ -17,46 +43,48 @@ class Field(object):
 
         self.creation_counter = Field.creation_counter
         Field.creation_counter += 1
-        self.validation_func = None
 
-    def set_value(self, value, **kwargs):
-        self._val = unicode(value or '').strip()
+    def to_python(self, value, parent=None):
+        '''
+        Converts raw `value` to the value stored in a model instance.
 
-    def get_value(self):
-        if not hasattr(self, '_val'):
-            self._val = self.DEFAULT_VALUE
-        return self._val
-
-    value = property(get_value, set_value)
+        :param value: raw value, e.g. from the configuration file.
+        :param parent: model instance the value belongs to.
+        '''
+        value = unicode(value or '').strip()
+        if self.interned:
+            value = intern_value(value)
+        return value
 
-    def clean(self, validation_func=None, 
+    def clean(self, value, validation_func=None,
                     text_func=None, **kwargs):
-        self.validation_func = validation_func
         try:
-            if self.required and not self.value:
+            if self.required and not value:
                 raise ValidationError('Field is required.')
 
-            return self.validate(self.value)
+            return self.validate(value, validation_func)
         except (ValidationError, AlreadyExist):
-            if not self.text and text_func:
-                self.text = text_func()
-            return self.question(text=self.text,
-                                  default=self.default,
-                                  **kwargs)
-
-    def validate(self, value):
+            text = self.text
+            if not text and text_func:
+                text = text_func()
+            return self.question(text=text,
+                                 default=self.default,
+                                 validation_func=validation_func,
+                                 **kwargs)
+
+    def validate(self, value, validation_func=None):
         if not value and self.default:
             value = self.default
 
         if self.required and not value:
             raise ValidationError('Field is required.')
 
-        if self.validation_func is None:
+        if validation_func is None:
             return value
 
-        return self.validation_func(value)
+        return validation_func(value)
 
-    def question(self, text, default=None, 
+    def question(self, text, default=None, validation_func=None,
                  ext_func=None, ext_param={}):
         from presto.utils.utils import input
         output("%s:" % text)
@@ -66,10 +94,10 @@ class Field(object):
         while True:
             value = unicode(input()).strip()
             try:
-                value = self.validate(value)
+                value = self.validate(value, validation_func)
             except AlreadyExist, e:
-                self.output_func(e.messages)
-                should_rewrite = self.yesno()
+                output(e.messages)
+                should_rewrite = self.yesno(value)
                 if should_rewrite:
                     return value
                 else:
@@ -79,7 +107,7 @@ class Field(object):
                 continue
             return value
 
-    def yesno(self):
+    def yesno(self, value):
         from presto.utils.utils import input
         while True:
             output("Rewrite '%s'? (y/n)" % value)
@@ -98,17 +126,19 @@ class UrlField(CharField):
 
 
 class ChoiceField(CharField):
+    interned = True
+
     def __init__(self, value=None, required=True,
                  text='Please input', default='', choices=(),
                  error_message=None):
-        super(ChoiceField, self).__init__(value, required, text, 
+        super(ChoiceField, self).__init__(value, required, text,
                                           default)
         self.choices = choices
         self.error_message = error_message or \
                 'Please specify valid choice: %s' % str(self.choices)
 
-    def validate(self, value):
-        value = super(ChoiceField, self).validate(value)
+    def validate(self, value, validation_func=None):
+        value = super(ChoiceField, self).validate(value, validation_func)
         if not value in self.choices:
             raise ValidationError(self.error_message)
         return value
@@ -121,27 +151,14 @@ class DomainField(CharField):
 class MultipleObjectsField(Field):
     DEFAULT_VALUE = []
 
-    def set_value(self, value, parent=None):
-        res = []
-        self.parent = parent
-        for obj_dict in value or self.DEFAULT_VALUE:
-            obj = self.model()
-            obj.from_dict(obj_dict)
-            obj.parent = self
-            res.append(obj)
-        self._val = res
-
-    def get_value(self):
-        if not hasattr(self, '_val'):
-            return None
-
-        return self._val
-
-    value = property(get_value, set_value)
     def __init__(self, model):
         self.model = model
         super(MultipleObjectsField, self).__init__()
 
+    def to_python(self, value, parent=None):
+        build = self.model.from_data
+        return [build(obj_dict, parent) for obj_dict in value or ()]
+
 
 class FormField(Field):
     pass
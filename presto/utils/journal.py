@@ -0,0 +1,192 @@
+"""
+Locked, journaled writes of the configuration file.
+
+Changes are appended to a journal file next to the configuration and
+replayed on load. Every change puts an object into a collection, replacing
+the object with the same name, so replaying a change twice is harmless.
+When the journal grows, it is compacted into the configuration file, which
+is always replaced atomically.
+"""
+import os
+import fcntl
+import tempfile
+from contextlib import contextmanager
+import simplejson as json
+
+from presto.utils.snapshot import load_snapshot, write_snapshot
+
+
+JOURNAL_SUFFIX = '.journal'
+LOCK_SUFFIX = '.lock'
+COMPACT_THRESHOLD = 64
+
+
+def journal_path(file_name):
+    return file_name + JOURNAL_SUFFIX
+
+
+@contextmanager
+def file_lock(file_name, shared=False):
+    '''
+    Holds a lock on `file_name` for the duration of the block.
+
+    :param file_name: path to the configuration file.
+    :param shared: take a shared (read) lock instead of an exclusive one.
+    '''
+    fd = os.open(file_name + LOCK_SUFFIX, os.O_RDWR | os.O_CREAT, 0600)
+    try:
+        fcntl.flock(fd, fcntl.LOCK_SH if shared else fcntl.LOCK_EX)
+        yield
+    finally:
+        os.close(fd)
+
+
+def make_change(path, value):
+    '''
+    Returns a change that puts `value` into the collection at `path`.
+
+    :param path: alternating collection names and object names that lead
+                 to the collection, e.g. ``['providers', 'odesk', 'apps']``.
+    :param value: dictionary of the object, must have a `name`.
+    '''
+    return {'path': list(path), 'value': value}
+
+
+def apply_change(data, change):
+    '''
+    Applies `change` to the configuration dictionary `data`.
+    '''
+    path = change['path']
+    node = data
+    for i in range(0, len(path) - 1, 2):
+        collection, name = path[i], path[i + 1]
+        for item in node.get(collection) or ():
+            if item.get('name') == name:
+                node = item
+                break
+        else:
+            return
+
+    value = change['value']
+    items = node.get(path[-1])
+    if items is None:
+        items = node[path[-1]] = []
+    for i, item in enumerate(items):
+        if item.get('name') == value.get('name'):
+            items[i] = value
+            break
+    else:
+        items.append(value)
+
+
+def get_change_key(change):
+    '''
+    Returns what `change` puts: the collection path and the object name.
+    '''
+    return tuple(change['path']), change['value'].get('name')
+
+
+def get_file_id(file_name):
+    '''
+    Returns what tells apart versions of `file_name`, None if it does not
+    exist. The file is always replaced by a rename, so the inode changes.
+    '''
+    try:
+        stat = os.stat(file_name)
+    except OSError:
+        return None
+    return stat.st_ino, stat.st_mtime, stat.st_size
+
+
+def read_journal_from(file_name, offset=0):
+    '''
+    Returns ``(changes, end)``: the changes journaled for `file_name` after
+    byte `offset` of the journal and the size of the journal. A torn
+    record, left by an interrupted write, is ignored.
+    '''
+    try:
+        with open(journal_path(file_name), 'r') as f:
+            f.seek(offset)
+            content = f.read()
+    except IOError:
+        return [], 0
+
+    changes = []
+    for line in content.splitlines():
+        try:
+            changes.append(json.loads(line))
+        except ValueError:
+            continue
+    return changes, offset + len(content)
+
+
+def read_journal(file_name):
+    '''
+    Returns the list of changes journaled for `file_name`.
+    '''
+    return read_journal_from(file_name)[0]
+
+
+def append_journal(file_name, changes):
+    '''
+    Appends `changes` to the journal of `file_name`. Must be called with
+    the exclusive lock held. Returns the number of records in the journal.
+    '''
+    path = journal_path(file_name)
+    fd = os.open(path, os.O_RDWR | os.O_APPEND | os.O_CREAT, 0600)
+    try:
+        size = os.fstat(fd).st_size
+        records = ''.join(json.dumps(change) + '\n' for change in changes)
+        if size:
+            os.lseek(fd, -1, os.SEEK_END)
+            if os.read(fd, 1) != '\n':
+                records = '\n' + records
+        os.write(fd, records)
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+    with open(path, 'r') as f:
+        return sum(1 for line in f)
+
+
+def dump_config(data):
+    cfg_json = json.dumps(data, sort_keys=True, indent=4 * ' ')
+    return '\n'.join([l.rstrip() for l in cfg_json.splitlines()])
+
+
+def write_config(file_name, data):
+    '''
+    Atomically replaces `file_name` with `data` and drops its journal.
+    Must be called with the exclusive lock held.
+    '''
+    cfg_json = dump_config(data)
+    fd, tmp_path = tempfile.mkstemp(prefix=os.path.basename(file_name),
+                                    dir=os.path.dirname(file_name) or '.')
+    try:
+        with os.fdopen(fd, 'w') as f:
+            f.write(cfg_json)
+            f.flush()
+            os.fsync(f.fileno())
+        os.rename(tmp_path, file_name)
+    except:
+        os.unlink(tmp_path)
+        raise
+
+    if os.path.exists(journal_path(file_name)):
+        os.unlink(journal_path(file_name))
+    write_snapshot(file_name, data, content=cfg_json)
+
+
+def compact(file_name):
+    '''
+    Merges the journal of `file_name` into the file. Must be called with
+    the exclusive lock held.
+    '''
+    data = load_snapshot(file_name)
+    if data is None:
+        with open(file_name, 'r') as f:
+            data = json.loads(f.read())
+    for change in read_journal(file_name):
+        apply_change(data, change)
+    write_config(file_name, data)
@@ -0,0 +1,493 @@
+"""
+Incremental JSON tokenizer and pretty-printer.
+
+The tokenizer takes the body in chunks of any size and returns tokens as
+soon as they are complete, keeping only the unfinished token between
+chunks. A string that spans chunks is scanned once, chunk by chunk. Tokens
+are the source text, strings are not decoded, so formatting a document
+never builds Python objects and runs in memory bounded by the chunk size
+and the longest string in the document. The tokenizer checks the grammar
+as it goes, so a malformed document raises `JSONStreamError` instead of
+being rewritten into another one.
+
+`JsonSelector` picks values matching a path expression out of the token
+stream, so only the selected values are ever written.
+"""
+import re
+import simplejson as json
+
+from presto.utils.exceptions import JSONStreamError
+
+
+STRING, NUMBER, LITERAL = 's', 'n', 'l'
+OPEN = '{['
+CLOSE = '}]'
+
+# Numbers may end with an unfinished fraction or exponent, so a number
+# split between chunks is not taken for a shorter one; NUMBER_RE checks a
+# finished one. The last group catches anything else.
+TOKEN_RE = re.compile(r'''[ \t\r\n]*(?:
+    ([{}\[\]:,])|
+    ("(?:[^"\\]|\\.)*")|
+    (-?(?:0|[1-9][0-9]*)(?:\.[0-9]*)?(?:[eE][+-]?[0-9]*)?)|
+    (true|false|null)|
+    ([^ \t\r\n]))''', re.VERBOSE | re.DOTALL)
+NUMBER_RE = re.compile(r'-?(?:0|[1-9][0-9]*)(?:\.[0-9]+)?'
+                       r'(?:[eE][+-]?[0-9]+)?$')
+# The rest of a string up to its closing quote, or up to the end of the
+# chunk (possibly before a lone backslash).
+STRING_BODY_RE = re.compile(r'(?:[^"\\]|\\.)*', re.DOTALL)
+PARTIAL_RE = re.compile(r'(?:"|-$|t(?:r(?:u)?)?$|f(?:a(?:l(?:s)?)?)?$|'
+                        r'n(?:u(?:l)?)?$)')
+PATH_RE = re.compile(r'''(?:
+    \.?(?:(\*)|([^.\[\]'"*]+))|
+    \[(?:(\*)|([0-9]+)|'([^']*)'|"([^"]*)")\])''', re.VERBOSE)
+DIGITS = '0123456789'
+KINDS = (None, None, STRING, NUMBER, LITERAL)
+SCALARS = (STRING, NUMBER, LITERAL)
+
+# Grammar states: what the next token may be.
+VALUE, FIRST_VALUE, KEY, FIRST_KEY, COLON, AFTER = range(6)
+
+BLUE = '\033[34m'
+YELLOW = '\033[1;33m'
+RED = '\033[31m'
+GREEN = '\033[32m'
+RESET = '\033[0m'
+
+
+class Tokenizer(object):
+    '''
+    Splits a JSON byte stream into ``(kind, text)`` tokens. `kind` is the
+    punctuation character itself or one of `STRING`, `NUMBER`, `LITERAL`.
+    Several top-level values (e.g. NDJSON) may follow each other.
+    '''
+    def __init__(self):
+        self.buffer = ''
+        # Stream offset of the start of `buffer` or of the open string.
+        self.offset = 0
+        # Chunks of a string that is not closed yet, and whether the last
+        # one ends with a backslash.
+        self.string = None
+        self.escaped = 0
+        # One item per open container: True for objects.
+        self.stack = []
+        self.state = VALUE
+
+    def error(self, offset, text):
+        raise JSONStreamError("Invalid JSON at byte %d: %r" % (offset,
+                                                               text[:20]))
+
+    def accept(self, kind, text, offset):
+        '''
+        Checks that a token of `kind` may come next and moves on to the
+        next grammar state.
+        '''
+        state = self.state
+        stack = self.stack
+        if state == AFTER:
+            if kind == ',':
+                self.state = KEY if stack[-1] else VALUE
+                return
+            if kind not in CLOSE or (kind == '}') != stack[-1]:
+                self.error(offset, text)
+        elif state == COLON:
+            if kind != ':':
+                self.error(offset, text)
+            self.state = VALUE
+            return
+        elif state == KEY or state == FIRST_KEY:
+            if kind == STRING:
+                self.state = COLON
+                return
+            if kind != '}' or state != FIRST_KEY:
+                self.error(offset, text)
+        elif kind in OPEN:
+            stack.append(kind == '{')
+            self.state = FIRST_KEY if kind == '{' else FIRST_VALUE
+            return
+        elif kind in SCALARS:
+            self.state = AFTER if stack else VALUE
+            return
+        elif kind != ']' or state != FIRST_VALUE:
+            self.error(offset, text)
+
+        # A container is closed.
+        stack.pop()
+        self.state = AFTER if stack else VALUE
+
+    def feed(self, data, final=False):
+        '''
+        Returns the tokens completed by `data`.
+
+        :param final: `data` is the end of the stream.
+        '''
+        tokens = []
+        append = tokens.append
+        if self.string is not None:
+            data = self.feed_string(data, final, tokens)
+            if data is None:
+                return tokens
+
+        buf = self.buffer + data if self.buffer else data
+        end = len(buf)
+        pos = 0
+        accept = self.accept
+        for m in TOKEN_RE.finditer(buf):
+            index = m.lastindex
+            start = m.start(index)
+            if index == 5:
+                if final or PARTIAL_RE.match(buf, start) is None:
+                    self.error(self.offset + start, buf[start:])
+                pos = start
+                if buf[start] == '"':
+                    self.open_string(buf[start:])
+                    pos = end
+                break
+            if index == 3 and m.end() == end and not final:
+                # The number may continue in the next chunk.
+                pos = start
+                break
+            kind = buf[start] if index == 1 else KINDS[index]
+            text = m.group(index)
+            if index == 3 and ('.' in text or text[-1] not in DIGITS) and \
+                    NUMBER_RE.match(text) is None:
+                self.error(self.offset + start, text)
+            accept(kind, text, self.offset + start)
+            append((kind, text))
+            pos = m.end()
+
+        if self.string is not None:
+            self.offset += pos - len(self.string[0])
+            self.buffer = ''
+        else:
+            self.offset += pos
+            self.buffer = buf[pos:] if pos < end else ''
+        if final and (self.stack or self.state != VALUE):
+            raise JSONStreamError("Unexpected end of JSON.")
+        return tokens
+
+    def open_string(self, data):
+        '''
+        Keeps the start of a string that continues in the next chunk.
+        '''
+        end = STRING_BODY_RE.match(data, 1).end()
+        self.string = [data]
+        self.escaped = 1 if end < len(data) else 0
+
+    def feed_string(self, data, final, tokens):
+        '''
+        Scans `data` for the end of the open string. Returns the rest of
+        `data` after the string, None if the string goes on.
+        '''
+        end = STRING_BODY_RE.match(data, self.escaped).end() \
+                if len(data) > self.escaped else len(data)
+        if end < len(data) and data[end] == '"':
+            self.string.append(data[:end + 1])
+            text = ''.join(self.string)
+            self.string = None
+            self.escaped = 0
+            self.accept(STRING, text, self.offset)
+            tokens.append((STRING, text))
+            self.offset += len(text)
+            return data[end + 1:]
+
+        if final:
+            self.error(self.offset, self.string[0])
+        if data:
+            self.string.append(data)
+            self.escaped = 1 if end < len(data) else 0
+        return None
+
+    def close(self):
+        '''
+        Returns the last tokens. Raises `JSONStreamError` if the stream
+        ends inside a token or a container.
+        '''
+        return self.feed('', final=True)
+
+
+class JsonFormatter(object):
+    '''
+    Writes indented, optionally colorized, JSON to `out` while it is fed
+    with chunks of the source document. Several top-level values (e.g.
+    NDJSON) are written one after another.
+
+    :param out: file-like object.
+    :param colorize: use terminal colors.
+    :param indent: number of spaces per nesting level.
+    '''
+    def __init__(self, out, colorize=False, indent=4):
+        self.out = out
+        self.colorize = colorize
+        self.indent = ' ' * indent
+        self.tokenizer = Tokenizer()
+        # One item per open container: True for objects.
+        self.stack = []
+        self.expect_key = False
+        self.newline = False
+        self.started = False
+
+    def paint(self, text, color):
+        if self.colorize:
+            return color + text + RESET
+        return text
+
+    def feed(self, data):
+        self.write(self.tokenizer.feed(data))
+
+    def close(self):
+        self.write(self.tokenizer.close())
+        if self.stack:
+            raise JSONStreamError("Unexpected end of JSON.")
+        if self.started:
+            self.out.write('\n')
+
+    def write(self, tokens):
+        parts = []
+        append = parts.append
+        stack = self.stack
+        for kind, text in tokens:
+            if kind in CLOSE:
+                if not stack or stack.pop() != (kind == '}'):
+                    raise JSONStreamError("Unexpected '%s'." % kind)
+                if not self.newline:
+                    append('\n' + self.indent * len(stack))
+                self.newline = False
+                self.expect_key = False
+                append(self.paint(text, BLUE))
+                continue
+            if kind == ',':
+                append(',')
+                self.newline = True
+                self.expect_key = bool(stack) and stack[-1]
+                continue
+            if kind == ':':
+                append(': ')
+                self.expect_key = False
+                continue
+
+            if self.newline:
+                append('\n' + self.indent * len(stack))
+                self.newline = False
+            elif not stack and self.started:
+                append('\n')
+            self.started = True
+
+            if kind in OPEN:
+                append(self.paint(text, BLUE))
+                stack.append(kind == '{')
+                self.newline = True
+                self.expect_key = kind == '{'
+            elif self.expect_key:
+                append(self.paint(text, YELLOW))
+            elif kind == STRING:
+                append(self.paint(text, GREEN))
+            elif kind == NUMBER or text != 'null':
+                append(self.paint(text, RED))
+            else:
+                append(text)
+        if parts:
+            self.out.write(''.join(parts))
+
+
+def format_json(chunks, out, colorize=False, indent=4):
+    '''
+    Pretty-prints the JSON document read from the `chunks` iterable.
+    '''
+    formatter = JsonFormatter(out, colorize, indent)
+    for chunk in chunks:
+        formatter.feed(chunk)
+    formatter.close()
+
+
+class JsonLines(object):
+    '''
+    Writes every top-level value of the token stream as compact JSON on
+    its own line.
+    '''
+    def __init__(self, out):
+        self.out = out
+        self.depth = 0
+
+    def write(self, tokens):
+        parts = []
+        append = parts.append
+        for kind, text in tokens:
+            append(text)
+            if kind in OPEN:
+                self.depth += 1
+                continue
+            if kind in CLOSE:
+                self.depth -= 1
+            if not self.depth:
+                append('\n')
+        if parts:
+            self.out.write(''.join(parts))
+
+    def close(self):
+        pass
+
+
+class JsonArray(object):
+    '''
+    Passes the top-level values of the token stream to `writer` as the
+    elements of one array.
+    '''
+    def __init__(self, writer):
+        self.writer = writer
+        self.depth = 0
+        self.count = 0
+
+    def write(self, tokens):
+        result = []
+        append = result.append
+        for token in tokens:
+            if not self.depth:
+                append(('[', '[') if not self.count else (',', ','))
+                self.count += 1
+            kind = token[0]
+            if kind in OPEN:
+                self.depth += 1
+            elif kind in CLOSE:
+                self.depth -= 1
+            append(token)
+        self.writer.write(result)
+
+    def close(self):
+        tokens = [(']', ']')]
+        if not self.count:
+            tokens.insert(0, ('[', '['))
+        self.writer.write(tokens)
+        self.writer.close()
+
+
+WILDCARD = '*'
+
+
+def parse_path(expr):
+    '''
+    Parses a path expression like ``$.items[*].id`` into a list of steps.
+    A step is `WILDCARD`, an array index or an object key. Keys are given
+    as ``.name`` or ``['name']``, ``$`` is the whole document.
+    '''
+    if isinstance(expr, unicode):
+        expr = expr.encode('utf-8')
+    pos = 1 if expr.startswith('$') else 0
+    steps = []
+    while pos < len(expr):
+        m = PATH_RE.match(expr, pos)
+        if m is None or m.end() == pos:
+            raise JSONStreamError("Invalid path expression: %r" % expr)
+        index = m.lastindex
+        if index in (1, 3):
+            steps.append(WILDCARD)
+        elif index == 4:
+            steps.append(int(m.group(4)))
+        else:
+            steps.append(m.group(index))
+        pos = m.end()
+    return steps
+
+
+def decode_key(text):
+    if '\\' in text:
+        return json.loads(text).encode('utf-8')
+    return text[1:-1]
+
+
+class JsonSelector(object):
+    '''
+    Returns the tokens of values that match a path expression while it is
+    fed with chunks of the document. Subtrees that can not match are only
+    counted, not inspected.
+
+    :param path: path expression, see `parse_path`, or a list of steps.
+    '''
+    def __init__(self, path):
+        if isinstance(path, basestring):
+            path = parse_path(path)
+        self.steps = path
+        self.tokenizer = Tokenizer()
+        # One [is_object, key or index] item per open container on the
+        # matching path.
+        self.stack = []
+        # Depth of the matched value being copied, or of the skipped
+        # subtree.
+        self.capture = 0
+        self.skip = 0
+
+    def feed(self, data):
+        return self.select(self.tokenizer.feed(data))
+
+    def close(self):
+        return self.select(self.tokenizer.close())
+
+    def select(self, tokens):
+        selected = []
+        append = selected.append
+        stack = self.stack
+        steps = self.steps
+        for token in tokens:
+            kind = token[0]
+            if self.capture:
+                append(token)
+                if kind in OPEN:
+                    self.capture += 1
+                elif kind in CLOSE:
+                    self.capture -= 1
+                continue
+            if self.skip:
+                if kind in OPEN:
+                    self.skip += 1
+                elif kind in CLOSE:
+                    self.skip -= 1
+                continue
+
+            if kind == ':':
+                continue
+            if kind == ',':
+                frame = stack[-1]
+                if frame[0]:
+                    frame[1] = None
+                else:
+                    frame[1] += 1
+                continue
+            if kind in CLOSE:
+                stack.pop()
+                continue
+            if stack:
+                frame = stack[-1]
+                if frame[0] and frame[1] is None:
+                    frame[1] = decode_key(token[1])
+                    continue
+                step = steps[len(stack) - 1]
+                if step is not WILDCARD and step != frame[1]:
+                    if kind in OPEN:
+                        self.skip = 1
+                    continue
+
+            if len(stack) == len(steps):
+                append(token)
+                if kind in OPEN:
+                    self.capture = 1
+            elif kind in OPEN:
+                stack.append([kind == '{', None if kind == '{' else 0])
+        return selected
+
+
+def select_json(chunks, out, path, colorize=False, pretty=False):
+    '''
+    Writes values of the JSON document read from the `chunks` iterable
+    that match `path`. Every value is written on its own line, or
+    pretty-printed if `colorize` or `pretty` is set.
+    '''
+    selector = JsonSelector(path)
+    if colorize or pretty:
+        writer = JsonFormatter(out, colorize)
+    else:
+        writer = JsonLines(out)
+    for chunk in chunks:
+        writer.write(selector.feed(chunk))
+    writer.write(selector.close())
+    writer.close()
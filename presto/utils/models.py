@@ -1,4 +1,3 @@
-from copy import deepcopy
 import simplejson as json
 from presto.utils.fields import Field, MultipleObjectsField, FormField
 from presto.utils.exceptions import ValidationError
@@ -15,43 +14,100 @@ def get_declared_fields(bases, attrs):
     fields.sort(key=lambda x: x[1].creation_counter)
 
     for base in bases[::-1]:
-        if hasattr(base, 'declared_fields'):
-            fields = base.declared_fields.items() + fields
+        if hasattr(base, 'base_fields'):
+            fields = base.base_fields + fields
 
     return fields
 
 
 class DeclarativeFieldsMetaclass(type):
     """
-    Metaclass that converts Field attributes to a dictionary called
-    'base_fields', taking into account parent class 'base_fields' as well.
+    Metaclass that converts Field attributes to a list called 'base_fields',
+    taking into account parent class 'base_fields' as well.
+
+    Field values are stored in `__slots__` of the instances. Extra slots can
+    be declared with `__slots__`; a class attribute with the same name is
+    used as the initial value of the slot. The lists of stored fields and
+    the validation hooks of every field are computed once per class.
     """
     def __new__(cls, name, bases, attrs):
-        attrs['base_fields'] = get_declared_fields(bases, attrs)
-        return super(DeclarativeFieldsMetaclass,
-                     cls).__new__(cls, name, bases, attrs)
+        fields = get_declared_fields(bases, attrs)
+
+        inherited = set()
+        slot_defaults = {}
+        for base in bases[::-1]:
+            inherited.update(field_name for field_name, field \
+                             in getattr(base, 'base_fields', ()))
+            slot_defaults.update(getattr(base, 'slot_defaults', {}))
+
+        slots = list(attrs.get('__slots__', ()))
+        for slot in slots:
+            if slot in attrs:
+                slot_defaults[slot] = attrs.pop(slot)
+        slots += [field_name for field_name, field in fields
+                  if field_name not in inherited]
+
+        attrs['__slots__'] = tuple(slots)
+        attrs['base_fields'] = fields
+        attrs['slot_defaults'] = slot_defaults
+        new_class = super(DeclarativeFieldsMetaclass,
+                          cls).__new__(cls, name, bases, attrs)
+
+        new_class.stored_fields = [(field_name, field) \
+                for field_name, field in fields \
+                    if type(field) is not FormField]
+        new_class.initial_state = slot_defaults.items() + \
+                [(field_name, field.to_python(None)) \
+                    for field_name, field in fields \
+                        if type(field) is FormField]
+        new_class.clean_plan = [get_clean_plan(new_class, field_name, field) \
+                for field_name, field in fields \
+                    if type(field) is not MultipleObjectsField]
+        return new_class
+
+
+def get_clean_plan(model, name, field):
+    """
+    Returns names of the hooks used by `Model.clean` for field `name`.
+    """
+    def hook(template):
+        hook_name = template % name
+        return hook_name if hasattr(model, hook_name) else None
+
+    return (name, field, hook('validate_%s'), hook('get_text_%s'),
+            hook('get_extra_params_%s'))
 
 
 class Model(object):
     "A collection of Fields, plus their associated data."
     __metaclass__ = DeclarativeFieldsMetaclass
+    __slots__ = ('data', 'parent', 'cleaned_data', '_errors')
 
     def __init__(self, data=None, parent=None):
         self.data = data or {}
         self.parent = parent
 
-        self.fields = deepcopy(self.base_fields)
-        fields = dict(self.fields)
-        for name, item in self.data.iteritems():
-            if fields.has_key(name):
-                field = fields[name]
-                field.value = self.data.get(name, field.DEFAULT_VALUE)
-
-    def __getattr__(self, name):
-        fields = dict(self.fields)
-        if fields.has_key(name):
-            return fields[name].value
-        return  object.__getattribute__(self, name)
+        for name, value in self.initial_state:
+            setattr(self, name, value)
+        for name, field in self.stored_fields:
+            setattr(self, name, field.to_python(None, parent=self))
+        for name, field in self.base_fields:
+            if name in self.data:
+                setattr(self, name,
+                        field.to_python(self.data[name], parent=self))
+
+    @classmethod
+    def from_data(cls, dict, parent=None):
+        """
+        Builds an instance from a dictionary made by `to_dict`.
+        """
+        obj = cls.__new__(cls)
+        obj.data = None
+        obj.parent = parent
+        for name, value in cls.initial_state:
+            setattr(obj, name, value)
+        obj.from_dict(dict)
+        return obj
 
     def __unicode__(self):
         return "Data Model:" % self.data
@@ -73,22 +129,21 @@ class Model(object):
     def clean(self):
         self._errors = {}
         self.cleaned_data = {}
-        for name, field in self.fields:
-            if type(field) is MultipleObjectsField:
-                continue
-
+        for name, field, validate, get_text, get_extra_params \
+                in self.clean_plan:
             kwargs = {}
-            if hasattr(self, 'validate_%s' % name):
-                kwargs['validation_func'] = getattr(self, 'validate_%s' % name)
+            if validate:
+                kwargs['validation_func'] = getattr(self, validate)
 
-            if hasattr(self, 'get_text_%s' % name):
-                kwargs['text_func'] = getattr(self, 'get_text_%s' % name)
+            if get_text:
+                kwargs['text_func'] = getattr(self, get_text)
 
-            if hasattr(self, 'get_extra_params_%s' % name):
-                kwargs.update(getattr(self, 'get_extra_params_%s' % name)())
+            if get_extra_params:
+                kwargs.update(getattr(self, get_extra_params)())
 
             try:
-                self.cleaned_data[name] = field.clean(**kwargs)
+                self.cleaned_data[name] = field.clean(getattr(self, name),
+                                                      **kwargs)
             except ValidationError, exc:
                 self._errors[name] = exc.messages
 
@@ -96,11 +151,8 @@ class Model(object):
 
     def to_dict(self):
         dict = {}
-        for fieldname, field in self.fields:
-            if type(field) is FormField:
-                continue
-
-            value = field.value
+        for fieldname, field in self.stored_fields:
+            value = getattr(self, fieldname)
             if isinstance(value, (list, tuple)):
                 dict[fieldname] = [val.to_dict() for val in value]
             else:
@@ -108,12 +160,9 @@ class Model(object):
         return dict
 
     def from_dict(self, dict):
-        for fieldname, field in self.fields:
-            if type(field) is FormField:
-                continue
-
+        for fieldname, field in self.stored_fields:
             value = dict.get(fieldname, field.DEFAULT_VALUE)
-            field.set_value(value, parent=self)
+            setattr(self, fieldname, field.to_python(value, parent=self))
 
     def filter(self, fieldname, **kwargs):
         def apply_filters(item, **kwargs):
@@ -126,4 +175,4 @@ class Model(object):
         for item in items:
             if apply_filters(item, **kwargs):
                 return item
-        return None
\ No newline at end of file
+        return None
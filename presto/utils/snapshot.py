@@ -0,0 +1,92 @@
+"""
+Compiled binary snapshots of JSON configuration files.
+
+A snapshot is stored next to the JSON file and keeps the already parsed
+configuration in `marshal` format together with the mtime, size and SHA-1
+of the JSON it was built from.
+"""
+import os
+import sys
+import marshal
+import hashlib
+import tempfile
+
+
+SNAPSHOT_SUFFIX = '.snapshot'
+SNAPSHOT_MAGIC = 'presto-snapshot-1'
+
+
+def snapshot_path(file_name):
+    return file_name + SNAPSHOT_SUFFIX
+
+
+def file_digest(file_name):
+    digest = hashlib.sha1()
+    with open(file_name, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 16), ''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def load_snapshot(file_name):
+    '''
+    Returns parsed configuration of `file_name` from its snapshot or None
+    if there is no usable snapshot.
+
+    A snapshot is fresh when mtime and size of the JSON file match. If only
+    the mtime differs, the content hash is compared and the snapshot is
+    re-keyed when the content is unchanged.
+
+    :param file_name: path to the JSON configuration file.
+    '''
+    try:
+        stat = os.stat(file_name)
+        with open(snapshot_path(file_name), 'rb') as f:
+            magic, version, mtime, size, digest = marshal.load(f)
+            if magic != SNAPSHOT_MAGIC or version != sys.version_info[:2] \
+                    or size != stat.st_size:
+                return None
+            if mtime != stat.st_mtime and digest != file_digest(file_name):
+                return None
+            data = marshal.load(f)
+    except (IOError, OSError, EOFError, ValueError, TypeError):
+        return None
+
+    if mtime != stat.st_mtime:
+        write_snapshot(file_name, data, digest=digest)
+    return data
+
+
+def write_snapshot(file_name, data, content=None, digest=None):
+    '''
+    Stores `data` as a snapshot of `file_name`. Errors are ignored, the
+    snapshot is only a cache.
+
+    :param file_name: path to the JSON configuration file.
+    :param data: parsed configuration.
+    :param content: raw JSON content of the file, used for hashing.
+    :param digest: precomputed SHA-1 of the file content.
+    '''
+    path = snapshot_path(file_name)
+    try:
+        if digest is None:
+            if content is None:
+                digest = file_digest(file_name)
+            else:
+                digest = hashlib.sha1(content).hexdigest()
+        stat = os.stat(file_name)
+        header = (SNAPSHOT_MAGIC, sys.version_info[:2],
+                  stat.st_mtime, stat.st_size, digest)
+
+        fd, tmp_path = tempfile.mkstemp(prefix=os.path.basename(path),
+                                        dir=os.path.dirname(path) or '.')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                marshal.dump(header, f)
+                marshal.dump(data, f)
+            os.rename(tmp_path, path)
+        except:
+            os.unlink(tmp_path)
+            raise
+    except (IOError, OSError, ValueError):
+        pass
@@ -1,6 +1,15 @@
 import functools
 
 
+def to_str(value):
+    '''
+    Returns `value` encoded in UTF-8 if it is unicode, otherwise as it is.
+    '''
+    if isinstance(value, unicode):
+        return value.encode('utf-8')
+    return value
+
+
 def output(*args):
     for arg in args:
         print arg
@@ -12,10 +21,12 @@ def input():
 
 def need_providers(func, *args, **kwargs):
     @functools.wraps(func)
-    def _func(*args, **kwargs):
-        from presto.models import config
+    def _func(self, *args, **kwargs):
+        config = getattr(self, 'config', None)
+        if config is None:
+            from presto.models import config
         if not config.providers:
             from presto.utils.exceptions import PrestoCfgException
             raise PrestoCfgException("Add providers please.")
-        return func(*args, **kwargs)
+        return func(self, *args, **kwargs)
     return _func
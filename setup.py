@@ -13,7 +13,7 @@ setup(name='pRESTo',
       package_data = { 
                    'presto': [ 'presto.cfg'],
                    },
-      install_requires = ['docopt', 'json_tools', 'oauthlib', ],
+      install_requires = ['docopt', 'oauthlib', 'simplejson', ],
       classifiers=['Development Status :: 1 - Alpha',
                    'Environment :: Web Environment',
                    'Intended Audience :: Developers',